@@ -1,291 +1,1142 @@
 import socket
-import pyaudio
+import selectors
 import threading
-import struct
-import collections
 import time
 import os
+import math
+
+import numpy as np
+
+from jitter_buffer import JitterBuffer
+from concealment import Concealer
+import codec
+import fec
+import relay
+from ring_buffer import FrameRing, PacketRing, FramedReader
+from mixer import StreamMixer
+from dsp import GainRamp, LevelMeter
+from drift import DriftEstimator, FractionalResampler
+from metrics import Histogram, ThreadCpu, LATENCY_BUCKETS_MS, DURATION_BUCKETS_MS
+import output_sinks
+from packet_capture import PacketCapture
+from device_registry import enumerate_output_devices
+
+import crypto
+
+
+class SenderStream:
+    """
+    Everything the receiver tracks for one sender: sequence/loss counters,
+    its own jitter buffer and Opus decoder, and the cipher its packets are
+    decrypted with. One exists per phone currently streaming to us.
+    """
+
+    def __init__(self, stream_id, addr, protocol, receiver, key=0):
+        self.id = stream_id
+        self.key = key  # Small number naming this stream in binary telemetry
+        self.addr = addr
+        self.protocol = protocol
+        self.receiver = receiver
+        self.cipher = receiver.cipher
+        self.joined = receiver.clock()
+        self.last_seen = self.joined
+
+        self.jitter_buffer = receiver._make_jitter_buffer(protocol)
+        # Re-chunks this sender's packets into the mixer's block size
+        self.output_ring = FrameRing(receiver.RATE * receiver.frame_bytes, receiver.frame_bytes)
+        self.ramp = GainRamp(receiver.CHANNELS, receiver.RATE)  # Gain/mute, applied by the mixer
+        self.meter = LevelMeter(receiver.CHANNELS)  # Fed by the mixer when metering
+
+        # Clock skew: nudge this sender's playback rate so its buffer stays
+        # at the target instead of slowly filling or draining
+        self.drift = DriftEstimator()
+        # On a shared schedule (relay): steer the speaker's position onto
+        # the schedule instead; the error is smooth, so it can be stiffer
+        self.schedule_drift = DriftEstimator(kp=200.0, ki=0.02, max_ppm=5000.0)
+        self.resampler = None
+        if receiver.drift_compensation:
+            self.resampler = FractionalResampler(receiver.CHANNELS)
+
+        self.last_sequence = -1
+        self.total_packets_received = 0
+        self.packets_lost = 0
+        self.skipped = 0  # Frames the TCP reader skipped on purpose; not losses
+        # XOR parity FEC, used only if the sender sends parity packets
+        self.fec = fec.FecDecoder()
+        self._fec_group = 0
+        self.min_delay_ms = receiver.min_delay_ms()  # Jitter buffer floor, unclamped
+        # Arrival (PC wall clock) minus the sender's timestamp. Only an
+        # absolute latency when both clocks are NTP-synced; the spread is
+        # meaningful either way.
+        self.network_ms = Histogram(LATENCY_BUCKETS_MS)
+
+        # Multi-room sync (see relay.py): schedule() -> (base_ms, delay_ms)
+        # or None, applied to the jitter buffer as it changes
+        self.schedule = None
+        self._applied_schedule = None
+        self.clock_sync = None  # relay.ClockClient, when this sender is a relay
+        self._aligned = False  # Playout start trimmed onto the schedule
+        self._scratch = None
+
+        # Codec: the header flags say per packet whether it is PCM or Opus
+        self.opus_decoder = None
+        self.unsupported_packets = 0
+        self.codec = "pcm"
+
+    @property
+    def gain(self):
+        return self.ramp.gain
+
+    @gain.setter
+    def gain(self, value):
+        # Ramped in by the mixer over a few ms, so changes never click
+        self.ramp.gain = value
+
+    def set_schedule(self, schedule):
+        """Play on a shared timeline (schedule() -> (base_ms, delay_ms)), or adaptively with None."""
+        self.schedule = schedule
+        if schedule is None:
+            self._applied_schedule = None
+            self.jitter_buffer.set_schedule(None, None)
+
+    def close(self):
+        if self.clock_sync:
+            self.clock_sync.stop()
+            self.clock_sync = None
+
+    def handle_packet(self, seq, flags, timestamp, audio_data):
+        self.last_seen = self.receiver.clock()
+        if flags & codec.FLAG_RELAY and self.clock_sync is None and self.schedule is None:
+            # A relay's timestamps are on its clock: learn the offset to it
+            self.clock_sync = relay.ClockClient(self.addr[0], self.receiver.clock)
+            self.clock_sync.start()
+            self.schedule = self.clock_sync.schedule
+        if self.schedule:
+            schedule = self.schedule()
+            if schedule and schedule != self._applied_schedule:
+                base_ms, delay_ms = schedule
+                # The schedule is for when audio is heard; packets leave the
+                # jitter buffer about one output period plus the device
+                # latency before that
+                output_ms = self._device_ms() + 500.0 * self.receiver.CHUNK / self.receiver.RATE
+                self.jitter_buffer.set_schedule(base_ms, max(0.0, delay_ms - output_ms))
+                self._applied_schedule = schedule
+        if flags & codec.FLAG_FEC:
+            # Parity, not audio: may rebuild one lost packet of its group
+            recovered = self.fec.on_parity(seq, timestamp, audio_data)
+            if self.fec.group != self._fec_group:
+                self._fec_group = self.fec.group
+                self._cover_fec_delay(audio_data)
+            for packet in recovered:
+                self._accept(*packet, recovered=True)
+            return
+        if self._applied_schedule:
+            # Relayed timestamps are on the relay's monotonic clock (ours
+            # once shifted by the schedule base), not the phone's wall clock
+            transit = self.receiver.clock() * 1000.0 - timestamp - self._applied_schedule[0]
+            self.network_ms.observe(max(0.0, transit))
+        elif not flags & codec.FLAG_RELAY:
+            self.network_ms.observe(max(0.0, time.time() * 1000.0 - timestamp))
+        if not self.fec.active:
+            self._accept(seq, flags, timestamp, audio_data)
+            return
+        recovered = self.fec.on_data(seq, flags, timestamp, audio_data)
+        if recovered is None:
+            # Only delayed, and already rebuilt from the parity
+            with self.receiver.counters_lock:
+                self.total_packets_received += 1
+                self.receiver.total_packets_received += 1
+            return
+        self._accept(seq, flags, timestamp, audio_data)
+        for packet in recovered:
+            self._accept(*packet, recovered=True)
+
+    def _cover_fec_delay(self, parity):
+        # A packet lost at the start of a group can only be rebuilt once the
+        # parity after the last one is in; buffer at least that long
+        jb = self.jitter_buffer
+        last = self._fec_group - 1
+        last_offset = fec.MEMBER.unpack_from(parity, 1 + last * fec.MEMBER.size)[2]
+        self.min_delay_ms = max(self.receiver.min_delay_ms(), last_offset + jb.headroom_ms)
+        jb.set_min_delay(self.min_delay_ms)
+
+    def set_buffer_ms(self, buffer_ms):
+        # In place: whatever is buffered beyond a smaller ceiling is trimmed
+        self.jitter_buffer.set_max_delay(buffer_ms)
+        self.jitter_buffer.set_min_delay(self.min_delay_ms)
+
+    def _accept(self, seq, flags, timestamp, audio_data, recovered=False):
+        frames = None
+        if flags & codec.FLAG_OPUS:
+            frames = self._decode_opus(seq, audio_data)
+            if frames is None:
+                return
+
+        # Basic packet loss tracking
+        with self.receiver.counters_lock:
+            if self.last_sequence != -1:
+                diff = seq - self.last_sequence
+                if diff > 1:
+                    gap = diff - 1
+                    if self.skipped:
+                        credit = min(gap, self.skipped)
+                        self.skipped -= credit
+                        gap -= credit
+                    self.packets_lost += gap
+                    self.receiver.packets_lost += gap
+                    self.receiver.packets_missed += gap
+                elif diff < 0 and diff > -1000:
+                    # Reordered: a packet we counted as lost turned up after all
+                    if self.packets_lost:
+                        self.packets_lost -= 1
+                        self.receiver.packets_lost -= 1
+                        self.receiver.packets_reordered += 1
+                    diff = 0
+
+            if self.last_sequence == -1 or diff != 0:
+                self.last_sequence = seq
+            if not recovered:
+                self.total_packets_received += 1
+                self.receiver.total_packets_received += 1
+
+        # Add to jitter buffer (reorders by seq, drops late/overflow itself)
+        if frames is None:
+            self.jitter_buffer.push(seq, timestamp, audio_data, measure=not recovered)
+        else:
+            for frame_seq, pcm in frames:
+                # A FEC-recovered predecessor carries our timestamp
+                # minus its own duration
+                ts = timestamp - (seq - frame_seq) * len(pcm) / self.jitter_buffer.bytes_per_ms
+                self.jitter_buffer.push(frame_seq, ts, pcm, measure=not recovered)
+
+    def _decode_opus(self, seq, payload):
+        if self.opus_decoder is None:
+            if not codec.opuslib:
+                self.unsupported_packets += 1
+                if self.unsupported_packets == 1:
+                    self.receiver._status(f"Opus stream from {self.id} but opuslib is not installed. Send PCM instead.")
+                return None
+            self.opus_decoder = codec.OpusDecoder(self.receiver.RATE, self.receiver.CHANNELS)
+            self.codec = "opus"
+            self.receiver._status(f"Opus stream detected from {self.id}")
+        frames = self.opus_decoder.decode(seq, payload)
+        return frames or None
+
+    def read_into(self, out, nbytes):
+        """
+        Output side (PortAudio thread): fill `out` with up to nbytes of this
+        sender's audio. Returns the number of bytes written.
+        """
+        ring = self.output_ring
+        jb = self.jitter_buffer
+        frame_bytes = ring.frame_bytes
+        frames = nbytes // frame_bytes
+        ratio = 1.0
+        need = nbytes
+        error = self._schedule_error() if self._applied_schedule else None
+        if self.resampler:
+            if error is not None:
+                ratio = self.schedule_drift.update(error, 0.0)
+            elif jb.playing:
+                occupancy_ms = (jb.buffered_ms
+                                + (ring.available() + self.resampler.buffered_frames() * frame_bytes)
+                                / jb.bytes_per_ms)
+                ratio = self.drift.update(occupancy_ms, jb.target_delay_ms)
+            need = self.resampler.frames_needed(frames, ratio) * frame_bytes
+
+        while ring.available() < need:
+            # The device needs this data now, so gaps get concealed
+            data = jb.pop(conceal_underrun=True)
+            if data is None:
+                break
+            if not ring.write(data):
+                break
+
+        if not jb.playing:
+            self._aligned = False
+        elif self._applied_schedule and not self._aligned:
+            self._align()
+
+        if self.resampler:
+            return self.resampler.process(ring, out, frames, ratio)
+        return ring.read_into(out, nbytes)
+
+    def _device_ms(self):
+        sink = self.receiver._primary
+        return sink.latency() * 1000.0 if sink else 0.0
+
+    def _queued_ms(self):
+        # Played out of the jitter buffer but not yet heard
+        ms = self.output_ring.available() / self.jitter_buffer.bytes_per_ms
+        if self.resampler:
+            ms += self.resampler.buffered_frames() * self.output_ring.frame_bytes / self.jitter_buffer.bytes_per_ms
+        return ms + self._device_ms()
+
+    def _schedule_error(self):
+        return self.jitter_buffer.schedule_error_ms(self.receiver.clock() * 1000.0, self._queued_ms(),
+                                                    self._applied_schedule[1])
+
+    def _align(self):
+        # Playout starts at block granularity, so it is late by up to a
+        # block plus the device latency: drop that much from the head once,
+        # and let the rate steering hold it from there
+        self._aligned = True
+        error = self._schedule_error()
+        if error is None or error <= 0.5:
+            return
+        ring = self.output_ring
+        nbytes = min(ring.available(), int(error * self.jitter_buffer.bytes_per_ms))
+        nbytes -= nbytes % ring.frame_bytes
+        if nbytes <= 0:
+            return
+        if self._scratch is None or len(self._scratch) < nbytes:
+            self._scratch = bytearray(nbytes)
+        ring.read_into(memoryview(self._scratch), nbytes)
+
+    def playout_ms(self):
+        # Audio queued between the network and the device for this sender
+        ms = self.jitter_buffer.buffered_ms + self.output_ring.available() / self.jitter_buffer.bytes_per_ms
+        if self.resampler:
+            ms += self.resampler.buffered_frames() * self.output_ring.frame_bytes / self.jitter_buffer.bytes_per_ms
+        return ms
+
+    def get_metrics(self, device_ms):
+        network_p50 = self.network_ms.percentile(0.5)
+        playout = self.playout_ms()
+        return {
+            "id": self.id,
+            "gauges": {
+                "playout_ms": round(playout, 1),
+                # End to end: typical network transit + our buffering + device
+                "latency_ms": round(network_p50 + playout + device_ms, 1) if network_p50 is not None else None,
+                "jitter_ms": round(self.jitter_buffer.jitter_ms, 2),
+                "target_delay_ms": round(self.jitter_buffer.target_delay_ms, 1),
+                "drift_ppm": round(self.drift.drift_ppm, 1) if self.resampler else None,
+            },
+            "histograms": {"network_ms": self.network_ms.snapshot()},
+        }
+
+    def get_stats(self):
+        stats = {
+            "id": self.id,
+            "key": self.key,
+            "protocol": self.protocol,
+            "gain": self.gain,
+            "muted": self.ramp.muted,
+            "received": self.total_packets_received,
+            "lost": self.packets_lost,
+            "queue": len(self.jitter_buffer),
+            "codec": self.codec,
+        }
+        stats.update(self.jitter_buffer.get_stats())
+        if self.resampler:
+            stats["drift_ppm"] = round(self.drift.drift_ppm, 1)
+        if self.opus_decoder:
+            stats["fec_recovered"] = self.opus_decoder.fec_recovered
+            stats["decode_errors"] = self.opus_decoder.errors
+        if self.fec.active:
+            stats["parity_recovered"] = self.fec.recovered - self.fec.duplicates
+        if self._applied_schedule:
+            # As smoothed by the rate control; samples taken here would
+            # saw-tooth with the output period
+            level = self.schedule_drift.level_ms
+            stats["sync_error_ms"] = round(level, 2) if level is not None else None
+            if self.clock_sync:
+                stats["clock_offset_ms"] = round(self.clock_sync.offset_ms, 3)
+                stats["clock_rtt_ms"] = round(self.clock_sync.rtt_ms, 3)
+        if self.unsupported_packets:
+            stats["unsupported"] = self.unsupported_packets
+        return stats
+
+
+class _TcpConnection:
+    # One non-blocking TCP sender: [Length 4 bytes] [Payload] frames
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.stream_id = f"{addr[0]}:{addr[1]}"
+        self.reader = FramedReader(sock)
+
+
+class _OutputHandoff:
+    """
+    Moves playback to a new sink without a gap. Once the new sink asks for
+    its first block it takes over rendering the mix, fading in, and passes
+    a copy of every block to the old sink, which plays them fading out and
+    is then closed.
+    """
+
+    def __init__(self, old, new, channels, rate, frame_bytes, crossfade_ms):
+        self.old = old
+        self.new = new
+        self.channels = channels
+        self.frame_bytes = frame_bytes
+        self.ring = FrameRing(rate * frame_bytes // 2, frame_bytes)  # 0.5 s of slack between devices
+        self.fade_frames = max(1, int(rate * crossfade_ms / 1000))
+        self.in_pos = 0  # Frames faded in / out so far
+        self.out_pos = 0
+        self.done = threading.Event()  # Set once the old sink has faded out
+
+    def _fade(self, out, nbytes, pos, rising):
+        frames = nbytes // self.frame_bytes
+        gains = (pos + np.arange(frames, dtype=np.float32)) / np.float32(self.fade_frames)
+        np.clip(gains, 0.0, 1.0, out=gains)
+        if not rising:
+            gains = 1.0 - gains
+        pcm = np.frombuffer(out, dtype=np.int16, count=frames * self.channels).reshape(frames, self.channels)
+        pcm[:] = pcm * gains[:, None]
+        return pos + frames
+
+    def render_new(self, out, nbytes):
+        # The old sink gets the block as mixed, before the fade-in
+        self.ring.write(out[:nbytes])
+        if self.in_pos < self.fade_frames:
+            self.in_pos = self._fade(out, nbytes, self.in_pos, rising=True)
+
+    def render_old(self, out, nbytes):
+        if self.out_pos >= self.fade_frames:
+            out[:nbytes] = bytes(nbytes)
+            self.done.set()
+            return 0
+        n = self.ring.read_into(out, nbytes)
+        if n < nbytes:
+            out[n:nbytes] = bytes(nbytes - n)
+        self.out_pos = self._fade(out, nbytes, self.out_pos, rising=False)
+        return n
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
 
 class AudioReceiver:
-    def __init__(self, port=50005, callback_status=None):
+    # Senders that go quiet for this long are dropped
+    STREAM_TIMEOUT = 5.0
+
+    def __init__(self, port=50005, callback_status=None, callback_event=None):
         self.port = port
         self.callback_status = callback_status
+        self.callback_event = callback_event  # (event_type, data) for stream join/leave
         self.running = False
-        self.socket = None
-        self.pyaudio_instance = pyaudio.PyAudio()
-        self.stream = None
-        
-        # Audio Config
-        self.FORMAT = pyaudio.paInt16
+        self.sink = None
+        # Output switching (see switch_output): every sink renders through
+        # _render_sink, and only the primary one consumes the mix
+        self._primary = None
+        self._handoff = None
+        self._output_lock = threading.Lock()
+
+        # Audio Config (Int16 interleaved)
         self.CHANNELS = 2
         self.RATE = 48000
         self.CHUNK = 1024 # Not strictly used for read, but for PyAudio buffer
-        
+
         # Buffer
-        # We use a deque as a jitter buffer
-        self.audio_queue = collections.deque() 
-        self.max_queue_size = 10 # Packets. ~10ms each typical. 10 * 10ms = 100ms buffer max.
-        
-        self.last_sequence = -1
+        # Adaptive jitter buffer per sender, scheduled by the sender timestamps.
+        # buffer_ms is the ceiling; the actual delay tracks measured jitter.
+        self.buffer_ms = 100
+
+        # Playback
+        # 'callback': PortAudio pulls fixed-size frames from a ring (default)
+        # 'blocking': legacy play thread doing blocking stream.write
+        self.playback = 'callback'
+        # Output sink specs, see output_sinks.make_sink (default: the device)
+        self.sinks = ["device"]
+        self.frame_bytes = self.CHANNELS * 2
+        self.output_underruns = 0
+        self._output_active = False
+        self._silence = bytes(self.CHUNK * self.frame_bytes)
+
+        # Instrumentation (see get_metrics)
+        self.cpu = ThreadCpu()
+        self.write_ms = Histogram(DURATION_BUCKETS_MS)     # Blocking stream.write
+        self.render_ms = Histogram(DURATION_BUCKETS_MS)    # Mixing one output block
+        self.drops = {"bad_header": 0, "bad_frame": 0, "stream_limit": 0, "tcp_skipped": 0}
+        # Resample each sender by a few ppm to follow its clock
+        self.drift_compensation = True
+
+        # Senders
+        # One selector thread serves every UDP/TCP sender on the port.
+        self.max_streams = 32
+        self.streams = {}  # stream_id -> SenderStream
+        self.streams_lock = threading.Lock()
+        self.active_stream = None  # The sender whose buffer stats are reported at top level
+        self._mix_streams = ()  # Immutable snapshot for the output thread
+        self.mixer = StreamMixer(channels=self.CHANNELS, rate=self.RATE)
+        self._next_stream_key = 0
+        self.sockets = []
+        self.tcp_connections = {}
+        self.cipher = None
+        self.decrypt_worker = None
+
+        # Receive arena: packets are received in place and queued as views.
+        # ~10s of PCM for one sender; grown as more senders join.
+        self.packet_ring = PacketRing(2 * 1024 * 1024)
+
+        # Totals across all senders, including ones that already left. The
+        # per-stream and total counters are updated from the receive thread
+        # and the decrypt worker, so every update holds counters_lock.
         self.total_packets_received = 0
-        self.packets_lost = 0
-        
-    def get_output_devices(self):
-        # Refresh PyAudio to seeing new devices/defaults
-        if not self.running and self.pyaudio_instance:
-             self.pyaudio_instance.terminate()
-        self.pyaudio_instance = pyaudio.PyAudio()
-
-        devices = []
-        info = self.pyaudio_instance.get_host_api_info_by_index(0)
-        numdevices = info.get('deviceCount')
-        for i in range(0, numdevices):
-            if (self.pyaudio_instance.get_device_info_by_host_api_device_index(0, i).get('maxOutputChannels')) > 0:
-                name = self.pyaudio_instance.get_device_info_by_host_api_device_index(0, i).get('name')
-                devices.append(f"{i}: {name}")
-        return devices
-
-    def start(self, device_index=None, protocol='udp', password=None):
+        self.packets_lost = 0  # Net: missed minus reordered
+        self.packets_missed = 0  # Gaps in seq, only ever grows
+        self.packets_reordered = 0  # Missed ones that turned up late
+        self.counters_lock = threading.Lock()
+
+        # Seconds, for arrival/playout timing; packet_capture.Replayer
+        # substitutes a virtual one for deterministic replays
+        self.clock = time.monotonic
+        # Optional packet capture (see start_capture)
+        self.capture = None
+        # Multi-room: forward the active sender to other receivers (see
+        # start_relay), or join the group a relay multicasts to
+        self.relay = None
+        self.multicast_group = None
+
+    def _status(self, message):
+        if self.callback_status:
+            self.callback_status(message)
+
+    def _event(self, event_type, data):
+        if self.callback_event:
+            self.callback_event(event_type, data)
+
+    def get_output_devices(self, refresh=False):
+        # Enumerates on the shared PortAudio engine; refresh re-initialises
+        # it to see new devices/defaults (only possible while not playing)
+        return [f"{d['index']}: {d['name']}" for d in enumerate_output_devices(refresh=refresh)]
+
+    def _make_decrypt_worker(self):
+        # Queued packets are views into the arena; a quarter of it leaves
+        # room for the TCP reader's budget and plaintext streams' buffers
+        return crypto.DecryptWorker(self._handle_plaintext, max_bytes=self.packet_ring.capacity // 4,
+                                    cpu=self.cpu)
+
+    def min_delay_ms(self):
+        # The output pulls a whole CHUNK at a time, so the buffer never
+        # targets less than one device period on top of jitter.
+        return 10 + 1000.0 * self.CHUNK / self.RATE
+
+    def _make_jitter_buffer(self, protocol):
+        # The same adaptive buffer for both transports, capped at buffer_ms.
+        # TCP already delivers in order, so it also holds at most 2 packets
+        # beyond what the delay target needs and never conceals gaps.
+        return JitterBuffer(
+            max_delay_ms=self.buffer_ms,
+            min_delay_ms=self.min_delay_ms(),
+            bytes_per_ms=self.RATE * self.CHANNELS * 2 / 1000,
+            max_packets=2 if protocol == 'tcp' else None,
+            # TCP never loses or reorders: a gap is frames we skipped, so
+            # play on from the next one instead of concealing
+            lossless=protocol == 'tcp',
+            concealer=Concealer(channels=self.CHANNELS, rate=self.RATE),
+            clock=self.clock
+        )
+
+    def start(self, device_index=None, protocol='udp', password=None, playback=None, sinks=None,
+              listen=True):
+        """
+        protocol: 'udp', 'tcp' or 'both' (both listen on the same port number).
+        sinks: output specs such as ["device", "file:session.wav"].
+        listen=False opens no sockets; packets come from a replay instead.
+        """
         if self.running:
             return
 
         self.protocol = protocol
-        
+        if playback:
+            self.playback = playback
+        if sinks:
+            self.sinks = list(sinks)
+
         # Setup Encryption if password provided
+        # (the key is derived once per password and cached across restarts)
         self.cipher = None
+        self.decrypt_worker = None
         if password and len(password) > 0:
-            salt = b"AudioStreamSalt" # Fixed salt for simplicity, or sync it. Ideally random but detailed protocol needed. For now fixed.
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-                backend=default_backend()
-            )
-            key = kdf.derive(password.encode())
-            self.cipher = AESGCM(key)
-            if self.callback_status:
-                self.callback_status("Encryption Enabled (AES-GCM-256)")
-        
-        try:
-            # Refresh PyAudio instance logic
-            if self.pyaudio_instance:
-                 self.pyaudio_instance.terminate()
-            self.pyaudio_instance = pyaudio.PyAudio()
+            self.cipher = crypto.make_cipher(password)
+            self.decrypt_worker = self._make_decrypt_worker()
+            self._status("Encryption Enabled (AES-GCM-256)")
 
-            if self.protocol == 'tcp':
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        try:
+            if listen and self.protocol in ('tcp', 'both'):
                 self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self.server_socket.bind(('0.0.0.0', self.port))
-                self.server_socket.listen(1)
-                self.server_socket.settimeout(1.0) # check running flag
-                self.socket = None # Client socket will be assigned later
-            else:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.socket.bind(('0.0.0.0', self.port))
-                self.socket.settimeout(1.0) 
+                self.server_socket.listen(self.max_streams)
+                self.server_socket.setblocking(False)
+                self.selector.register(self.server_socket, selectors.EVENT_READ, self._accept)
+                self.sockets.append(self.server_socket)
+            if listen and self.protocol in ('udp', 'both'):
+                self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.udp_socket.bind(('0.0.0.0', self.port))
+                if self.multicast_group:
+                    mreq = socket.inet_aton(self.multicast_group) + socket.inet_aton('0.0.0.0')
+                    self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+                self.udp_socket.setblocking(False)
+                self.selector.register(self.udp_socket, selectors.EVENT_READ, self._read_udp)
+                self.sockets.append(self.udp_socket)
 
         except Exception as e:
-            if self.callback_status:
-                self.callback_status(f"Error binding port {self.port}: {e}")
+            for s in self.sockets:
+                s.close()
+            self.sockets = []
+            self._status(f"Error binding port {self.port}: {e}")
             return
 
         self.running = True
-        
-        # Start Audio Stream
-        kwargs = {
-            'format': self.FORMAT,
-            'channels': self.CHANNELS,
-            'rate': self.RATE,
-            'output': True,
-            'frames_per_buffer': self.CHUNK
-        }
-        if device_index is not None:
-            kwargs['output_device_index'] = device_index
-            
-        self.stream = self.pyaudio_instance.open(**kwargs)
-        
+
+        # Start Audio Output
+        try:
+            self.sink = output_sinks.make_sink(self.sinks, device_index, self.playback,
+                                               write_ms=self.write_ms)
+            self._primary = self.sink
+            self.sink.start(self._sink_render(self.sink), self.RATE, self.CHANNELS, self.CHUNK)
+        except Exception as e:
+            self.running = False
+            for s in self.sockets:
+                s.close()
+            self.sockets = []
+            if self.sink:
+                self.sink.stop()
+            self.sink = None
+            self._status(f"Error opening audio output: {e}")
+            return
+
         # Threads
-        self.receive_thread = threading.Thread(target=self._receive_loop)
-        self.play_thread = threading.Thread(target=self._play_loop)
-        
-        self.receive_thread.start()
-        self.play_thread.start()
-        
-        if self.callback_status:
-            proto_str = "TCP" if self.protocol == 'tcp' else "UDP"
-            base_msg = f"Listening on port {self.port} ({proto_str})..."
-            if self.cipher:
-                base_msg += " [ENCRYPTED]"
-            self.callback_status(base_msg)
+        if self.decrypt_worker:
+            self.decrypt_worker.start()
+        if listen:
+            self.receive_thread = threading.Thread(target=self._receive_loop)
+            self.receive_thread.start()
+        else:
+            self.selector.close()
+
+        proto_str = {"tcp": "TCP", "udp": "UDP"}.get(self.protocol, "UDP+TCP")
+        base_msg = f"Listening on port {self.port} ({proto_str})..." if listen else "Replaying..."
+        if self.cipher:
+            base_msg += " [ENCRYPTED]"
+        self._status(base_msg)
 
     def stop(self):
         self.running = False
-        
-        # Close sockets
-        if self.protocol == 'tcp':
-            if getattr(self, 'server_socket', None):
-                try: self.server_socket.close() 
-                except: pass
-            if self.socket: # Client socket
-                try: self.socket.close()
-                except: pass
-        else:
-            if self.socket:
-                try: self.socket.close()
-                except: pass
-        
+        if self.decrypt_worker:
+            self.decrypt_worker.stop()
+        self.stop_capture()
+        self.stop_relay()
+
+        # Close sockets; the selector loop exits on its next wake-up
+        for s in self.sockets:
+            try: s.close()
+            except: pass
+        for conn in list(self.tcp_connections.values()):
+            try: conn.sock.close()
+            except: pass
+        self.sockets = []
+        self.tcp_connections = {}
+
         # Threads will join naturally via running check or exception
-        
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            
-        if self.pyaudio_instance:
-            self.pyaudio_instance.terminate()
-            
-        if self.callback_status:
-            self.callback_status("Stopped.")
 
-    def _recv_all(self, sock, count):
-        buf = b''
-        while count:
-            newbuf = sock.recv(count)
-            if not newbuf: return None
-            buf += newbuf
-            count -= len(newbuf)
-        return buf
+        if self.sink:
+            self.sink.stop()
+            self.sink = None
+        self._primary = None
+
+        with self.streams_lock:
+            streams = list(self.streams.values())
+            self.streams = {}
+            self.active_stream = None
+            self._mix_streams = ()
+        for stream in streams:
+            stream.close()
+
+        self._status("Stopped.")
 
     def _receive_loop(self):
         while self.running:
             try:
-                if self.protocol == 'tcp':
-                    # Accept connection if not connected
-                    if not self.socket:
-                        try:
-                            client, addr = self.server_socket.accept()
-                            client.settimeout(None) # Disable timeout for client to prevent receive desync
-                            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Low latency
-                            self.socket = client
-                            if self.callback_status: self.callback_status(f"Connected: {addr}")
-                        except socket.timeout:
-                            continue
-                        except Exception as e:
-                            print(f"Accept error: {e}")
-                            continue
-                    
-                    # Read Framing (4 bytes length)
-                    length_bytes = self._recv_all(self.socket, 4)
-                    if not length_bytes:
-                        # Disconnected
-                        self.socket.close()
-                        self.socket = None
-                        if self.callback_status: self.callback_status("Disconnected (EOF). Waiting...")
-                        return # Restart loop? No, continue outer loop
-                        # Note: `continue` here works because we reset self.socket to None
-                        
-                    length = struct.unpack('>I', length_bytes)[0]
-                    # print(f"DEBUG: Frame Len {length}") # Uncomment to debug packet sizes
-                    
-                    # Read Payload
-                    data = self._recv_all(self.socket, length)
-                    if not data:
-                        # Payload EOF?
-                        self.socket.close()
-                        self.socket = None
-                        print("Disconnected during payload read")
-                        continue  
-
-                else:
-                    # UDP Mode
-                    # Increased buffer size to 65535 to handle large packets (e.g. 7692 bytes from Android)
-                    data, addr = self.socket.recvfrom(65535) 
-
-                # DECRYPTION STEP
-                if self.cipher:
-                    try:
-                        # EXPECTED FORMAT: Nonce(12) + Ciphertext + Tag(16)
-                        # Packet overhead: 28 bytes
-                        if len(data) < 28: 
-                            continue # Too short for encrypted packet
-                            
-                        nonce = data[:12]
-                        ciphertext = data[12:]
-                        # AESGCM.decrypt expects ciphertext + tag
-                        data = self.cipher.decrypt(nonce, ciphertext, None)
-                    except Exception as e:
-                        # Decryption failed (wrong password? corruption?)
-                        # print(f"Decryption Error: {e}") 
-                        continue
-
-                # Parse AudioStream Header (12 bytes: Seq + Timestamp)
-                if len(data) < 12:
-                    continue # Bad packet
-                
-                # Parse header
-                seq_bytes = data[0:4]
-                # timestamp_bytes = data[4:12] 
-                audio_data = data[12:]
-                
-                seq = struct.unpack('>I', seq_bytes)[0]
-                
-                # Basic packet loss tracking
-                if self.last_sequence != -1:
-                    diff = seq - self.last_sequence
-                    if diff > 1:
-                        self.packets_lost += (diff - 1)
-                
-                self.last_sequence = seq
-                self.total_packets_received += 1
-                
-                # Add to queue
-                queue_limit = self.max_queue_size
-                if self.protocol == 'tcp':
-                     # For TCP, we want minimal latency. The 'jitter buffer' is harmful.
-                     # We only keep 1-2 packets max.
-                     queue_limit = 2
-
-                if len(self.audio_queue) < queue_limit:
-                    self.audio_queue.append(audio_data)
-                else:
-                    # Buffer full - clear some old data to catch up (minimize latency)
-                    # Dropping oldest packet
-                    self.audio_queue.popleft() 
-                    self.audio_queue.append(audio_data)
-                    
-            except socket.timeout:
-                continue
-            except OSError:
-                break # Socket closed
-            except Exception as e:
-                print(f"Receive Error: {e}")
-                # Reset TCP socket on error
-                if self.protocol == 'tcp' and self.socket:
-                    self.socket.close()
-                    self.socket = None
-
-    def _play_loop(self):
-        while self.running:
-            if self.audio_queue:
-                data = self.audio_queue.popleft()
+                events = self.selector.select(timeout=0.5)
+            except (OSError, ValueError):
+                break # Sockets closed under us
+            for key, mask in events:
                 try:
-                    self.stream.write(data)
+                    key.data(key.fileobj)
                 except Exception as e:
-                    print(f"Write Error: {e}")
-            else:
-                # Buffer empty? Wait a tiny bit (underrun)
-                # We could send silence, but write blocks if we wanted to flow control
-                # Here we just spin lightly to avoid 100% CPU if empty
-                time.sleep(0.001)
+                    if self.running:
+                        print(f"Receive Error: {e}")
+            self._expire_streams()
+            self.cpu.mark("receive")
+        try:
+            self.selector.close()
+        except Exception:
+            pass
+
+    def _accept(self, server):
+        try:
+            client, addr = server.accept()
+        except (BlockingIOError, socket.timeout):
+            return
+        except OSError as e:
+            if self.running: print(f"Accept error: {e}")
+            return
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Low latency
+        client.setblocking(False)
+        conn = _TcpConnection(client, addr)
+        self.tcp_connections[client.fileno()] = conn
+        self.selector.register(client, selectors.EVENT_READ, lambda sock: self._read_tcp(conn))
+        self._status(f"Connected: {addr}")
+
+    def _close_tcp(self, conn, reason):
+        try:
+            self.selector.unregister(conn.sock)
+        except Exception:
+            pass
+        self.tcp_connections.pop(conn.sock.fileno(), None)
+        try: conn.sock.close()
+        except: pass
+        self._remove_stream(conn.stream_id)
+        self._status(f"Disconnected ({reason}): {conn.addr}")
+
+    def _read_tcp(self, conn):
+        # Every complete frame the socket has, parsed from large chunks
+        try:
+            frames = conn.reader.read(self.packet_ring)
+        except EOFError:
+            self._close_tcp(conn, "EOF")
+            return
+        except ValueError as e:
+            self.drops["bad_frame"] += 1
+            self._close_tcp(conn, str(e))
+            return
+        except OSError as e:
+            self._close_tcp(conn, str(e))
+            return
+
+        # A burst (USB stall, sender catching up) is older than the latency
+        # target: skip to the newest frames before spending any decrypt or
+        # decode time on audio that would only be trimmed later
+        keep = self._tcp_backlog_limit(conn.stream_id)
+        if keep and len(frames) > keep:
+            skipped = len(frames) - keep
+            self.drops["tcp_skipped"] += skipped
+            stream = self.streams.get(conn.stream_id)
+            if stream:
+                with self.counters_lock:
+                    stream.skipped += skipped
+            frames = frames[skipped:]
+        for packet in frames:
+            self._handle_packet(packet, conn.addr, 'tcp', conn.stream_id)
+
+    def _tcp_backlog_limit(self, stream_id):
+        # Frames worth keeping from one read: enough to cover the target delay
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return None
+        jb = stream.jitter_buffer
+        if not jb.last_duration_ms:
+            return None
+        return int(math.ceil(jb.target_delay_ms / jb.last_duration_ms)) + 1
+
+    def _read_udp(self, sock):
+        # Drain every queued datagram per wake-up
+        while True:
+            # Receive in place; reserve 64K to handle large packets (e.g. 7692 bytes from Android)
+            region = self.packet_ring.reserve()
+            try:
+                nbytes, addr = sock.recvfrom_into(region)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                # Windows reports ICMP port-unreachable on UDP sockets; harmless
+                continue
+            data = self.packet_ring.commit(nbytes)
+            self._handle_packet(data, addr, 'udp', f"{addr[0]}:{addr[1]}")
+
+    def start_capture(self, path, max_mb=64, files=4):
+        """
+        Record every packet as received, with its arrival time, to a
+        rotating capture of up to `files` files of max_mb each (see
+        packet_capture). Replaces a capture already running.
+        """
+        self.stop_capture()
+        capture = PacketCapture(path, max_bytes=max_mb * 1024 * 1024, backups=max(0, files - 1), meta={
+            "port": self.port,
+            "protocol": getattr(self, "protocol", None),
+            "encrypted": self.cipher is not None,
+            "rate": self.RATE,
+            "channels": self.CHANNELS,
+            "buffer_ms": self.buffer_ms,
+        })
+        capture.start()
+        self.capture = capture
+        self._status(f"Capturing packets to {path}")
+
+    def stop_capture(self):
+        capture, self.capture = self.capture, None
+        if capture:
+            capture.stop()
+            self._status(f"Capture saved: {capture.packets} packets in {capture.path}")
+
+    def start_relay(self, targets, delay_ms=150, password=None, ttl=1):
+        """
+        Forward the active sender to other receivers: targets are (host,
+        port) pairs, or one multicast group. Every room, this one included,
+        then plays it delay_ms behind the relay clock (see relay.py).
+        Without a password the session's own key is used, if any.
+        """
+        self.stop_relay()
+        if password:
+            cipher = crypto.make_cipher(password)
+        else:
+            # A key rotation in progress: downstream only needs the new key
+            cipher = getattr(self.cipher, "current", self.cipher)
+        forwarder = relay.Relay(self, targets, delay_ms=delay_ms, cipher=cipher, ttl=ttl)
+        forwarder.start()
+        self.relay = forwarder
+        self._status(f"Relaying to {', '.join(f'{h}:{p}' for h, p in forwarder.targets)} "
+                     f"({delay_ms} ms playout delay)")
+
+    def stop_relay(self):
+        forwarder, self.relay = self.relay, None
+        if forwarder:
+            forwarder.stop()
+            self._status("Relay stopped")
+
+    def _handle_packet(self, data, addr, protocol, stream_id):
+        capture = self.capture
+        if capture:
+            # As received (still encrypted), so a replay goes through the same path
+            capture.write(stream_id, addr, protocol, data)
+
+        stream = self.streams.get(stream_id)
+        cipher = stream.cipher if stream else self.cipher
+
+        # DECRYPTION STEP
+        # EXPECTED FORMAT: Nonce(12) + Ciphertext + Tag(16)
+        # Handed to the decrypt worker so the socket is drained without
+        # waiting on AES; it calls _handle_plaintext when done.
+        if cipher:
+            if self.decrypt_worker:
+                self.decrypt_worker.submit(cipher, data, addr, protocol, stream_id)
+                return
+            data = crypto.decrypt_packet(cipher, data)
+            if data is None:
+                return # Wrong password or corrupted
+
+        self._handle_plaintext(data, addr, protocol, stream_id)
+
+    def _handle_plaintext(self, data, addr, protocol, stream_id):
+        # Parse AudioStream Header (12 bytes: Seq + Flags/Timestamp)
+        if len(data) < codec.HEADER_SIZE:
+            self.drops["bad_header"] += 1
+            return # Bad packet
+
+        # Parse header (in place, no slicing copies)
+        seq, flags, timestamp = codec.parse_header(data)
+
+        stream = self.streams.get(stream_id)
+
+        # Only packets that authenticated and parsed may create a stream
+        if stream is None:
+            stream = self._add_stream(stream_id, addr, protocol)
+            if stream is None:
+                self.drops["stream_limit"] += 1
+                return
+
+        forwarder = self.relay
+        if forwarder and stream is self.active_stream and not flags & codec.FLAG_RELAY:
+            # Downstream rooms get it on our clock, and so do we
+            timestamp = forwarder.forward(stream, seq, flags, timestamp, data[codec.HEADER_SIZE:])
+            if timestamp is None:
+                return  # Parity before any data: nothing to map it by yet
+
+        stream.handle_packet(seq, flags, timestamp, data[codec.HEADER_SIZE:])
+
+    def _add_stream(self, stream_id, addr, protocol):
+        with self.streams_lock:
+            if len(self.streams) >= self.max_streams:
+                return None
+            # Keys are reused only after 65535 joins; 0xFFFF means the master bus
+            self._next_stream_key = self._next_stream_key % 0xFFFE + 1
+            stream = SenderStream(stream_id, addr, protocol, self, self._next_stream_key)
+            self.streams[stream_id] = stream
+            if self.active_stream is None:
+                self.active_stream = stream
+            self._mix_streams = tuple(self.streams.values())
+            count = len(self.streams)
+
+        # Keep the receive arena large enough for every sender's jitter buffer
+        needed = count * 1024 * 1024 + 1024 * 1024
+        if needed > self.packet_ring.capacity:
+            # Views into the old arena stay valid; they keep it alive
+            self.packet_ring = PacketRing(needed)
+
+        self._status(f"Sender joined: {stream_id} ({protocol.upper()})")
+        self._event("stream_joined", {"id": stream_id, "key": stream.key, "protocol": protocol,
+                                      "streams": count})
+        return stream
+
+    def _remove_stream(self, stream_id):
+        with self.streams_lock:
+            stream = self.streams.pop(stream_id, None)
+            if stream is None:
+                return
+            if self.active_stream is stream:
+                # Fall back to the longest-connected remaining sender
+                remaining = sorted(self.streams.values(), key=lambda s: s.joined)
+                self.active_stream = remaining[0] if remaining else None
+            self._mix_streams = tuple(self.streams.values())
+            count = len(self.streams)
+        stream.close()
+        self._status(f"Sender left: {stream_id}")
+        self._event("stream_left", {"id": stream_id, "streams": count})
+
+    def _expire_streams(self):
+        now = self.clock()
+        for stream in list(self.streams.values()):
+            # TCP streams normally leave on disconnect; the timeout also
+            # catches one re-created by a packet still in the decrypt queue
+            if now - stream.last_seen > self.STREAM_TIMEOUT:
+                self._remove_stream(stream.id)
+
+    def select_stream(self, stream_id):
+        """Choose which sender's buffer stats are reported at top level.
+        Returns False if it is unknown."""
+        with self.streams_lock:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                return False
+            self.active_stream = stream
+        return True
+
+    def set_stream_gain(self, stream_id, gain):
+        """Linear gain (0 mutes, 1 unity, up to 4) for one sender in the mix."""
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return False
+        stream.gain = max(0.0, min(4.0, float(gain)))
+        return True
+
+    def set_stream_mute(self, stream_id, muted):
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return False
+        stream.ramp.muted = bool(muted)
+        return True
+
+    def set_master_gain(self, gain):
+        """Linear gain (0..4) on the whole mix; the limiter catches overs."""
+        self.mixer.master.gain = max(0.0, min(4.0, float(gain)))
+
+    def set_master_mute(self, muted):
+        self.mixer.master.muted = bool(muted)
+
+    def _sink_render(self, sink):
+        return lambda out, nbytes: self._render_sink(sink, out, nbytes)
+
+    def _render_sink(self, sink, out, nbytes):
+        # The lock only matters while a handoff has two sinks calling in
+        with self._output_lock:
+            handoff = self._handoff
+            if handoff is not None and sink is handoff.new and self._primary is not sink:
+                self._primary = sink  # The new output is running: it takes over the mix
+            if sink is self._primary:
+                n = self._render(out, nbytes)
+                if handoff is not None and sink is handoff.new:
+                    handoff.render_new(out, nbytes)
+                return n
+            if handoff is not None and sink is handoff.old:
+                return handoff.render_old(out, nbytes)
+            out[:nbytes] = bytes(nbytes)  # A sink being closed
+            return 0
+
+    def switch_output(self, device_index=None, sinks=None, crossfade_ms=50.0):
+        """
+        Move playback to another device (or sink list) while receiving
+        continues, crossfading from the old output to the new one. Blocks
+        until the old output is closed; raises if the new one can't open,
+        leaving the old one playing.
+        """
+        if not self.running or not self.sink:
+            raise RuntimeError("receiver is not running")
+        specs = list(sinks) if sinks else self.sinks
+        new = output_sinks.make_sink(specs, device_index, self.playback, write_ms=self.write_ms)
+        old = self.sink
+        handoff = _OutputHandoff(old, new, self.CHANNELS, self.RATE, self.frame_bytes, crossfade_ms)
+        with self._output_lock:
+            self._handoff = handoff
+        try:
+            new.start(self._sink_render(new), self.RATE, self.CHANNELS, self.CHUNK)
+        except Exception:
+            with self._output_lock:
+                self._handoff = None
+            new.stop()
+            raise
+        self.sink = new
+        self.sinks = specs
+        # The new device's first callback starts the fade; give it time to open
+        handoff.done.wait(timeout=1.0 + crossfade_ms / 1000.0)
+        with self._output_lock:
+            if self._primary is not new:
+                self._primary = new  # Never called back; just cut over
+            self._handoff = None
+        old.stop()
+
+    def set_buffer_ms(self, buffer_ms):
+        """New jitter buffer ceiling for every sender, applied in place."""
+        self.buffer_ms = max(10, int(buffer_ms))
+        with self.streams_lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            stream.set_buffer_ms(self.buffer_ms)
+
+    def set_password(self, password, grace_s=10.0):
+        """
+        Switch keys without a restart: packets sealed with the old key are
+        still accepted for grace_s seconds. Turning encryption on or off
+        takes effect at once, there is no grace period for that.
+        """
+        cipher = crypto.make_cipher(password) if password else None  # PBKDF2, once per password
+        previous = self.cipher.current if isinstance(self.cipher, crypto.RotatingCipher) else self.cipher
+        if cipher and previous and grace_s > 0:
+            cipher = crypto.RotatingCipher(cipher, previous, grace_s)
+        if cipher and not self.decrypt_worker:
+            self.decrypt_worker = self._make_decrypt_worker()
+            self.decrypt_worker.start()
+        self.cipher = cipher
+        with self.streams_lock:
+            for stream in self.streams.values():
+                stream.cipher = cipher
+        self._status("Encryption key changed" if cipher else "Encryption disabled")
+
+    def reconfigure(self, **changes):
+        """
+        Apply settings to the running receiver without a restart. Accepts
+        buffer_ms, device_index and/or sinks (switches the output, with
+        crossfade_ms), password (with key_grace_s), gain and muted.
+        Returns the names of the settings applied.
+        """
+        applied = []
+        if "buffer_ms" in changes:
+            self.set_buffer_ms(changes["buffer_ms"])
+            applied.append("buffer_ms")
+        if "gain" in changes:
+            self.set_master_gain(changes["gain"])
+            applied.append("gain")
+        if "muted" in changes:
+            self.set_master_mute(changes["muted"])
+            applied.append("muted")
+        if "password" in changes:
+            self.set_password(changes["password"], changes.get("key_grace_s", 10.0))
+            applied.append("password")
+        if "device_index" in changes or "sinks" in changes:
+            self.switch_output(changes.get("device_index"), changes.get("sinks"),
+                               changes.get("crossfade_ms", 50.0))
+            applied.append("output")
+        return applied
+
+    def _render(self, out, nbytes):
+        # Called by the output sink (the PortAudio thread in callback mode).
+        # Mix exactly nbytes from every sender's ring (each topped up from
+        # its jitter buffer), pad with silence, return the real audio bytes.
+        t0 = time.perf_counter()
+        n = self.mixer.mix_into(out, nbytes, self._mix_streams)
+        if n < nbytes:
+            # Underrun: pad with silence rather than blocking the device
+            if nbytes > len(self._silence):
+                self._silence = bytes(nbytes)
+            out[n:nbytes] = self._silence[:nbytes - n]
+            if self._output_active:
+                self.output_underruns += 1
+            self._output_active = False
+        else:
+            self._output_active = True
+
+        self.render_ms.observe((time.perf_counter() - t0) * 1000.0)
+        self.cpu.mark("output")
+        return n
 
     def get_stats(self):
-        return {
+        with self.streams_lock:
+            streams = list(self.streams.values())
+            active = self.active_stream
+
+        stats = {
             "received": self.total_packets_received,
             "lost": self.packets_lost,
-            "queue": len(self.audio_queue)
+            "queue": len(active.jitter_buffer) if active else 0
+        }
+        # Top-level buffer figures describe what is being played
+        if active:
+            stats.update(active.jitter_buffer.get_stats())
+            if active.resampler:
+                stats["drift_ppm"] = round(active.drift.drift_ppm, 1)
+            stats["codec"] = active.codec
+            stats["active_stream"] = active.id
+        stats["output_underruns"] = self.output_underruns
+        stats["clipped"] = self.mixer.clipped
+        stats["master_gain"] = self.mixer.master.gain
+        stats["master_muted"] = self.mixer.master.muted
+        if self.decrypt_worker:
+            stats.update(self.decrypt_worker.get_stats())
+        capture = self.capture
+        if capture:
+            stats["capture"] = capture.get_stats()
+        forwarder = self.relay
+        if forwarder:
+            stats["relay"] = forwarder.get_stats()
+        stats["streams"] = [s.get_stats() for s in streams]
+        return stats
+
+    def get_metrics(self, consumer="default"):
+        """
+        Structured instrumentation snapshot: gauges, counters, drops by
+        reason, timing histograms and CPU per thread, plus per-sender
+        latency. Sent as the 'metrics' IPC event and rendered for Prometheus.
+        Counters only ever grow. Each consumer gets CPU percentages over
+        the time since its own previous call.
+        """
+        with self.streams_lock:
+            streams = list(self.streams.values())
+            active = self.active_stream
+
+        sink = self.sink
+        device_ms = sink.latency() * 1000.0 if sink else 0.0
+
+        jb_stats = [s.jitter_buffer.get_stats() for s in streams]
+        drops = dict(self.drops)
+        drops["late"] = sum(j["late"] for j in jb_stats)
+        drops["overflow"] = sum(j["dropped_overflow"] for j in jb_stats)
+        drops["trimmed"] = sum(j["trimmed"] for j in jb_stats)
+        drops["unsupported_codec"] = sum(s.unsupported_packets for s in streams)
+        counters = {
+            "packets_received": self.total_packets_received,
+            "packets_missed": self.packets_missed,
+            "packets_reordered": self.packets_reordered,
+            "underruns": sum(j["underruns"] for j in jb_stats),
+            "output_underruns": self.output_underruns,
+            "overruns": drops["overflow"],
+            "concealed": sum(j["concealed"] for j in jb_stats),
+            "clipped": self.mixer.clipped,
+        }
+        histograms = {"render_ms": self.render_ms.snapshot()}
+        if self.write_ms.count:
+            histograms["write_ms"] = self.write_ms.snapshot()
+        if self.decrypt_worker:
+            drops["decrypt_failed"] = self.decrypt_worker.failed
+            drops["decrypt_queue_full"] = self.decrypt_worker.dropped
+            counters["overruns"] += self.decrypt_worker.dropped
+            counters["decrypted"] = self.decrypt_worker.decrypted
+            histograms["decrypt_ms"] = self.decrypt_worker.decrypt_ms.snapshot()
+
+        stream_metrics = [s.get_metrics(device_ms) for s in streams]
+        gauges = {"streams": len(streams), "device_latency_ms": round(device_ms, 1),
+                  "packets_lost": self.packets_lost}
+        for m in stream_metrics:
+            if active and m["id"] == active.id:
+                gauges.update(m["gauges"])
+
+        return {
+            "gauges": gauges,
+            "counters": counters,
+            "drops": drops,
+            "histograms": histograms,
+            "cpu": self.cpu.snapshot(consumer),
+            "streams": stream_metrics,
         }
@@ -0,0 +1,223 @@
+"""
+Benchmark / soak harness for AudioReceiver, no phone or sound card needed.
+
+A SyntheticSender streams marker packets (every packet holds one sample
+value derived from its sequence number) through the chosen impairment
+profile; the receiver plays into a null output sink, which reports every
+block it plays. Matching markers at the output against send times
+gives true end-to-end latency, including jitter buffer, resampler and
+device buffering.
+
+    python benchmark.py                                 # all modes, 10 s each
+    python benchmark.py --modes udp,tcp-aes --profile wifi --duration 60
+    python benchmark.py --duration 3600 --profile lossy # soak
+    python benchmark.py --json results.json --max-p95-ms 120 --max-loss 0.02
+
+Exits with status 1 when a --max-* threshold is exceeded, so it can gate CI.
+"""
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from audio_stream import AudioReceiver
+from synthetic_sender import SyntheticSender, PROFILES
+
+MODES = {
+    "udp":     ("udp", False),
+    "tcp":     ("tcp", False),
+    "udp-aes": ("udp", True),
+    "tcp-aes": ("tcp", True),
+}
+PASSWORD = "benchmark"
+
+
+class LatencyProbe:
+    """
+    Finds the first output frame of each marker packet. The device thread
+    only queues blocks; matching happens on a separate thread so it does not
+    show up in the receiver's output CPU time.
+    """
+
+    def __init__(self, sender, rate=48000, channels=2):
+        self.sender = sender
+        self.rate = rate
+        self.channels = channels
+        self.blocks = collections.deque()
+        self.latencies_ms = []
+        self.last_seq = -1
+        self.prev = 0
+        self.running = True
+        self.event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def on_block(self, data, when):
+        self.blocks.append((data, when))
+        self.event.set()
+
+    def _run(self):
+        while self.running or self.blocks:
+            self.event.wait(0.1)
+            self.event.clear()
+            while self.blocks:
+                self._match(*self.blocks.popleft())
+
+    def _match(self, data, when):
+        left = np.frombuffer(data, dtype=np.int16)[::self.channels]
+        if not len(left):
+            return
+        changes = np.flatnonzero(np.diff(left, prepend=self.prev))
+        self.prev = left[-1]
+        modulo = SyntheticSender.MARKER_MODULO
+        for idx in changes:
+            value = int(left[idx]) - 1
+            if value < 0:
+                continue
+            base = self.last_seq + 1
+            seq = base + (value - base) % modulo
+            if seq - self.last_seq > 50:
+                continue  # Concealment fade or crossfade, not a new packet
+            sent = self.sender.sent_at.get(seq)
+            if sent is not None:
+                self.latencies_ms.append((when + idx / float(self.rate) - sent) * 1000.0)
+            self.last_seq = seq
+
+    def stop(self):
+        self.running = False
+        self.event.set()
+        self.thread.join()
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    arr = np.asarray(values)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 1),
+        "p95": round(float(np.percentile(arr, 95)), 1),
+        "p99": round(float(np.percentile(arr, 99)), 1),
+        "max": round(float(arr.max()), 1),
+    }
+
+
+def run_case(mode, profile, duration, port, buffer_ms=100, wav=None, fec_group=0):
+    protocol, encrypted = MODES[mode]
+    password = PASSWORD if encrypted else None
+
+    # Never real hardware: the null sink clocks playback
+    receiver = AudioReceiver(port=port)
+    receiver.buffer_ms = buffer_ms
+    receiver.start(protocol=protocol, password=password,
+                   sinks=["null", f"file:{wav}"] if wav else ["null"])
+    if not receiver.running:
+        raise RuntimeError(f"receiver failed to start on port {port}")
+
+    sender = SyntheticSender(port=port, protocol=protocol, password=password, profile=profile,
+                             fec_group=fec_group)
+    probe = LatencyProbe(sender, receiver.RATE, receiver.CHANNELS)
+    null_sink = getattr(receiver.sink, "primary", receiver.sink)
+    null_sink.observer = probe.on_block
+    try:
+        t0 = time.perf_counter()
+        sender.start(duration)
+        while sender.running:
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - t0
+        time.sleep(0.5)  # Let the buffers drain into the device
+        metrics = receiver.get_metrics()
+        stats = receiver.get_stats()
+    finally:
+        null_sink.observer = None
+        receiver.stop()
+        sender.stop()
+        probe.stop()
+
+    received = stats["received"]
+    cpu_s = sum(t["cpu_s"] for t in metrics["cpu"].values())
+    drops = {k: v for k, v in metrics["drops"].items() if v}
+    counters = metrics["counters"]
+    lost = stats["lost"]
+    sent = sender.get_stats()
+    result = {
+        "mode": mode,
+        "profile": profile,
+        "duration_s": round(elapsed, 2),
+        "packets_sent": sent["sent"],
+        "parity_sent": sent["parity"],
+        "packets_received": received,
+        "throughput_pps": round(received / elapsed, 1),
+        "throughput_mbps": round(sent["bytes"] * 8 / elapsed / 1e6, 2),
+        "latency_ms": _percentiles(probe.latencies_ms),
+        "latency_samples": len(probe.latencies_ms),
+        "cpu_us_per_packet": round(cpu_s * 1e6 / received, 1) if received else None,
+        "cpu_by_thread_s": {k: v["cpu_s"] for k, v in metrics["cpu"].items()},
+        "loss_rate": round(lost / float(received + lost), 4) if received + lost else 0.0,
+        "drops": drops,
+        "underruns": counters["underruns"],
+        "output_underruns": counters["output_underruns"],
+        "concealed": counters["concealed"],
+    }
+    return result
+
+
+def _print_table(results):
+    header = f"{'mode':8} {'profile':10} {'pps':>7} {'Mbps':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'us/pkt':>7} {'loss':>6} {'undr':>5} {'drops'}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        lat = r["latency_ms"]
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        print(f"{r['mode']:8} {r['profile']:10} {r['throughput_pps']:7.1f} {r['throughput_mbps']:6.2f} "
+              f"{fmt(lat['p50']):>6} {fmt(lat['p95']):>6} {fmt(lat['p99']):>6} "
+              f"{fmt(r['cpu_us_per_packet']):>7} {r['loss_rate']:6.3f} {r['output_underruns']:5d} "
+              f"{json.dumps(r['drops'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AudioReceiver benchmark / soak test")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma list of " + ", ".join(MODES))
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="wifi")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode")
+    parser.add_argument("--buffer-ms", type=int, default=100)
+    parser.add_argument("--port", type=int, default=50105)
+    parser.add_argument("--wav", help="Also record the output of each run to <wav>-<mode>.wav")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if p95 latency exceeds this")
+    parser.add_argument("--max-loss", type=float, help="Fail if the loss rate exceeds this")
+    parser.add_argument("--fec", type=int, default=0, metavar="N",
+                        help="UDP modes: send a parity packet after every N packets")
+    args = parser.parse_args()
+
+    results = []
+    for i, mode in enumerate(m.strip() for m in args.modes.split(",") if m.strip()):
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode}")
+        wav = f"{args.wav}-{mode}.wav" if args.wav else None
+        # A fresh port per run so TIME_WAIT from the previous one can't interfere
+        results.append(run_case(mode, args.profile, args.duration, args.port + i,
+                                args.buffer_ms, wav, args.fec))
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    for r in results:
+        p95 = r["latency_ms"]["p95"]
+        if args.max_p95_ms is not None and (p95 is None or p95 > args.max_p95_ms):
+            print(f"FAIL {r['mode']}: p95 latency {p95} ms > {args.max_p95_ms} ms")
+            failed = True
+        if args.max_loss is not None and r["loss_rate"] > args.max_loss:
+            print(f"FAIL {r['mode']}: loss rate {r['loss_rate']} > {args.max_loss}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
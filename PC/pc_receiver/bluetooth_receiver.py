@@ -1,13 +1,19 @@
+import argparse
 import asyncio
 import json
 import sys
 import os
 import signal
+import threading
 import time
 import pyaudio
 
 from winsdk.windows.devices.enumeration import DeviceInformation
-from winsdk.windows.media.audio import AudioPlaybackConnection
+from winsdk.windows.media.audio import (
+    AudioPlaybackConnection,
+    AudioPlaybackConnectionOpenResultStatus,
+    AudioPlaybackConnectionState,
+)
 
 # ===================== CONFIG =====================
 CHUNK_SIZE = 1024
@@ -15,11 +21,16 @@ SAMPLE_RATE = 44100
 CHANNELS = 2
 FORMAT = pyaudio.paInt16
 
+RECONNECT_MIN_S = 1.0   # First retry after a connection is lost or fails to start
+RECONNECT_MAX_S = 30.0  # Backoff cap
+KEEPALIVE_CHECK_S = 5.0  # How often the silent stream is checked when nothing happens
+
 # ===================== UTIL =====================
-def log(status, message=None):
+def log(status, message=None, **fields):
     data = {"status": status}
     if message:
         data["message"] = message
+    data.update(fields)
     print(json.dumps(data), flush=True)
 
 def run_cleanup_commands():
@@ -33,89 +44,398 @@ def run_cleanup_commands():
     except Exception:
         return False
 
-# ===================== MAIN RECEIVER =====================
-async def bluetooth_receiver():
-    log("starting", "Bluetooth Receiver (Experimental)")
-
-    connection = None
-    p = None
-    stream = None
+# ===================== KEEP-ALIVE =====================
+class SilentKeepAlive:
+    """
+    Anchors the Windows audio session with a silent output stream.
+    PortAudio pulls the silence through a callback on its own thread, so
+    nothing here blocks the event loop or spins a core.
+    """
 
-    try:
-        # --- 1. Enumerate Bluetooth Audio Devices ---
-        selector = AudioPlaybackConnection.get_device_selector()
-        devices = await DeviceInformation.find_all_async(selector, [])
+    def __init__(self):
+        self.p = None
+        self.stream = None
+        self._silence = b"\x00" * (CHUNK_SIZE * CHANNELS * 2)
 
-        if not devices:
-            log("error", "No paired Bluetooth audio device found.")
-            return
+    def _callback(self, in_data, frame_count, time_info, status):
+        if frame_count != CHUNK_SIZE:
+            return b"\x00" * (frame_count * CHANNELS * 2), pyaudio.paContinue
+        return self._silence, pyaudio.paContinue
 
-        target = devices[0]
-        log("waiting", f"Waiting for device: {target.name}")
+    @property
+    def active(self):
+        try:
+            return self.stream is not None and self.stream.is_active()
+        except Exception:
+            return False
 
-        # --- 2. Create Playback Connection ---
-        connection = AudioPlaybackConnection.try_create_from_id(target.id)
-        if not connection:
-            log("error", "Failed to create AudioPlaybackConnection.")
+    def start(self):
+        if self.active:
             return
-
-        # IMPORTANT: Give Windows time to settle Bluetooth state
-        await asyncio.sleep(1.5)
-
-        # --- 3. Start Receiver Mode (ONE TIME ONLY) ---
-        await connection.start_async()
-        log("receiver_mode", "PC is now acting as a Bluetooth speaker")
-
-        # --- 4. Anchor Windows Audio Session ---
-        p = pyaudio.PyAudio()
-        stream = p.open(
+        self.stop()
+        self.p = pyaudio.PyAudio()
+        self.stream = self.p.open(
             format=FORMAT,
             channels=CHANNELS,
             rate=SAMPLE_RATE,
             output=True,
-            frames_per_buffer=CHUNK_SIZE
+            frames_per_buffer=CHUNK_SIZE,
+            stream_callback=self._callback
         )
+        self.stream.start_stream()
 
-        silence = b"\x00" * (CHUNK_SIZE * CHANNELS * 2)
-        log("running", "Audio keep-alive active")
-
-        # --- 5. Keep Alive Loop ---
-        while True:
-            stream.write(silence, exception_on_underflow=False)
-            await asyncio.sleep(0)  # yield to event loop
+    def stop(self):
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except:
+                pass
+            self.stream = None
+        if self.p:
+            try:
+                self.p.terminate()
+            except:
+                pass
+            self.p = None
 
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        log("error", f"Runtime failure: {str(e)}")
+# ===================== SOURCES =====================
+class Source:
+    """One paired A2DP source (a phone) and its playback connection."""
 
-    finally:
-        # --- ORDERED SHUTDOWN (CRITICAL) ---
-        log("stopping", "Stopping Bluetooth receiver")
+    def __init__(self, device_id, name):
+        self.id = device_id
+        self.name = name
+        self.connection = None
+        self.token = None  # state_changed registration
+        self.opened = False
+        self.starting = False  # _enable in progress
+        self.failures = 0
+        self.retry_at = 0.0  # Monotonic time of the next (re)start attempt
 
-        try:
-            await asyncio.sleep(1.0)  # allow audio graph to drain
-        except:
-            pass
+    def info(self):
+        return {"id": self.id, "name": self.name, "connected": self.opened,
+                "enabled": self.connection is not None}
 
-        if stream:
+    def close(self):
+        connection, self.connection = self.connection, None
+        self.opened = False
+        if connection:
             try:
-                stream.stop_stream()
-                stream.close()
+                if self.token is not None:
+                    connection.remove_state_changed(self.token)
             except:
                 pass
-
-        if p:
             try:
-                p.terminate()
+                connection.close()
             except:
                 pass
+        self.token = None
 
-        if connection:
+    def backoff(self):
+        delay = min(RECONNECT_MAX_S, RECONNECT_MIN_S * (2 ** self.failures))
+        self.failures += 1
+        self.retry_at = time.monotonic() + delay
+        return delay
+
+
+class BluetoothReceiver:
+    """
+    Lets paired phones play to this PC. Paired A2DP sources are followed
+    with a DeviceWatcher; each wanted source gets an AudioPlaybackConnection
+    that is started (so the phone may connect) and restarted with backoff
+    when it closes or fails. Everything that happens on WinRT or stdin
+    threads is posted to the event loop as (kind, ...) tuples.
+
+    wanted is None for every paired source, or a set of device ids/names.
+    """
+
+    def __init__(self, wanted=None):
+        self.wanted = wanted
+        self.sources = {}  # device id -> Source
+        self.keepalive = SilentKeepAlive()
+        self.loop = None
+        self.events = None
+        self.watcher = None
+        self.tasks = set()
+        self.settle_s = 1.5
+
+    # ---- posting from other threads ----
+    def _post(self, *event):
+        try:
+            self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def _on_added(self, watcher, info):
+        self._post("added", info.id, info.name)
+
+    def _on_updated(self, watcher, update):
+        name = None
+        try:
+            name = update.properties.lookup("System.ItemNameDisplay")
+        except Exception:
+            pass
+        self._post("updated", update.id, name)
+
+    def _on_removed(self, watcher, update):
+        self._post("removed", update.id)
+
+    def _on_enumerated(self, watcher, args):
+        self._post("enumerated")
+
+    def _state_handler(self, device_id):
+        def handler(connection, args):
+            self._post("state", device_id, connection.state)
+        return handler
+
+    def _read_stdin(self):
+        # Commands from the UI, one JSON object per line
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
             try:
-                connection.close()
+                self._post("command", json.loads(line))
+            except ValueError:
+                log("error", f"Bad command: {line[:80]}")
+        self._post("stdin_closed")
+
+    # ---- selection ----
+    def _wants(self, source):
+        return self.wanted is None or source.id in self.wanted or source.name in self.wanted
+
+    def _publish(self):
+        log("devices", devices=[s.info() for s in self.sources.values()])
+
+    # ---- connections ----
+    async def _enable(self, source):
+        """Create and start the playback connection; False means retry later."""
+        source.starting = True
+        try:
+            return await self._start_connection(source)
+        finally:
+            source.starting = False
+            self.events.put_nowait(("tick",))  # Re-plan retries
+
+    async def _start_connection(self, source):
+        source.close()
+        connection = AudioPlaybackConnection.try_create_from_id(source.id)
+        if not connection:
+            delay = source.backoff()
+            log("error", f"Failed to create AudioPlaybackConnection for {source.name}. Retrying in {delay:.0f}s.",
+                device=source.name, id=source.id)
+            return False
+        source.connection = connection
+        source.token = connection.add_state_changed(self._state_handler(source.id))
+
+        # IMPORTANT: Give Windows time to settle Bluetooth state
+        await asyncio.sleep(self.settle_s)
+        if source.connection is not connection:
+            return False  # Closed while we slept
+
+        try:
+            await connection.start_async()
+        except Exception as e:
+            source.close()
+            delay = source.backoff()
+            log("error", f"Could not start receiver mode for {source.name}: {e}. Retrying in {delay:.0f}s.",
+                device=source.name, id=source.id)
+            return False
+
+        source.retry_at = 0.0
+        log("waiting", f"Waiting for device: {source.name}", device=source.name, id=source.id)
+        # The phone may have connected already
+        self._on_state(source, connection.state)
+        return True
+
+    async def _connect(self, source):
+        """Ask Windows to connect to the phone instead of waiting for it."""
+        if source.starting:
+            log("error", f"{source.name} is still starting; try again in a moment",
+                device=source.name, id=source.id)
+            return
+        if source.connection is None and not await self._enable(source):
+            return
+        log("connecting", f"Connecting to {source.name}", device=source.name, id=source.id)
+        try:
+            result = await source.connection.open_async()
+        except Exception as e:
+            log("error", f"Connection to {source.name} failed: {e}", device=source.name, id=source.id)
+            return
+        if result.status != AudioPlaybackConnectionOpenResultStatus.SUCCESS:
+            log("error", f"Connection to {source.name} failed ({result.status.name})",
+                device=source.name, id=source.id)
+
+    def _on_state(self, source, state):
+        opened = state == AudioPlaybackConnectionState.OPENED
+        if opened == source.opened:
+            return
+        source.opened = opened
+        if opened:
+            source.failures = 0
+            log("receiver_mode", "PC is now acting as a Bluetooth speaker",
+                device=source.name, id=source.id)
+            try:
+                if not self.keepalive.active:
+                    self.keepalive.start()
+                    log("running", "Audio keep-alive active")
+            except Exception as e:
+                log("error", f"Audio keep-alive failed: {e}")
+        else:
+            # Start over so the phone can come back; Windows needs a fresh connection
+            delay = source.backoff()
+            log("disconnected", f"{source.name} disconnected. Reconnecting in {delay:.0f}s.",
+                device=source.name, id=source.id)
+            source.close()
+        self._publish()
+
+    # ---- commands ----
+    async def _command(self, message):
+        command = message.get("command") if isinstance(message, dict) else None
+        device = message.get("device") if isinstance(message, dict) else None
+        source = self.sources.get(device) or next(
+            (s for s in self.sources.values() if s.name == device), None)
+
+        if command == "list":
+            self._publish()
+        elif command == "select":
+            # device=None listens for every paired phone again
+            self.wanted = None if device is None else {device}
+            for s in self.sources.values():
+                if not self._wants(s):
+                    s.close()
+                elif s.connection is None:
+                    s.retry_at = 0.0
+            self._publish()
+        elif command == "connect":
+            if source is None:
+                log("error", f"Unknown device: {device}")
+                return
+            if self.wanted is not None:
+                self.wanted.add(source.id)
+            await self._connect(source)
+        elif command == "disconnect":
+            for s in ([source] if source else list(self.sources.values())):
+                s.close()
+                s.retry_at = float("inf")  # Until selected or connected again
+            self._publish()
+        else:
+            log("error", f"Unknown command: {command}")
+
+    # ---- main loop ----
+    def _start_watcher(self):
+        selector = AudioPlaybackConnection.get_device_selector()
+        watcher = DeviceInformation.create_watcher(selector)
+        watcher.add_added(self._on_added)
+        watcher.add_updated(self._on_updated)
+        watcher.add_removed(self._on_removed)
+        watcher.add_enumeration_completed(self._on_enumerated)
+        watcher.start()
+        self.watcher = watcher
+
+    async def _handle(self, event):
+        kind = event[0]
+        if kind == "added":
+            _, device_id, name = event
+            if device_id not in self.sources:
+                self.sources[device_id] = Source(device_id, name)
+                log("paired", f"Paired device: {name}", device=name, id=device_id)
+                self._publish()
+        elif kind == "updated":
+            _, device_id, name = event
+            source = self.sources.get(device_id)
+            if source and name and name != source.name:
+                source.name = name
+                self._publish()
+        elif kind == "removed":
+            source = self.sources.pop(event[1], None)
+            if source:
+                source.close()
+                log("unpaired", f"Device removed: {source.name}", device=source.name, id=source.id)
+                self._publish()
+        elif kind == "enumerated":
+            if not self.sources:
+                log("error", "No paired Bluetooth audio device found.")
+            self._publish()
+        elif kind == "state":
+            source = self.sources.get(event[1])
+            if source and source.connection is not None:
+                self._on_state(source, event[2])
+        elif kind == "command":
+            await self._command(event[1])
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        self._start_watcher()
+        threading.Thread(target=self._read_stdin, daemon=True).start()
+
+        while True:
+            # Start (or restart after backoff) every wanted source that isn't listening
+            now = time.monotonic()
+            wait = KEEPALIVE_CHECK_S
+            for source in list(self.sources.values()):
+                if source.connection is not None or source.starting or not self._wants(source):
+                    continue
+                if now >= source.retry_at:
+                    # As a task: starting waits for Windows, events must not
+                    task = asyncio.create_task(self._enable(source))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                else:
+                    wait = min(wait, source.retry_at - now)
+
+            if self.keepalive.stream is not None and not self.keepalive.active:
+                # The output device went away under us (default device change)
+                try:
+                    self.keepalive.start()
+                except Exception as e:
+                    log("error", f"Audio keep-alive failed: {e}")
+
+            try:
+                event = await asyncio.wait_for(self.events.get(), timeout=wait)
+            except asyncio.TimeoutError:
+                continue
+            if event[0] == "stdin_closed":
+                continue  # Launched without a UI pipe; keep serving
+            await self._handle(event)
+
+    async def close(self):
+        if self.watcher is not None:
+            try:
+                self.watcher.stop()
             except:
                 pass
+            self.watcher = None
+
+        try:
+            await asyncio.sleep(1.0)  # allow audio graph to drain
+        except:
+            pass
+
+        self.keepalive.stop()
+        for source in self.sources.values():
+            source.close()
+
+# ===================== MAIN RECEIVER =====================
+async def bluetooth_receiver(wanted=None):
+    log("starting", "Bluetooth Receiver (Experimental)")
+
+    receiver = BluetoothReceiver(wanted)
+    try:
+        await receiver.run()
+
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        log("error", f"Runtime failure: {str(e)}")
+
+    finally:
+        # --- ORDERED SHUTDOWN (CRITICAL) ---
+        log("stopping", "Stopping Bluetooth receiver")
+
+        await receiver.close()
 
         # --- USER-AWARE CLEANUP ---
         log("cleanup", "Attempting system cleanup (ipconfig /flushdns)")
@@ -137,8 +457,12 @@ async def bluetooth_receiver():
 
 # ===================== ENTRY =====================
 def main():
+    parser = argparse.ArgumentParser(description="AudioSync Bluetooth receiver (A2DP sink)")
+    parser.add_argument("--device", action="append",
+                        help="Paired device id or name to accept (repeatable; default: every paired device)")
+    args = parser.parse_args()
     try:
-        asyncio.run(bluetooth_receiver())
+        asyncio.run(bluetooth_receiver(set(args.device) if args.device else None))
     except KeyboardInterrupt:
         pass
     finally:
@@ -0,0 +1,82 @@
+import struct
+
+try:
+    import opuslib
+except Exception:
+    # opuslib missing, or installed without the native libopus it wraps.
+    # Opus streams are then rejected and senders have to stay on PCM.
+    opuslib = None
+
+# AudioStream header: Seq (4 bytes) + Timestamp (8 bytes) = 12 bytes.
+# Sender timestamps are epoch milliseconds, which never reach the top byte of
+# the 64-bit field, so that byte carries per-packet flags. Old senders leave
+# it zero, which means plain PCM.
+HEADER = struct.Struct('>IQ')
+HEADER_SIZE = HEADER.size
+TIMESTAMP_MASK = (1 << 56) - 1
+
+FLAG_OPUS = 0x01  # Payload is one Opus packet instead of raw PCM Int16
+FLAG_FEC = 0x02   # XOR parity over the preceding data packets (see fec.py)
+FLAG_RELAY = 0x04  # Forwarded by a relay; the timestamp is on the relay's clock (see relay.py)
+
+
+def parse_header(data):
+    """Returns (seq, flags, timestamp_ms) from the start of a packet buffer."""
+    seq, stamp = HEADER.unpack_from(data, 0)
+    return seq, stamp >> 56, stamp & TIMESTAMP_MASK
+
+
+def pack_header(seq, timestamp_ms, flags=0):
+    return HEADER.pack(seq & 0xFFFFFFFF, (flags << 56) | (timestamp_ms & TIMESTAMP_MASK))
+
+
+def supported_codecs():
+    codecs = ["pcm"]
+    if opuslib:
+        codecs.append("opus")
+    return codecs
+
+
+class OpusDecoder:
+    """
+    Decodes an Opus stream back to Int16 PCM.
+
+    When a packet arrives right after a gap, the lost packet is first rebuilt
+    from the in-band FEC data the encoder embedded in this one, so the jitter
+    buffer gets real audio instead of needing to conceal.
+    """
+
+    MAX_FRAMES = 5760  # 120ms at 48kHz, the largest Opus packet
+
+    def __init__(self, rate=48000, channels=2):
+        if not opuslib:
+            raise RuntimeError("opuslib is not installed")
+        self.decoder = opuslib.Decoder(rate, channels)
+        self.frame_bytes = 2 * channels
+        self.last_seq = None
+        self.last_frames = 0
+        self.fec_recovered = 0
+        self.errors = 0
+
+    def decode(self, seq, payload):
+        """Returns a list of (seq, pcm_bytes): the packet itself, preceded by
+        the previous packet if it was missing and could be recovered."""
+        out = []
+        data = bytes(payload)  # opuslib needs bytes; Opus packets are small
+        if self.last_seq is not None and self.last_seq - seq > 1000:
+            self.last_seq = None  # Sender restarted
+        try:
+            if self.last_seq is not None and seq - self.last_seq > 1 and self.last_frames:
+                pcm = self.decoder.decode(data, self.last_frames, decode_fec=True)
+                if pcm:
+                    out.append((seq - 1, pcm))
+                    self.fec_recovered += 1
+            pcm = self.decoder.decode(data, self.MAX_FRAMES)
+        except Exception:
+            self.errors += 1
+            return out
+        if self.last_seq is None or seq > self.last_seq:
+            self.last_seq = seq
+        self.last_frames = len(pcm) // self.frame_bytes
+        out.append((seq, pcm))
+        return out
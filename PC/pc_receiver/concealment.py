@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class Concealer:
+    """
+    Packet-loss concealment for Int16 interleaved PCM.
+
+    A missing packet is synthesized by repeating the last pitch period of the
+    previous good packet (found by autocorrelation, i.e. the most
+    self-similar lag), fading out over a few consecutive losses. When real
+    audio resumes it is crossfaded in so the seam does not click.
+    """
+
+    def __init__(self, channels=2, rate=48000, fade_packets=3, crossfade_ms=5):
+        self.channels = channels
+        self.fade_packets = fade_packets
+        self.crossfade_frames = int(rate * crossfade_ms / 1000)
+        # Pitch search range: 2.5ms (400 Hz) .. 20ms (50 Hz)
+        self.min_period = int(rate * 0.0025)
+        self.max_period = int(rate * 0.02)
+
+        self._last = None    # Last good payload (a view, never copied)
+        self._cycle = None   # One period of audio, float32 (frames, channels)
+        self._phase = 0
+        self._run = 0        # Consecutive concealed packets
+
+    def remember(self, payload):
+        self._last = payload
+
+    def _find_cycle(self):
+        x = np.frombuffer(self._last, dtype=np.int16).reshape(-1, self.channels)
+        n = len(x)
+        mono = x.mean(axis=1, dtype=np.float32)
+        max_p = min(self.max_period, n // 2)
+        period = n // 2
+        if max_p > self.min_period:
+            # Autocorrelation via FFT; pick the most similar lag in range
+            spec = np.fft.rfft(mono, 2 * n)
+            ac = np.fft.irfft(spec * np.conj(spec))[:n]
+            if ac[0] > 0:
+                lag = self.min_period + int(np.argmax(ac[self.min_period:max_p]))
+                if ac[lag] / ac[0] > 0.3:
+                    period = lag
+        self._cycle = x[-period:].astype(np.float32)
+        self._phase = 0
+
+    def _continue(self, frames):
+        # Next `frames` frames of the repeated cycle, advancing the phase
+        idx = (self._phase + np.arange(frames)) % len(self._cycle)
+        self._phase = (self._phase + frames) % len(self._cycle)
+        return self._cycle[idx]
+
+    def _gain(self, run):
+        return max(0.0, 1.0 - run / float(self.fade_packets))
+
+    def conceal(self):
+        """Synthesize one packet's worth of audio, or None if there is no history."""
+        if self._last is None or len(self._last) == 0:
+            return None
+        if self._run == 0:
+            self._find_cycle()
+        frames = len(self._last) // (2 * self.channels)
+        out = self._continue(frames)
+        ramp = np.linspace(self._gain(self._run), self._gain(self._run + 1),
+                           frames, dtype=np.float32)
+        out *= ramp[:, None]
+        self._run += 1
+        return out.astype(np.int16).tobytes()
+
+    def recover(self, payload):
+        """Crossfade from the concealment into the first good packet after it."""
+        if self._run == 0:
+            return payload
+        gain = self._gain(self._run)
+        self._run = 0
+        x = np.frombuffer(payload, dtype=np.int16).reshape(-1, self.channels)
+        m = min(self.crossfade_frames, len(x))
+        if m == 0:
+            return payload
+        out = x.astype(np.float32)
+        ramp = np.linspace(0.0, 1.0, m, dtype=np.float32)[:, None]
+        head = out[:m] * ramp
+        if gain > 0.0:
+            # Otherwise the concealment already faded out and this is a plain fade-in
+            head += self._continue(m) * gain * (1.0 - ramp)
+        out[:m] = head
+        return np.clip(out, -32768, 32767).astype(np.int16).tobytes()
@@ -0,0 +1,303 @@
+import hashlib
+import os
+import queue
+import sys
+import threading
+import time
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+
+from metrics import Histogram, DURATION_BUCKETS_MS
+
+# Must match the Android sender
+SALT = b"AudioStreamSalt"
+ITERATIONS = 100000
+
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def _dpapi(data, protect):
+    # Windows DPAPI: the blob can only be opened by this user on this machine
+    import ctypes
+    from ctypes import wintypes
+
+    class DATA_BLOB(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+    buf = ctypes.create_string_buffer(data, len(data))
+    blob_in = DATA_BLOB(len(data), buf)
+    blob_out = DATA_BLOB()
+    crypt32 = ctypes.windll.crypt32
+    fn = crypt32.CryptProtectData if protect else crypt32.CryptUnprotectData
+    if not fn(ctypes.byref(blob_in), None, None, None, None, 0, ctypes.byref(blob_out)):
+        raise OSError("DPAPI call failed")
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+
+class KeyCache:
+    """
+    Remembers PBKDF2 results so restarting the receiver with the same
+    password does not pay for 100k iterations again.
+
+    Entries are keyed by a SHA-256 of salt, iterations and password, so the
+    password itself is never kept. With a path, the cache is also stored on
+    disk, sealed with DPAPI (Windows only; elsewhere it stays in memory).
+    """
+
+    def __init__(self, path=None):
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.path = None
+        self.hits = 0
+        if path:
+            self.enable_persistence(path)
+
+    @staticmethod
+    def persistence_supported():
+        return sys.platform == "win32"
+
+    def enable_persistence(self, path):
+        if not self.persistence_supported():
+            return False
+        self.path = path
+        self._load()
+        return True
+
+    def disable_persistence(self, forget=True):
+        # Stop writing to disk and, by default, remove what was stored
+        if self.path and forget:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.path = None
+
+    def _id(self, password, salt, iterations):
+        h = hashlib.sha256()
+        h.update(salt)
+        h.update(iterations.to_bytes(4, "big"))
+        h.update(password.encode())
+        return h.hexdigest()
+
+    def get(self, password, salt=SALT, iterations=ITERATIONS):
+        """Returns the 32-byte AES key for password, deriving it only once."""
+        key_id = self._id(password, salt, iterations)
+        with self.lock:
+            key = self.keys.get(key_id)
+            if key is not None:
+                self.hits += 1
+                return key
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=iterations,
+            backend=default_backend()
+        )
+        key = kdf.derive(password.encode())
+
+        with self.lock:
+            self.keys[key_id] = key
+            if self.path:
+                self._save()
+        return key
+
+    def clear(self):
+        with self.lock:
+            self.keys = {}
+            if self.path:
+                self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                plain = _dpapi(f.read(), protect=False)
+        except (OSError, ValueError):
+            return  # Missing or unreadable: start empty
+        # Records: 32-byte id digest + 32-byte key
+        for i in range(0, len(plain) - 63, 64):
+            self.keys.setdefault(plain[i:i + 32].hex(), plain[i + 32:i + 64])
+
+    def _save(self):
+        plain = b"".join(bytes.fromhex(k) + v for k, v in self.keys.items())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(_dpapi(plain, protect=True))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Key cache write failed: {e}")
+
+
+# Shared by every receiver in the process
+key_cache = KeyCache()
+
+
+def default_cache_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "AudioSync", "keys.bin")
+
+
+def warm_up():
+    """Load the OpenSSL backend for PBKDF2 and AES-GCM now, not on the first start."""
+    PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=SALT, iterations=1,
+               backend=default_backend()).derive(b"")
+    cipher = AESGCM(bytes(32))
+    nonce = bytes(NONCE_SIZE)
+    cipher.decrypt(nonce, cipher.encrypt(nonce, bytes(16), None), None)
+
+
+def make_cipher(password):
+    return AESGCM(key_cache.get(password))
+
+
+class RotatingCipher:
+    """
+    A new key that still accepts the previous one for grace_s seconds, so
+    senders can move to a new password while the stream keeps playing.
+    Stands in for an AESGCM wherever a cipher is expected.
+    """
+
+    def __init__(self, current, previous, grace_s=10.0):
+        self.current = current
+        self.previous = previous
+        self.until = time.monotonic() + grace_s
+        self.previous_hits = 0  # Packets still sealed with the old key
+
+    def decrypt(self, nonce, data, associated_data):
+        try:
+            return self.current.decrypt(nonce, data, associated_data)
+        except InvalidTag:
+            previous = self.previous
+            if previous is None:
+                raise
+            if time.monotonic() > self.until:
+                self.previous = None  # Grace over
+                raise
+            plain = previous.decrypt(nonce, data, associated_data)
+            self.previous_hits += 1
+            return plain
+
+
+def decrypt_packet(cipher, data):
+    """
+    Nonce(12) + Ciphertext + Tag(16) -> plaintext view, or None if the
+    packet is too short or does not authenticate (wrong password, corruption).
+    """
+    if len(data) < NONCE_SIZE + TAG_SIZE:
+        return None
+    try:
+        # Slices are views, so the plaintext is the only copy on this path
+        return memoryview(cipher.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None))
+    except InvalidTag:
+        return None
+
+
+class DecryptWorker:
+    """
+    Decrypts packets on its own thread so a burst of arrivals never waits
+    behind AES-GCM on the socket thread.
+
+    One worker keeps every sender's packets in arrival order. Queued packets
+    are views into the receive arena, so the queue is bounded, by count and
+    by max_bytes (a fraction of the arena, so it cannot wrap under a queued
+    view), and a full queue makes the socket thread wait (backpressure)
+    instead of receiving over packets that are still queued. Only if the
+    worker stalls outright are packets dropped and counted.
+    """
+
+    def __init__(self, deliver, max_queue=128, max_bytes=None, cpu=None):
+        self.deliver = deliver  # deliver(plaintext, *context) on the worker thread
+        self.cpu = cpu  # Optional metrics.ThreadCpu
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_bytes = max_bytes
+        self.queued_bytes = 0  # Arena bytes the queued views still need
+        self.space = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.decrypted = 0
+        self.failed = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.busy_s = 0.0
+        self.decrypt_ms = Histogram(DURATION_BUCKETS_MS)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def submit(self, cipher, data, *context):
+        n = len(data)
+        with self.space:
+            if self.max_bytes and not self.space.wait_for(
+                    lambda: self.queued_bytes + n <= self.max_bytes, timeout=0.05):
+                self.dropped += 1
+                return
+            self.queued_bytes += n
+        try:
+            self.queue.put((cipher, data, context), timeout=0.05)
+        except queue.Full:
+            self.dropped += 1
+            self._release(n)
+
+    def _release(self, n):
+        with self.space:
+            self.queued_bytes -= n
+            self.space.notify()
+
+    def _run(self):
+        while self.running:
+            item = self.queue.get()
+            if item is None:
+                break
+            cipher, data, context = item
+            t0 = time.perf_counter()
+            plain = decrypt_packet(cipher, data)
+            self._release(len(data))  # The plaintext is a copy: the view is done
+            elapsed = time.perf_counter() - t0
+            self.busy_s += elapsed
+            self.decrypt_ms.observe(elapsed * 1000.0)
+            if self.cpu:
+                self.cpu.mark("decrypt")
+            if plain is None:
+                self.failed += 1
+                continue
+            self.decrypted += 1
+            self.bytes += len(data)
+            try:
+                self.deliver(plain, *context)
+            except Exception as e:
+                print(f"Receive Error: {e}")
+
+    def get_stats(self):
+        stats = {
+            "decrypted": self.decrypted,
+            "decrypt_failed": self.failed,
+            "decrypt_dropped": self.dropped,
+            "decrypt_queue": self.queue.qsize(),
+            "decrypt_queue_bytes": self.queued_bytes,
+        }
+        if self.decrypted:
+            stats["decrypt_us"] = round(self.busy_s * 1e6 / (self.decrypted + self.failed), 1)
+        if self.busy_s > 0:
+            stats["decrypt_mbps"] = round(self.bytes / self.busy_s / 1e6, 1)
+        return stats
@@ -0,0 +1,143 @@
+"""
+Cached list of audio output devices.
+
+Enumerating PortAudio devices is slow on machines with many virtual
+devices, and picking up hot-plugged ones means re-initialising PortAudio.
+The registry does both on a background thread when asked and hands out
+the cached list instantly; on_change is called only when the list
+actually differs.
+
+Devices are identified by a stable id (a hash of host API + name) rather
+than the PortAudio index, which shifts whenever something is plugged in.
+"""
+import hashlib
+import threading
+
+import output_sinks
+
+# Held across re-initialising PortAudio and enumerating it, so one scan
+# can't terminate the engine while another is walking its devices
+_scan_lock = threading.Lock()
+
+
+def device_id(host_api, name, ordinal=0):
+    """Stable id for a device; ordinal tells apart devices with the same name."""
+    key = f"{host_api}\n{name}\n{ordinal}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def enumerate_output_devices(refresh=False):
+    """
+    One pass over the default host API's output devices:
+    [{'id', 'index', 'name', 'host_api', 'channels', 'default_rate'}, ...]
+    With refresh, PortAudio is re-initialised first when nothing is playing.
+    """
+    if output_sinks.pyaudio is None:
+        return []
+    with _scan_lock:
+        if refresh:
+            output_sinks.refresh_engine()
+        return _enumerate(output_sinks.portaudio_engine())
+
+
+def _enumerate(engine):
+    api = engine.get_host_api_info_by_index(0)
+    api_name = api.get('name', '')
+    devices = []
+    seen = {}
+    for i in range(api.get('deviceCount', 0)):
+        info = engine.get_device_info_by_host_api_device_index(0, i)
+        if info.get('maxOutputChannels', 0) <= 0:
+            continue
+        name = info.get('name', '')
+        ordinal = seen.get(name, 0)
+        seen[name] = ordinal + 1
+        devices.append({
+            'id': device_id(api_name, name, ordinal),
+            'index': info.get('index', i),
+            'name': name,
+            'host_api': api_name,
+            'channels': info.get('maxOutputChannels'),
+            'default_rate': info.get('defaultSampleRate'),
+        })
+    return devices
+
+
+class DeviceRegistry:
+    """
+    Keeps the device list in the background: rescans (re-initialising
+    PortAudio to see hot-plugged devices) when request_refresh() asks, and
+    on the calling thread in scan(), e.g. when a lookup misses.
+
+    poll_interval: optional seconds between unrequested hot-plug checks;
+    None (the default) polls never. A poll is skipped while audio is
+    playing, since the engine can't be restarted then.
+    """
+
+    def __init__(self, on_change=None, poll_interval=None):
+        self.on_change = on_change  # on_change(devices)
+        self.poll_interval = poll_interval
+        self.devices = []
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.devices)
+
+    def request_refresh(self):
+        """Ask the background thread to re-scan now; the result goes to on_change."""
+        self.wake.set()
+
+    def resolve(self, device_id):
+        """PortAudio index for a device id, or None if it is not (or no longer) present."""
+        with self.lock:
+            for dev in self.devices:
+                if dev['id'] == device_id:
+                    return dev['index']
+        return None
+
+    def scan(self, refresh=True):
+        """Re-enumerate on the calling thread. Returns True if the list changed."""
+        try:
+            devices = enumerate_output_devices(refresh=refresh)
+        except Exception as e:
+            print(f"Device scan failed: {e}")
+            return False
+        with self.lock:
+            changed = not self.loaded or devices != self.devices
+            self.devices = devices
+            self.loaded = True
+        if changed and self.on_change:
+            self.on_change(list(devices))
+        return changed
+
+    def _run(self):
+        # First scan uses the already-initialised engine; later ones restart
+        # PortAudio so hot-plugged devices show up
+        self.scan(refresh=False)
+        while self.running:
+            requested = self.wake.wait(self.poll_interval)
+            self.wake.clear()
+            if not self.running:
+                break
+            if not requested and output_sinks.engine_busy():
+                continue
+            self.scan(refresh=True)
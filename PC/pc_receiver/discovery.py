@@ -0,0 +1,235 @@
+"""
+LAN discovery, so phones can find the receiver without typing an IP.
+
+Everything is one UTF-8 JSON object per UDP datagram on DISCOVERY_PORT:
+
+  probe     sender -> broadcast   {"type": "probe", "service": "audiosync"}
+  announce  receiver -> prober    answered at once, unicast
+            receiver -> broadcast every BEACON_INTERVAL s, and right away
+                                  when our LAN address changes
+  bye       receiver -> broadcast when the receiver stops
+
+An announcement is {"type": "announce", "service", "version", "id", "name",
+"ip", "port", "protocols", "encrypted", "codecs", "fec"}. The id stays the
+same across restarts and address changes, so a sender that already
+streams to us can follow a new "ip" after Wi-Fi roaming. The password is
+never announced, only whether one is needed.
+"""
+import hashlib
+import json
+import select
+import socket
+import threading
+import time
+import uuid
+
+SERVICE = "audiosync"
+VERSION = 1
+DISCOVERY_PORT = 50006
+BEACON_INTERVAL = 2.0
+MAX_DATAGRAM = 1024
+
+
+def _is_private(ip):
+    return ip.startswith('192.168.') or ip.startswith('10.') or ip.startswith('172.')
+
+
+def lan_ip(peer=None):
+    """
+    Our address on the LAN: the interface that routes to peer if given,
+    else the best private address we can find.
+    """
+    try:
+        # Connecting a UDP socket sends nothing; it only picks the interface
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(0)
+        try:
+            s.connect((peer or '10.254.254.254', 1))
+            ip = s.getsockname()[0]
+        except Exception:
+            ip = '127.0.0.1'
+        finally:
+            s.close()
+
+        if peer or _is_private(ip):
+            return ip
+
+        # Fallback to hostname resolution
+        hostname = socket.gethostname()
+        for info in socket.getaddrinfo(hostname, None, socket.AF_INET):
+            addr = info[4][0]
+            if _is_private(addr):
+                return addr
+
+        return ip  # Return whatever we got
+    except Exception:
+        return '127.0.0.1'
+
+
+def receiver_id():
+    """Stable id for this machine's receiver (hostname + MAC)."""
+    key = f"{socket.gethostname()}\n{uuid.getnode()}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+class DiscoveryService:
+    """
+    Answers probes and broadcasts beacons for one running receiver.
+    update() changes what is announced; the next beacon goes out at once.
+    """
+
+    def __init__(self, port, protocol='udp', encrypted=False, codecs=None, name=None,
+                 discovery_port=DISCOVERY_PORT):
+        self.id = receiver_id()
+        self.name = name or socket.gethostname()
+        self.port = port
+        self.protocol = protocol
+        self.encrypted = encrypted
+        self.codecs = codecs or ["pcm"]
+        self.discovery_port = discovery_port
+        self.sock = None
+        self.running = False
+        self.thread = None
+        self.ip = None
+        self.probes_answered = 0
+        self._last_reply = {}  # prober address -> monotonic time of our last answer
+        self._wake = threading.Event()
+
+    def announcement(self, ip=None):
+        protocols = ["udp", "tcp"] if self.protocol == "both" else [self.protocol]
+        return {
+            "type": "announce",
+            "service": SERVICE,
+            "version": VERSION,
+            "id": self.id,
+            "name": self.name,
+            "ip": ip or self.ip,
+            "port": self.port,
+            "protocols": protocols,
+            "encrypted": self.encrypted,
+            "codecs": self.codecs,
+            "fec": True,
+        }
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # No SO_REUSEADDR: a second receiver on this machine should fail
+        # here rather than share (on Windows, steal) the port
+        sock.bind(('', self.discovery_port))
+        sock.setblocking(False)
+        self.sock = sock
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._wake.set()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        # Let senders drop us now instead of waiting for beacons to stop
+        self._broadcast({"type": "bye", "service": SERVICE, "id": self.id})
+        self.sock.close()
+        self.sock = None
+
+    def _send(self, message, addr):
+        try:
+            self.sock.sendto(json.dumps(message).encode("utf-8"), addr)
+        except OSError:
+            pass  # No route (cable out, Wi-Fi roaming); the next beacon retries
+
+    def _broadcast(self, message):
+        self._send(message, ('<broadcast>', self.discovery_port))
+
+    def _run(self):
+        next_beacon = 0.0
+        next_ip_check = 0.0
+        while self.running:
+            now = time.monotonic()
+            if now >= next_ip_check:
+                # Cheap (no packets sent); a new address is announced at once
+                ip = lan_ip()
+                if ip != self.ip:
+                    self.ip = ip
+                    next_beacon = now
+                next_ip_check = now + 0.5
+            if now >= next_beacon or self._wake.is_set():
+                self._wake.clear()
+                self._broadcast(self.announcement())
+                next_beacon = now + BEACON_INTERVAL
+            try:
+                readable, _, _ = select.select([self.sock], [], [], 0.2)
+            except (OSError, ValueError):
+                break
+            if readable:
+                self._receive()
+
+    def _receive(self):
+        try:
+            data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+        except (BlockingIOError, OSError):
+            return
+        try:
+            message = json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            return
+        # Our own beacons and other receivers' come back here too
+        if not isinstance(message, dict) or message.get("type") != "probe":
+            return
+        if message.get("service", SERVICE) != SERVICE:
+            return
+
+        # One answer per prober per 100 ms: a probe is tiny and the answer
+        # isn't, so don't let spoofed probes turn us into an amplifier
+        now = time.monotonic()
+        if now - self._last_reply.get(addr, 0.0) < 0.1:
+            return
+        if len(self._last_reply) > 256:
+            self._last_reply = {a: t for a, t in self._last_reply.items() if now - t < 1.0}
+        self._last_reply[addr] = now
+
+        # The address on the prober's network, not necessarily our best guess
+        self._send(self.announcement(lan_ip(addr[0])), addr)
+        self.probes_answered += 1
+
+
+def probe(timeout=0.5, discovery_port=DISCOVERY_PORT):
+    """Broadcast one probe; returns the announcements that came back in time."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    found = {}
+    try:
+        sock.sendto(json.dumps({"type": "probe", "service": SERVICE}).encode("utf-8"),
+                    ('<broadcast>', discovery_port))
+        deadline = time.monotonic() + timeout
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            readable, _, _ = select.select([sock], [], [], left)
+            if not readable:
+                break
+            data, addr = sock.recvfrom(MAX_DATAGRAM)
+            try:
+                message = json.loads(data.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                continue
+            if isinstance(message, dict) and message.get("type") == "announce":
+                found[message.get("id")] = message
+    finally:
+        sock.close()
+    return list(found.values())
+
+
+if __name__ == "__main__":
+    for receiver in probe():
+        print(receiver)
@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+
+
+class DriftEstimator:
+    """
+    Tracks the clock skew between a sender's sound card and ours.
+
+    If the phone's clock runs fast, its packets arrive slightly quicker than
+    we play them and the buffer slowly fills; slow, and it drains. The
+    buffer occupancy is smoothed (packet arrivals make it saw-tooth) and a
+    PI controller turns the distance from the target into a playback rate
+    correction in ppm. The integral term settles on the actual skew, which
+    is reported as drift_ppm.
+    """
+
+    def __init__(self, kp=20.0, ki=0.006, smoothing=0.01, max_ppm=1000.0):
+        self.kp = kp                # ppm per ms of (smoothed) occupancy error
+        self.ki = ki                # ppm per ms of error, accumulated per update
+        self.smoothing = smoothing  # EMA factor per update (~50 updates/s)
+        self.max_ppm = max_ppm
+        self.level_ms = None
+        self.integral_ppm = 0.0
+        self.ppm = 0.0
+
+    def update(self, occupancy_ms, target_ms):
+        """Feed one occupancy sample; returns the input/output rate ratio."""
+        if self.level_ms is None:
+            self.level_ms = occupancy_ms
+        self.level_ms += (occupancy_ms - self.level_ms) * self.smoothing
+        error = self.level_ms - target_ms
+
+        # Above target -> consume faster (ratio > 1), below -> slower
+        self.integral_ppm += self.ki * error
+        self.integral_ppm = max(-self.max_ppm, min(self.max_ppm, self.integral_ppm))
+        ppm = self.kp * error + self.integral_ppm
+        self.ppm = max(-self.max_ppm, min(self.max_ppm, ppm))
+        return 1.0 + self.ppm * 1e-6
+
+    def reset(self):
+        self.level_ms = None
+
+    @property
+    def drift_ppm(self):
+        return self.integral_ppm
+
+
+class FractionalResampler:
+    """
+    Cubic (Catmull-Rom) interpolating resampler for Int16 interleaved PCM,
+    for ratios within a fraction of a percent of 1.
+
+    The read position is carried across blocks as a fractional frame index
+    together with the few input frames the interpolator still needs, so
+    consecutive blocks join without a seam.
+    """
+
+    def __init__(self, channels=2):
+        self.channels = channels
+        self.frame_bytes = 2 * channels
+        self._buf = np.zeros((4096, channels), dtype=np.float32)
+        self._len = 1    # Frame 0 is the one before the read position
+        self._pos = 1.0  # Fractional read position in _buf
+        self._scratch = bytearray(4096 * self.frame_bytes)
+
+    def frames_needed(self, frames, ratio):
+        """Input frames that must be available to produce `frames` frames."""
+        last = self._pos + (frames - 1) * ratio
+        return max(0, int(math.floor(last)) + 3 - self._len)
+
+    def process(self, ring, out, frames, ratio):
+        """
+        Read input from the FrameRing `ring` and write up to `frames`
+        resampled frames into `out`. Returns the number of bytes written.
+        """
+        need = self.frames_needed(frames, ratio)
+        if self._len + need > len(self._buf):
+            grown = np.zeros((self._len + need + 1024, self.channels), dtype=np.float32)
+            grown[:self._len] = self._buf[:self._len]
+            self._buf = grown
+        if need * self.frame_bytes > len(self._scratch):
+            self._scratch = bytearray(need * self.frame_bytes)
+
+        if need:
+            n = ring.read_into(memoryview(self._scratch), need * self.frame_bytes)
+            got = n // self.frame_bytes
+            if got:
+                pcm = np.frombuffer(self._scratch, dtype=np.int16, count=got * self.channels)
+                self._buf[self._len:self._len + got] = pcm.reshape(-1, self.channels)
+                self._len += got
+
+        # Frames we can actually produce with what is buffered
+        # (the last one read must have two frames after it)
+        avail = (self._len - 2 - self._pos) / ratio
+        frames = min(frames, int(math.ceil(avail)))
+        if frames <= 0:
+            return 0
+
+        t = self._pos + np.arange(frames, dtype=np.float64) * ratio
+        i = t.astype(np.int64)
+        f = (t - i).astype(np.float32)[:, None]
+        x0 = self._buf[i - 1]
+        x1 = self._buf[i]
+        x2 = self._buf[i + 1]
+        x3 = self._buf[i + 2]
+        y = x1 + 0.5 * f * (x2 - x0 + f * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3
+                                           + f * (3.0 * (x1 - x2) + x3 - x0)))
+
+        dst = np.frombuffer(out, dtype=np.int16, count=frames * self.channels).reshape(-1, self.channels)
+        np.copyto(dst, np.clip(np.rint(y), -32768, 32767), casting='unsafe')
+
+        # Keep one frame behind the new read position for the next block
+        self._pos += frames * ratio
+        drop = int(math.floor(self._pos)) - 1
+        if drop > 0:
+            keep = self._len - drop
+            self._buf[:keep] = self._buf[drop:self._len]
+            self._len = keep
+            self._pos -= drop
+        return frames * self.frame_bytes
+
+    def buffered_frames(self):
+        return max(0.0, self._len - self._pos)
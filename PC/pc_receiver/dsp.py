@@ -0,0 +1,143 @@
+import threading
+
+import numpy as np
+
+
+class LevelMeter:
+    """
+    Peak and RMS per channel (normalized, 0..1) accumulated since the last
+    read(), so a reader polling slower than the device doesn't miss peaks.
+    update() runs on the audio thread and read() on another; the lock only
+    covers folding a block in and swapping the accumulators out.
+    """
+
+    def __init__(self, channels=2):
+        self.channels = channels
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.peak = np.zeros(self.channels, dtype=np.float32)
+        self.sum_sq = np.zeros(self.channels, dtype=np.float64)
+        self.frames = 0
+
+    def update(self, samples):
+        # samples: normalized float32, interleaved
+        frames = samples.reshape(-1, self.channels)
+        if not len(frames):
+            return
+        peak = np.abs(frames).max(axis=0)
+        sum_sq = np.einsum('ij,ij->j', frames, frames)
+        with self.lock:
+            np.maximum(self.peak, peak, out=self.peak)
+            self.sum_sq += sum_sq
+            self.frames += len(frames)
+
+    def read(self):
+        """(peaks, rms) as lists, one value per channel; starts a new period."""
+        with self.lock:
+            peak, sum_sq, frames = self.peak, self.sum_sq, self.frames
+            self._reset()
+        rms = np.sqrt(sum_sq / frames) if frames else sum_sq
+        return peak.tolist(), rms.tolist()
+
+
+class GainRamp:
+    """
+    Gain with mute that never jumps: a change is spread linearly over
+    ramp_ms so it takes effect at once without zipper noise or clicks.
+    Set `gain`/`muted` from any thread; apply() runs on the audio thread.
+    """
+
+    def __init__(self, channels=2, rate=48000, ramp_ms=10.0, gain=1.0):
+        self.channels = channels
+        self.ramp_frames = max(1, int(rate * ramp_ms / 1000))
+        self.gain = gain  # Target, linear
+        self.muted = False
+        self.current = gain  # What the last sample was scaled by
+        self._steps = np.zeros(0, dtype=np.float32)
+
+    @property
+    def target(self):
+        return 0.0 if self.muted else self.gain
+
+    @property
+    def is_unity(self):
+        """True when apply() would leave the audio untouched."""
+        return self.current == 1.0 and self.target == 1.0
+
+    @property
+    def is_silent(self):
+        return self.current == 0.0 and self.target == 0.0
+
+    def apply(self, x):
+        """Scale normalized interleaved float32 samples in place."""
+        target = self.target
+        frames = len(x) // self.channels
+        if self.current == target:
+            if target != 1.0:
+                x *= np.float32(target)
+            return
+        # Per-frame gains from current towards target, then hold
+        n = min(frames, max(1, int(round(abs(target - self.current) * self.ramp_frames))))
+        if len(self._steps) < n:
+            self._steps = np.arange(1, n + 1, dtype=np.float32)
+        ramp = self.current + (target - self.current) * (self._steps[:n] / np.float32(n))
+        view = x[:frames * self.channels].reshape(frames, self.channels)
+        view[:n] *= ramp[:, None]
+        if n < frames:
+            view[n:] *= np.float32(target)
+        self.current = target
+
+
+class Limiter:
+    """
+    Look-ahead peak limiter for the master bus, with no added latency: the
+    look-ahead is the rest of the block being rendered. Gain is planned at
+    sub-block boundaries (so it is already down when a peak arrives) and
+    interpolated per sample; release is exponential back to unity. Below
+    the threshold it does nothing beyond one max() per block.
+    """
+
+    def __init__(self, channels=2, rate=48000, threshold=0.98, release_ms=80.0, sub_frames=32):
+        self.channels = channels
+        self.threshold = threshold
+        self.sub_frames = sub_frames
+        # Per sub-block fraction of the remaining distance back to unity
+        self.release = 1.0 - np.exp(-sub_frames / (rate * release_ms / 1000.0))
+        self.gain = 1.0  # Gain at the end of the last block
+        self.limited = 0  # Blocks where the limiter reduced the gain
+
+    def process(self, x):
+        """Limit normalized interleaved float32 samples in place."""
+        frames = len(x) // self.channels
+        if not frames:
+            return
+        view = x[:frames * self.channels].reshape(frames, self.channels)
+        env = np.abs(view).max(axis=1)
+        if self.gain >= 1.0 and env.max() <= self.threshold:
+            return
+
+        sub = self.sub_frames
+        starts = np.arange(0, frames, sub)
+        peaks = np.maximum.reduceat(env, starts)
+        need = np.minimum(1.0, self.threshold / np.maximum(peaks, 1e-9))
+
+        # Boundary k sits between sub-blocks k-1 and k and has to satisfy both
+        count = len(starts)
+        bounds = np.empty(count + 1)
+        # A peak at the very start of the block can't be anticipated
+        g = bounds[0] = min(self.gain, need[0])
+        for k in range(1, count + 1):
+            g = g + (1.0 - g) * self.release
+            g = min(g, need[k - 1], need[k] if k < count else 1.0)
+            bounds[k] = g
+        # Snap the tail of the release so the idle fast path comes back
+        self.gain = 1.0 if bounds[-1] > 0.999 else bounds[-1]
+
+        positions = np.append(starts, frames).astype(np.float64)
+        gains = np.interp(np.arange(frames), positions, bounds).astype(np.float32)
+        view *= gains[:, None]
+        np.clip(view, -1.0, 1.0, out=view)
+        if bounds.min() < 1.0:
+            self.limited += 1
@@ -0,0 +1,134 @@
+"""
+XOR parity forward error correction for UDP streams.
+
+After every group of N data packets the sender adds one parity packet: the
+usual 12-byte header with FLAG_FEC set, the seq and timestamp of the
+group's first packet, and as payload
+
+    u8 N, then N x (u16 length, u8 flags, i16 timestamp offset in ms),
+    then the XOR of the N payloads (each zero-padded to the longest).
+
+Any single packet lost from a group is rebuilt from the parity and the
+other N-1, header fields included. Parity is computed over the plaintext
+packets, so it works the same with encryption (the parity packet is then
+encrypted like any other) and with Opus payloads.
+"""
+import struct
+
+import numpy as np
+
+import codec
+
+MEMBER = struct.Struct('>HBh')
+
+
+def build_parity(packets):
+    """Parity packet (header included) for [(seq, flags, timestamp_ms, payload), ...]."""
+    first_seq, _, first_ts, _ = packets[0]
+    size = max(len(p[3]) for p in packets)
+    acc = np.zeros(size, dtype=np.uint8)
+    meta = [bytes([len(packets)])]
+    for seq, flags, ts, payload in packets:
+        meta.append(MEMBER.pack(len(payload), flags, ts - first_ts))
+        acc[:len(payload)] ^= np.frombuffer(payload, dtype=np.uint8)
+    return codec.pack_header(first_seq, first_ts, codec.FLAG_FEC) + b"".join(meta) + acc.tobytes()
+
+
+class FecDecoder:
+    """
+    Rebuilds lost packets of one sender from its parity packets.
+
+    Data packets are only remembered once the sender has been seen using
+    FEC. A parity packet that arrives while more than one member of its
+    group is still missing (reordering) is kept and retried as the others
+    turn up.
+    """
+
+    WINDOW = 64  # Packets of history kept for recovery
+    RESTART = 1000  # Backwards jump in seq that means the sender restarted
+
+    def __init__(self):
+        self.active = False
+        self.group = 0  # Data packets per parity packet, as last seen
+        self.data = {}  # seq -> (flags, timestamp_ms, payload)
+        self.parities = {}  # first seq -> (timestamp_ms, members, parity)
+        self.recovered = 0
+        self.duplicates = 0  # Rebuilt packets that turned up after all
+        self.newest = None
+
+    def on_data(self, seq, flags, timestamp, payload):
+        """Remember a data packet; returns any packets it made recoverable,
+        or None if this one was already rebuilt (it was late, not lost)."""
+        if not self.active:
+            return []
+        self._check_restart(seq)
+        if seq in self.data:
+            self.duplicates += 1
+            return None
+        self.data[seq] = (flags, timestamp, payload)
+        if self.newest is None or seq > self.newest:
+            self.newest = seq
+        self._prune()
+        out = []
+        for first in range(seq - self.group + 1, seq + 1):
+            if first in self.parities:
+                out.extend(self._try(first))
+        return out
+
+    def on_parity(self, first_seq, timestamp, payload):
+        """Take a parity packet's payload; returns recovered packets as
+        [(seq, flags, timestamp_ms, payload)]."""
+        if len(payload) < 1:
+            return []
+        count = payload[0]
+        meta_end = 1 + count * MEMBER.size
+        if count < 2 or len(payload) < meta_end:
+            return []
+        members = [MEMBER.unpack_from(payload, 1 + k * MEMBER.size) for k in range(count)]
+        self.active = True
+        self.group = count
+        self._check_restart(first_seq)
+        self.parities[first_seq] = (timestamp, members, payload[meta_end:])
+        return self._try(first_seq)
+
+    def _try(self, first):
+        timestamp, members, parity = self.parities[first]
+        missing = [k for k in range(len(members)) if first + k not in self.data]
+        if len(missing) != 1:
+            if not missing:
+                del self.parities[first]  # Nothing was lost
+            return []  # Else wait for more of the group (or give up on prune)
+        del self.parities[first]
+
+        k = missing[0]
+        length, flags, offset = members[k]
+        if length > len(parity):
+            return []
+        acc = np.frombuffer(parity, dtype=np.uint8, count=length).copy()
+        for j in range(len(members)):
+            if j == k:
+                continue
+            other = self.data[first + j][2]
+            n = min(len(other), length)
+            acc[:n] ^= np.frombuffer(other, dtype=np.uint8, count=n)
+        seq = first + k
+        packet = (flags, timestamp + offset, acc.tobytes())
+        self.data[seq] = packet
+        self.recovered += 1
+        return [(seq,) + packet]
+
+    def _check_restart(self, seq):
+        # Like the jitter buffer: a big step back is a new sequence, and
+        # everything kept belongs to the old one (and would make the prune
+        # below discard every new group as stale)
+        if self.newest is not None and self.newest - seq > self.RESTART:
+            self.data.clear()
+            self.parities.clear()
+            self.newest = None
+
+    def _prune(self):
+        if len(self.data) <= 2 * self.WINDOW and len(self.parities) <= self.WINDOW:
+            return
+        oldest = self.newest - self.WINDOW
+        self.data = {s: v for s, v in self.data.items() if s >= oldest}
+        self.parities = {s: v for s, v in self.parities.items() if s >= oldest}
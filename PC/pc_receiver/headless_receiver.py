@@ -1,10 +1,16 @@
 import sys
-import json
 import time
+_T0 = time.perf_counter()  # Startup timings are measured from here
+
+import json
+import importlib
 import threading
 import socket
 import subprocess
 import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
 # Redirect standard output to stderr so that existing print() statements 
 # (logs/errors) don't interfere with our JSON IPC on the original stdout.
@@ -12,24 +18,122 @@ import os
 ipc_out = sys.stdout
 sys.stdout = sys.stderr
 
-try:
-    from audio_stream import AudioReceiver
-except ImportError:
-    # If run from a different CWD, adjust path or handle error
-    sys.stderr.write("Error importing audio_stream. Ensure you run this from the proper directory.\n")
-    sys.exit(1)
+# Heavy modules (numpy, cryptography, PortAudio, COM) are imported by
+# load_modules() on a background thread, after 'ready' has been sent
+AudioReceiver = supported_codecs = crypto = output_sinks = discovery = relay = None
+PrometheusExporter = TelemetryServer = TELEMETRY_VERSION = DeviceRegistry = None
+AudioSyncVolumeControl = None
+
+
+def _ms(t0):
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+def load_modules(timings):
+    """Import the receiver's modules, recording each one's import time in timings."""
+    global AudioReceiver, supported_codecs, crypto, output_sinks, discovery, relay
+    global PrometheusExporter, TelemetryServer, TELEMETRY_VERSION, DeviceRegistry, AudioSyncVolumeControl
+
+    def timed(name):
+        t0 = time.perf_counter()
+        module = importlib.import_module(name)
+        timings[name] = _ms(t0)
+        return module
+
+    try:
+        # audio_stream first: it pulls in numpy and most of the rest
+        AudioReceiver = timed("audio_stream").AudioReceiver
+        supported_codecs = timed("codec").supported_codecs
+        crypto = timed("crypto")
+        output_sinks = timed("output_sinks")
+        PrometheusExporter = timed("metrics").PrometheusExporter
+        telemetry = timed("telemetry")
+        TelemetryServer, TELEMETRY_VERSION = telemetry.TelemetryServer, telemetry.VERSION
+        DeviceRegistry = timed("device_registry").DeviceRegistry
+        discovery = timed("discovery")
+        relay = timed("relay")
+    except ImportError:
+        # If run from a different CWD, adjust path or handle error
+        sys.stderr.write("Error importing audio_stream. Ensure you run this from the proper directory.\n")
+        return False
+
+    try:
+        AudioSyncVolumeControl = timed("volume_control").AudioSyncVolumeControl
+    except ImportError:
+        sys.stderr.write("Volume control module missing.\n")
+        AudioSyncVolumeControl = None
+    return True
+
+# Request id of the command being handled; echoed as "id" on every event it causes
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# Commands answered even before warm-up has finished
+EARLY_COMMANDS = {"ping"}
+# Commands cheap enough to run directly on the event loop
+# (volume commands only queue work for the volume controller's own thread)
+INLINE_COMMANDS = {"ping", "get_devices", "select_stream", "set_stream_gain", "set_gain", "set_mute",
+                   "volume_up", "volume_down", "mute_toggle"}
+# Start/stop run one at a time, in order; a later one makes queued ones obsolete
+RECEIVER_COMMANDS = {"start", "stop", "reconfigure", "capture", "relay"}
 
-try:
-    from volume_control import AudioSyncVolumeControl
-except ImportError:
-    sys.stderr.write("Volume control module missing.\n")
-    AudioSyncVolumeControl = None
 
 class HeadlessController:
     def __init__(self):
         self.receiver = None
         self.monitor_running = False
         self.monitor_thread = None
+        self.metrics_interval = 2.0  # Seconds between 'metrics' events
+        self.exporter = None  # Optional Prometheus endpoint
+        self.telemetry = None  # Optional binary stats/levels channel
+        self.discovery = None  # LAN beacons/probe answers while a receiver runs
+        self.discoverable = True
+        # In-process master volume; outlives receiver restarts
+        self.master_gain = 1.0
+        self.master_muted = False
+        self.ipc_lock = threading.Lock()
+        self._last_volume = (None, None)
+        # Worker threads for blocking commands (see dispatch)
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ipc")
+        self.receiver_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ipc-receiver")
+        self.receiver_generation = 0
+        # Created by warm_up once the modules are loaded
+        self.devices = None  # Cached output devices, rescanned in the background for hot-plug
+        self.vol_control = None
+        self.warm = None  # asyncio.Event, set when commands can run (see serve)
+        self.startup = {}  # Timing breakdown, sent as the 'startup' event
+
+    def warm_up(self):
+        """
+        Everything slow about starting, done after 'ready' so the UI is
+        never kept waiting on it: imports, PortAudio initialisation, the
+        crypto backend, the first device scan and the volume controller.
+        """
+        t0 = time.perf_counter()
+        imports = {}
+        if not load_modules(imports):
+            self.send_event("error", "Receiver modules failed to load")
+            os._exit(1)
+        self.startup["imports_ms"] = imports
+
+        t = time.perf_counter()
+        try:
+            output_sinks.portaudio_engine()
+        except Exception as e:
+            sys.stderr.write(f"PortAudio warm-up failed: {e}\n")
+        self.startup["portaudio_ms"] = _ms(t)
+
+        t = time.perf_counter()
+        try:
+            crypto.warm_up()
+        except Exception as e:
+            sys.stderr.write(f"Crypto warm-up failed: {e}\n")
+        self.startup["crypto_ms"] = _ms(t)
+
+        # The first scan runs on the registry's thread and reports as 'devices_changed'
+        self.devices = DeviceRegistry(on_change=lambda devs: self.send_event("devices_changed", devs))
+        self.devices.start()
+
+        t = time.perf_counter()
         if AudioSyncVolumeControl:
             # Check if running as a bundled executable (Prod) or script (Dev)
             if getattr(sys, 'frozen', False):
@@ -37,49 +141,85 @@ class HeadlessController:
                 target = "AudioSync Audio Service.exe"
             else:
                 target = "python.exe"
-            self.vol_control = AudioSyncVolumeControl(target_process=target)
-        else:
-            self.vol_control = None
+            self.vol_control = AudioSyncVolumeControl(target_process=target,
+                                                      on_change=self._volume_changed)
+        self.startup["volume_ms"] = _ms(t)
+        self.startup["warm_up_ms"] = _ms(t0)
 
     def send_event(self, event_type, data):
-        """Send a JSON event to the parent process."""
+        """Send a JSON event to the parent process (from any thread)."""
         try:
-            message = json.dumps({"type": event_type, "data": data})
-            ipc_out.write(message + "\n")
-            ipc_out.flush()
+            event = {"type": event_type, "data": data}
+            request_id = current_request.get()
+            if request_id is not None:
+                event["id"] = request_id
+            # NaN/Infinity are not JSON: the UI's JSON.parse would drop the event
+            message = json.dumps(event, allow_nan=False)
+            with self.ipc_lock:
+                ipc_out.write(message + "\n")
+                ipc_out.flush()
         except Exception as e:
             sys.stderr.write(f"Error sending event: {e}\n")
 
+    def _volume_changed(self, volume, muted):
+        # Session volume changed (hotkeys or the Windows mixer)
+        if volume != self._last_volume[0]:
+            self.send_event("volume_level", volume)
+        if muted != self._last_volume[1] and self._last_volume[1] is not None:
+            self.send_event("mute_state", muted)
+        self._last_volume = (volume, muted)
+
     def status_callback(self, message):
         self.send_event("status", message)
 
-    def get_devices(self):
-        try:
-            temp = AudioReceiver()
-            devices = temp.get_output_devices()
-            temp.stop()
-            self.send_event("devices", devices)
-        except Exception as e:
-            self.send_event("error", f"Error listing devices: {str(e)}")
+    def get_devices(self, refresh=False):
+        # Never enumerates on the IPC thread: answers from the cache, and a
+        # rescan (or the first scan, if still running) reports through
+        # 'devices_changed' when the list differs
+        if refresh or not self.devices.loaded:
+            self.devices.request_refresh()
+        if self.devices.loaded:
+            # [{'id', 'index', 'name', 'host_api', 'channels', 'default_rate'}, ...]
+            self.send_event("devices", self.devices.snapshot())
+
+    def resolve_device(self, device_id):
+        """PortAudio index for a registry id; None (default output) if it is gone."""
+        index = self.devices.resolve(device_id)
+        if index is None:
+            # Maybe plugged in since the last scan; nothing is playing now
+            self.devices.scan(refresh=True)
+            index = self.devices.resolve(device_id)
+        if index is None:
+            self.send_event("status", "Selected output device not found, using the default output")
+        return index
 
-    def start_receiver(self, port, device_index=None, buffer_ms=100, protocol='udp', password=None):
+    def start_receiver(self, port, device_index=None, buffer_ms=100, protocol='udp', password=None, playback='callback',
+                       drift_compensation=True, sinks=None, device_id=None, multicast_group=None):
         if self.receiver and self.receiver.running:
             self.stop_receiver()
         
         try:
-            self.receiver = AudioReceiver(port=port, callback_status=self.status_callback)
+            if device_id is not None:
+                device_index = self.resolve_device(device_id)
+
+            self.receiver = AudioReceiver(port=port, callback_status=self.status_callback,
+                                          callback_event=self.send_event)
             
-            # Set buffer size (approx 10ms per packet)
-            # buffer_ms / 10 = queue size
-            queue_size = max(1, int(buffer_ms / 10))
-            self.receiver.max_queue_size = queue_size
+            # Buffer size is the ceiling for the adaptive jitter buffer
+            self.receiver.buffer_ms = max(10, buffer_ms)
+            self.receiver.drift_compensation = drift_compensation
+            self.receiver.multicast_group = multicast_group
+            self.receiver.set_master_gain(self.master_gain)
+            self.receiver.set_master_mute(self.master_muted)
             
-            self.receiver.start(device_index=device_index, protocol=protocol, password=password)
+            self.receiver.start(device_index=device_index, protocol=protocol, password=password,
+                                playback=playback, sinks=sinks)
             
             if self.receiver.running:
                 self.monitor_running = True
                 self.monitor_thread = threading.Thread(target=self._stats_loop, daemon=True)
                 self.monitor_thread.start()
+                self._announce(port, protocol, bool(password))
                 self.send_event("state", "running")
             else:
                 self.send_event("error", "Failed to start receiver (unknown reason)")
@@ -87,116 +227,383 @@ class HeadlessController:
         except Exception as e:
             self.send_event("error", f"Exception starting receiver: {str(e)}")
 
+    def set_metrics_port(self, port):
+        """Serve Prometheus text on 127.0.0.1:<port>/metrics (0 turns it off)."""
+        if self.exporter and self.exporter.port == port:
+            return
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+        if port:
+            try:
+                self.exporter = PrometheusExporter(port, self._current_metrics)
+                self.exporter.start()
+                self.send_event("status", f"Metrics on http://127.0.0.1:{port}/metrics")
+            except OSError as e:
+                self.exporter = None
+                self.send_event("error", f"Metrics endpoint failed: {e}")
+
+    def set_telemetry(self, rate_hz):
+        """Binary stats + level frames at rate_hz on a local socket (0 turns it off)."""
+        if self.telemetry and self.telemetry.rate_hz == rate_hz:
+            self.send_event("telemetry", self._telemetry_info())
+            return
+        if self.telemetry:
+            self.telemetry.stop()
+            self.telemetry = None
+        if rate_hz:
+            try:
+                self.telemetry = TelemetryServer(lambda: self.receiver, rate_hz)
+                self.telemetry.start()
+            except OSError as e:
+                self.telemetry = None
+                self.send_event("error", f"Telemetry channel failed: {e}")
+                return
+        self.send_event("telemetry", self._telemetry_info())
+
+    def _telemetry_info(self):
+        if not self.telemetry:
+            return {"port": None}
+        return {"port": self.telemetry.port, "rate_hz": self.telemetry.rate_hz,
+                "version": TELEMETRY_VERSION}
+
+    def _current_metrics(self):
+        receiver = self.receiver
+        if receiver and receiver.running:
+            return receiver.get_metrics(consumer="prometheus")
+        return {}
+
+    def set_relay(self, spec):
+        """Forward the active sender to other receivers, or stop (no targets)."""
+        if not (self.receiver and self.receiver.running):
+            self.send_event("error", "Receiver is not running")
+            return
+        targets = spec.get("targets") or []
+        if not targets:
+            self.receiver.stop_relay()
+            self.send_event("relay", None)
+            return
+        try:
+            targets = [relay.parse_target(t, self.receiver.port) for t in targets]
+            self.receiver.start_relay(targets, delay_ms=int(spec.get("delay_ms", 150)),
+                                      password=spec.get("password"), ttl=int(spec.get("ttl", 1)))
+        except (OSError, ValueError) as e:
+            self.send_event("error", f"Relay failed: {e}")
+            return
+        self.send_event("relay", self.receiver.relay.get_stats())
+
+    def set_capture(self, spec):
+        """Start (spec is a path or {path, max_mb, files}) or stop a packet capture."""
+        if not (self.receiver and self.receiver.running):
+            self.send_event("error", "Receiver is not running")
+            return
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        path = spec.get("path")
+        if not path:
+            self.receiver.stop_capture()
+            self.send_event("capture", None)
+            return
+        try:
+            self.receiver.start_capture(path, max_mb=float(spec.get("max_mb", 64)),
+                                        files=int(spec.get("files", 4)))
+        except OSError as e:
+            self.send_event("error", f"Packet capture failed: {e}")
+            return
+        self.send_event("capture", {"path": path})
+
+    def reconfigure_receiver(self, payload):
+        """Apply the settings in payload to the running receiver, in place."""
+        if not (self.receiver and self.receiver.running):
+            self.send_event("error", "Receiver is not running")
+            return
+        changes = {k: payload[k] for k in ("buffer_ms", "password", "key_grace_s", "sinks", "crossfade_ms")
+                   if k in payload}
+        if "gain" in payload:
+            self.master_gain = changes["gain"] = max(0.0, min(4.0, float(payload["gain"])))
+        if "muted" in payload:
+            self.master_muted = changes["muted"] = bool(payload["muted"])
+        if "device_id" in payload:
+            changes["device_index"] = self.resolve_device(payload["device_id"]) if payload["device_id"] else None
+        elif "device_index" in payload:
+            changes["device_index"] = None if payload["device_index"] == -1 else payload["device_index"]
+        try:
+            applied = self.receiver.reconfigure(**changes)
+        except Exception as e:
+            self.send_event("error", f"Reconfigure failed: {e}")
+            return
+        if "password" in changes and self.discovery:
+            self.discovery.update(encrypted=bool(changes["password"]))
+        self.send_event("reconfigured", applied)
+
+    def _announce(self, port, protocol, encrypted):
+        # Let phones find (and, after roaming, re-find) this receiver
+        if not self.discoverable:
+            return
+        try:
+            self.discovery = discovery.DiscoveryService(port, protocol, encrypted, supported_codecs())
+            self.discovery.start()
+        except OSError as e:
+            # Another receiver on this machine already owns the discovery port
+            self.discovery = None
+            self.send_event("status", f"LAN discovery unavailable: {e}")
+
     def stop_receiver(self):
         self.monitor_running = False
+        if self.discovery:
+            self.discovery.stop()
+            self.discovery = None
         if self.receiver:
             self.receiver.stop()
             self.receiver = None
+            # Hot-plug checks are skipped while playing; catch up now
+            self.devices.request_refresh()
         self.send_event("state", "stopped")
 
     def _stats_loop(self):
+        last_metrics = time.monotonic()
+        last_stats = None
+        last_stats_sent = 0.0
         while self.monitor_running and self.receiver and self.receiver.running:
             try:
                 stats = self.receiver.get_stats()
-                # stats: {'received', 'lost', 'queue'}
-                self.send_event("stats", stats)
-                time.sleep(0.5)
+                # stats: {'received', 'lost', 'queue', 'jitter_ms', 'delay_ms', 'buffered_ms', ...,
+                #         'active_stream', 'streams': [per-sender stats]}
+                # Coalesced: an idle receiver repeats itself only every few seconds
+                if stats != last_stats or time.monotonic() - last_stats_sent >= 5.0:
+                    self.send_event("stats", stats)
+                    last_stats = stats
+                    last_stats_sent = time.monotonic()
+                # metrics: {'gauges', 'counters', 'drops', 'histograms', 'cpu', 'streams'}
+                if time.monotonic() - last_metrics >= self.metrics_interval:
+                    last_metrics = time.monotonic()
+                    self.send_event("metrics", self.receiver.get_metrics(consumer="ipc"))
             except Exception as e:
                 sys.stderr.write(f"Stats loop error: {e}\n")
+            time.sleep(0.5)
 
     def _get_lan_ip(self):
         """Get the best LAN IP address by checking all interfaces."""
-        try:
-            # Method 1: Connect to external address (doesn't actually send data)
-            # This usually picks the right interface
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.settimeout(0)
-            try:
-                s.connect(('10.254.254.254', 1))  # Dummy address
-                ip = s.getsockname()[0]
-            except Exception:
-                ip = '127.0.0.1'
-            finally:
-                s.close()
-            
-            # Check if we got a private IP
-            if ip.startswith('192.168.') or ip.startswith('10.') or ip.startswith('172.'):
-                return ip
-            
-            # Method 2: Fallback to hostname resolution
-            hostname = socket.gethostname()
-            for info in socket.getaddrinfo(hostname, None, socket.AF_INET):
-                addr = info[4][0]
-                if addr.startswith('192.168.') or addr.startswith('10.') or addr.startswith('172.'):
-                    return addr
-            
-            return ip  # Return whatever we got
-        except Exception:
-            return '127.0.0.1'
+        return discovery.lan_ip()
 
-    def process_command(self, cmd_line):
+    def execute(self, command, payload):
         try:
-            if not cmd_line: return
-            msg = json.loads(cmd_line)
-            command = msg.get("command")
-            payload = msg.get("payload", {})
-            
             if command == "get_devices":
-                self.get_devices()
+                self.get_devices(bool(payload.get("refresh", False)))
             elif command == "start":
                 port = int(payload.get("port", 50005))
                 dev_idx = payload.get("device_index")
                 if dev_idx == -1: dev_idx = None # Default
+                device_id = payload.get("device_id")  # Stable id from 'devices'; wins over device_index
                 buffer_ms = int(payload.get("buffer_ms", 100))
                 protocol = payload.get("protocol", "udp")
                 password = payload.get("password")
-                self.start_receiver(port, dev_idx, buffer_ms, protocol, password)
+                playback = payload.get("playback", "callback")
+                drift_compensation = bool(payload.get("drift_compensation", True))
+                self.discoverable = bool(payload.get("discoverable", True))
+                if "metrics_port" in payload:
+                    self.set_metrics_port(int(payload["metrics_port"] or 0))
+                if "telemetry_hz" in payload:
+                    self.set_telemetry(int(payload["telemetry_hz"] or 0))
+                if "remember_key" in payload:
+                    # Keep derived keys on disk (DPAPI-sealed) so restarts skip PBKDF2
+                    if payload["remember_key"]:
+                        crypto.key_cache.enable_persistence(crypto.default_cache_path())
+                    else:
+                        crypto.key_cache.disable_persistence()
+                # e.g. ["device", "file:C:/rec/session.wav"]; ["null", ...] for no audio hardware
+                sinks = payload.get("sinks")
+                # Join the group a relay multicasts to, e.g. "239.255.77.77"
+                multicast_group = payload.get("multicast_group")
+                self.start_receiver(port, dev_idx, buffer_ms, protocol, password, playback,
+                                    drift_compensation, sinks, device_id, multicast_group)
+                if payload.get("capture"):
+                    self.set_capture(payload["capture"])
+                if payload.get("relay"):
+                    self.set_relay(payload["relay"])
             elif command == "stop":
                 self.stop_receiver()
+            elif command == "reconfigure":
+                # Same keys as start (buffer_ms, device_id, sinks, password) plus
+                # gain, muted, crossfade_ms and key_grace_s; no restart, no gap
+                self.reconfigure_receiver(payload)
+            elif command == "relay":
+                # {"targets": ["192.168.1.20", "192.168.1.21:50005"] or ["239.255.77.77"],
+                #  "delay_ms": 150, "password": "..."}; no targets stops relaying
+                self.set_relay(payload)
+            elif command == "capture":
+                # {"path": "C:/diag/session.ascap", "max_mb": 64, "files": 4}; no path stops
+                self.set_capture(payload)
+            elif command == "set_telemetry":
+                self.set_telemetry(int(payload.get("rate_hz", 30) or 0))
+            elif command == "select_stream":
+                stream_id = payload.get("stream_id")
+                if self.receiver and self.receiver.select_stream(stream_id):
+                    self.send_event("active_stream", stream_id)
+                else:
+                    self.send_event("error", f"Unknown stream: {stream_id}")
+            elif command == "set_stream_gain":
+                stream_id = payload.get("stream_id")
+                if not (self.receiver and self.receiver.set_stream_gain(stream_id, payload.get("gain", 1.0))):
+                    self.send_event("error", f"Unknown stream: {stream_id}")
+            elif command == "set_gain":
+                # Ramped in the mixer: instant and click-free, unlike the Windows session volume
+                stream_id = payload.get("stream_id")
+                gain = payload.get("gain", 1.0)
+                if stream_id is None:
+                    self.master_gain = max(0.0, min(4.0, float(gain)))
+                    if self.receiver:
+                        self.receiver.set_master_gain(self.master_gain)
+                    self.send_event("gain", {"gain": self.master_gain})
+                elif self.receiver and self.receiver.set_stream_gain(stream_id, gain):
+                    self.send_event("gain", {"stream_id": stream_id, "gain": max(0.0, min(4.0, float(gain)))})
+                else:
+                    self.send_event("error", f"Unknown stream: {stream_id}")
+            elif command == "set_mute":
+                stream_id = payload.get("stream_id")
+                muted = payload.get("muted")
+                if stream_id is None:
+                    self.master_muted = (not self.master_muted) if muted is None else bool(muted)
+                    if self.receiver:
+                        self.receiver.set_master_mute(self.master_muted)
+                    self.send_event("mute", {"muted": self.master_muted})
+                else:
+                    stream = self.receiver.streams.get(stream_id) if self.receiver else None
+                    if stream is None:
+                        self.send_event("error", f"Unknown stream: {stream_id}")
+                    else:
+                        muted = (not stream.ramp.muted) if muted is None else bool(muted)
+                        self.receiver.set_stream_mute(stream_id, muted)
+                        self.send_event("mute", {"stream_id": stream_id, "muted": muted})
             elif command == "get_info":
                 try:
                     hostname = socket.gethostname()
                     ip = self._get_lan_ip()
-                    self.send_event("info", {"ip": ip, "hostname": hostname})
+                    self.send_event("info", {"ip": ip, "hostname": hostname, "codecs": supported_codecs()})
                 except:
                     self.send_event("info", {"ip": "127.0.0.1", "hostname": "Unknown"})
             elif command == "ping":
                 self.send_event("pong", time.time())
+            # Coalesced and applied on the volume controller's thread; the
+            # result comes back through _volume_changed
             elif command == "volume_up":
                 if self.vol_control:
-                    vol = self.vol_control.change_volume(0.05)
-                    if vol is not None:
-                        self.send_event("volume_level", vol)
+                    self.vol_control.change_volume(0.05)
             elif command == "volume_down":
                 if self.vol_control:
-                    vol = self.vol_control.change_volume(-0.05)
-                    if vol is not None:
-                        self.send_event("volume_level", vol)
+                    self.vol_control.change_volume(-0.05)
             elif command == "mute_toggle":
                 if self.vol_control:
-                    muted = self.vol_control.toggle_mute()
-                    if muted is not None:
-                        self.send_event("mute_state", muted)
+                    self.vol_control.toggle_mute()
                 
-        except json.JSONDecodeError:
-            sys.stderr.write(f"Invalid JSON received: {cmd_line}\n")
         except Exception as e:
             self.send_event("error", f"Command processing error: {str(e)}")
 
-    def run(self):
-        sys.stderr.write("Headless Receiver Started. Waiting for input...\n")
-        self.send_event("ready", True)
-        
-        while True:
-            try:
-                line = sys.stdin.readline()
+    async def dispatch(self, msg):
+        """
+        Run one command without holding up the ones after it. Cheap commands
+        run inline; start/stop/reconfigure go through a single ordered lane,
+        skipping any that a newer start/stop has superseded; everything else uses the
+        worker pool. With an "id" in the request, every event it causes
+        carries that id, followed by an 'ack'.
+        """
+        command = msg.get("command")
+        payload = msg.get("payload") or {}
+        current_request.set(msg.get("id"))
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        cancelled = False
+
+        if command not in EARLY_COMMANDS and not self.warm.is_set():
+            # Queued until warm-up is done; waiters resume in arrival order
+            await self.warm.wait()
+
+        if command in INLINE_COMMANDS:
+            self.execute(command, payload)
+        elif command in RECEIVER_COMMANDS:
+            # Reconfigures, captures and relays queue in the same lane but never supersede anything
+            if command in ("start", "stop"):
+                self.receiver_generation += 1
+            generation = self.receiver_generation
+
+            def run_receiver_command():
+                if generation != self.receiver_generation:
+                    return True  # A later start/stop is queued; it wins
+                self.execute(command, payload)
+                return False
+
+            cancelled = await loop.run_in_executor(self.receiver_lane, ctx.run, run_receiver_command)
+        else:
+            await loop.run_in_executor(self.pool, ctx.run, self.execute, command, payload)
+
+        if msg.get("id") is not None:
+            self.send_event("ack", {"command": command, "cancelled": cancelled,
+                                    "ms": round((time.perf_counter() - t0) * 1000.0, 2)})
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+        self.warm = asyncio.Event()
+
+        def warm_up():
+            self.warm_up()
+            loop.call_soon_threadsafe(self.warm.set)
+            self.send_event("startup", self.startup)
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+        def read_stdin():
+            # Blocking reads stay off the loop (stdin pipes can't be awaited on Windows)
+            while True:
+                try:
+                    line = sys.stdin.readline()
+                except Exception:
+                    line = ""
+                loop.call_soon_threadsafe(lines.put_nowait, line)
                 if not line:
                     break
-                self.process_command(line.strip())
-            except KeyboardInterrupt:
+
+        threading.Thread(target=read_stdin, daemon=True).start()
+        pending = set()
+        while True:
+            line = await lines.get()
+            if not line:
                 break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                sys.stderr.write(f"Invalid JSON received: {line}\n")
+                continue
+            task = asyncio.ensure_future(self.dispatch(msg))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending, timeout=5.0)
+
+    def run(self):
+        sys.stderr.write("Headless Receiver Started. Waiting for input...\n")
+        # Nothing heavy has been imported yet; see warm_up
+        self.send_event("ready", True)
+        self.startup["ready_ms"] = _ms(_T0)
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
         
         self.stop_receiver()
+        if self.devices:
+            self.devices.stop()
+        if self.telemetry:
+            self.telemetry.stop()
+        self.pool.shutdown(wait=False)
+        self.receiver_lane.shutdown(wait=False)
+        if self.vol_control:
+            self.vol_control.close()
 
 if __name__ == "__main__":
     controller = HeadlessController()
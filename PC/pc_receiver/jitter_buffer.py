@@ -0,0 +1,334 @@
+import collections
+import threading
+import time
+
+
+class JitterBuffer:
+    """
+    Adaptive jitter buffer driven by the sender timestamps in the packet header.
+
+    Every packet's transit time (local arrival - sender timestamp) is tracked.
+    The smallest transit in the recent window is the network floor; how far a
+    packet arrives behind that floor is its jitter. The playout delay targets a
+    percentile of that jitter, so a quiet network plays out with a few ms of
+    buffering while a congested one grows the buffer only as far as it needs.
+
+    Packets are keyed by sequence number, so reordered datagrams are played in
+    order. A packet still missing when its slot comes up is synthesized by the
+    optional concealer; if it shows up afterwards it is dropped as late.
+    """
+
+    def __init__(self, max_delay_ms=100, min_delay_ms=10, bytes_per_ms=192,
+                 percentile=0.98, window=500, headroom_ms=5, max_packets=None,
+                 concealer=None, max_conceal=3, lossless=False, clock=time.monotonic):
+        self.max_delay_ms = max_delay_ms
+        self.min_delay_ms = min(min_delay_ms, max_delay_ms)
+        self.bytes_per_ms = bytes_per_ms  # 48000 Hz * 2 ch * 2 bytes / 1000
+        self.percentile = percentile
+        self.headroom_ms = headroom_ms
+        self.max_packets = max_packets  # Optional hard cap (TCP keeps this tiny)
+        self.concealer = concealer
+        self.max_conceal = max_conceal  # Consecutive concealed packets before giving up
+        self.lossless = lossless  # Transport never drops: skip gaps rather than conceal them
+        self.clock = clock  # Seconds; a replay substitutes the capture's clock
+
+        self.lock = threading.Lock()
+        # Reorder window: seq -> (timestamp_ms, payload, duration_ms)
+        self.packets = {}
+        self.buffered_ms = 0.0
+        self.next_seq = None  # Next sequence number due for playout
+
+        # Jitter measurement
+        self.transits = collections.deque(maxlen=window)
+        self.last_transit = None
+        self.jitter_ms = 0.0  # RFC 3550 interarrival jitter estimate
+        # Until there is history, start halfway so priming can't overflow
+        self.target_delay_ms = max(self.min_delay_ms, max_delay_ms / 2.0)
+        self._since_retarget = 0
+        # Set by set_schedule: the transit floor is given rather than measured
+        # and the delay is fixed, so packets play at a time agreed with
+        # other receivers (see relay.py)
+        self.fixed_base_ms = None
+
+        # Playout state: 'priming' holds packets until the head is due,
+        # 'playing' releases packets as fast as the output consumes them.
+        self.playing = False
+        self.last_played_ts = None
+        self.last_duration_ms = 0.0
+        self._concealed_run = 0
+
+        # Counters
+        self.underruns = 0
+        self.dropped_overflow = 0
+        self.dropped_late = 0  # Arrived after its slot was played or concealed
+        self.trimmed = 0       # Skipped to pull latency back to the target
+        self.stretched = 0     # Synthesized to push latency up to the target
+        self.concealed = 0
+
+    def _now_ms(self):
+        return self.clock() * 1000.0
+
+    def push(self, seq, timestamp_ms, payload, arrival_ms=None, measure=True):
+        """Queue one packet. Returns False if the packet was discarded.
+        measure=False keeps its arrival time out of the delay estimate
+        (packets rebuilt late from FEC say nothing about the network)."""
+        if arrival_ms is None:
+            arrival_ms = self._now_ms()
+        duration_ms = len(payload) / self.bytes_per_ms
+
+        with self.lock:
+            if measure:
+                transit = arrival_ms - timestamp_ms
+                restarted = self.next_seq is not None and self.next_seq - seq > 1000
+                if restarted or (self.last_transit is not None and abs(transit - self.last_transit) > 1000):
+                    # Sender restarted or its clock stepped: start measuring over
+                    self._reset()
+                if self.last_transit is not None:
+                    d = abs(transit - self.last_transit)
+                    self.jitter_ms += (d - self.jitter_ms) / 16.0
+                self.last_transit = transit
+                self.transits.append(transit)
+
+                # Start from the configured buffer and only adapt once there is
+                # enough history to trust the percentile.
+                self._since_retarget += 1
+                if (len(self.transits) >= 10 and self._since_retarget >= 10
+                        and self.fixed_base_ms is None):
+                    self._retarget()
+
+            # Anything behind the playout point already missed its slot
+            if (self.next_seq is not None and seq < self.next_seq) or seq in self.packets:
+                self.dropped_late += 1
+                return False
+
+            self.packets[seq] = (timestamp_ms, payload, duration_ms)
+            self.buffered_ms += duration_ms
+
+            # Hard ceiling: never hold more than max_delay_ms, nor more than
+            # max_packets unless that many are needed to cover the target
+            # (a fixed schedule may need more than the ceiling)
+            limit = self.max_delay_ms
+            if self.fixed_base_ms is not None:
+                limit = max(limit, self.target_delay_ms + 100)
+            while len(self.packets) > 1:
+                head = min(self.packets)
+                head_ms = self.packets[head][2]
+                over_packets = (self.max_packets and len(self.packets) > self.max_packets
+                                and self.buffered_ms - head_ms >= self.target_delay_ms)
+                if self.buffered_ms <= limit and not over_packets:
+                    break
+                self._drop(head)
+                self.dropped_overflow += 1
+                if self.next_seq is not None:
+                    self.next_seq = max(self.next_seq, head + 1)
+        return True
+
+    def pop(self, now_ms=None, conceal_underrun=False):
+        """
+        Return the next payload due for playout, or None.
+
+        With conceal_underrun the caller is the output device asking for data
+        right now, so an empty buffer is bridged with concealment too.
+        """
+        if now_ms is None:
+            now_ms = self._now_ms()
+
+        with self.lock:
+            if not self.packets:
+                if self.playing and conceal_underrun:
+                    payload = self._conceal()
+                    if payload is not None:
+                        return payload
+                if self.playing:
+                    self.playing = False
+                    self.underruns += 1
+                return None
+
+            base = self._base()
+            if not self.playing:
+                # Hold the head until it has aged by the target delay (and
+                # until there is a delay sample to age it against)
+                if base is None:
+                    return None
+                head = min(self.packets)
+                age = now_ms - self.packets[head][0] - base
+                if age < self.target_delay_ms:
+                    return None
+                self.playing = True
+                self.next_seq = head
+
+            # Skip ahead if we have fallen too far behind the schedule (e.g. a
+            # burst after a stall) and what remains still covers the target.
+            # One packet per pop keeps it smooth.
+            head = min(self.packets)
+            head_ts, _, head_ms = self.packets[head]
+            tolerance = max(head_ms, 20.0)
+            if base is None:
+                pass  # No delay sample since a reset: just play in order
+            elif len(self.packets) > 1 and self.buffered_ms - head_ms > self.target_delay_ms:
+                if now_ms - head_ts - base > self.target_delay_ms + tolerance:
+                    self._drop(head)
+                    self.trimmed += 1
+                    self.next_seq = max(self.next_seq, head + 1)
+            elif self.next_seq in self.packets and self.concealer and not self._concealed_run:
+                # The opposite case: the network floor turned out lower than
+                # when we primed, so we play too early and packets run late.
+                # Stretch by one synthesized packet to move the playout point.
+                age = now_ms - self.packets[self.next_seq][0] - base
+                if age < self.target_delay_ms - tolerance:
+                    payload = self.concealer.conceal()
+                    if payload is not None:
+                        self._concealed_run += 1
+                        self.stretched += 1
+                        return payload
+
+            entry = self.packets.pop(self.next_seq, None)
+            if entry is None:
+                # The slot is due but its packet is missing while later ones
+                # are already here: treat it as lost.
+                payload = None if self.lossless else self._conceal()
+                if payload is not None:
+                    return payload
+                self.next_seq = min(self.packets)
+                entry = self.packets.pop(self.next_seq)
+
+            timestamp_ms, payload, duration_ms = entry
+            self.buffered_ms -= duration_ms
+            self.next_seq += 1
+            self.last_played_ts = timestamp_ms
+            self.last_duration_ms = duration_ms
+            if self.concealer:
+                if self._concealed_run:
+                    payload = self.concealer.recover(payload)
+                self.concealer.remember(payload)
+            self._concealed_run = 0
+            return payload
+
+    def _conceal(self):
+        # Synthesize the packet for next_seq. Caller holds the lock.
+        if not self.concealer or self._concealed_run >= self.max_conceal:
+            return None
+        payload = self.concealer.conceal()
+        if payload is None:
+            return None
+        self._concealed_run += 1
+        self.concealed += 1
+        self.next_seq += 1
+        if self.last_played_ts is not None:
+            self.last_played_ts += self.last_duration_ms
+        return payload
+
+    def time_until_due(self, now_ms=None):
+        """Seconds until the head packet becomes playable, or None if empty
+        (or no delay has been measured yet)."""
+        if now_ms is None:
+            now_ms = self._now_ms()
+        with self.lock:
+            if not self.packets:
+                return None
+            if self.playing:
+                return 0.0
+            base = self._base()
+            if base is None:
+                return None
+            age = now_ms - self.packets[min(self.packets)][0] - base
+            return max(0.0, (self.target_delay_ms - age) / 1000.0)
+
+    def schedule_error_ms(self, now_ms, queued_ms, delay_ms):
+        """
+        On a fixed schedule: how late (negative: early) the audio reaching
+        the listener at now_ms is against timestamp + base + delay_ms, given
+        queued_ms of it played out of this buffer but not heard yet. None
+        when not on a schedule or not playing.
+        """
+        base = self.fixed_base_ms
+        played = self.last_played_ts
+        if base is None or not self.playing or played is None:
+            return None
+        position = played + self.last_duration_ms - queued_ms
+        return now_ms - position - base - delay_ms
+
+    def _base(self):
+        # Transit the playout delay is measured from. None until the first
+        # measured packet since a reset. Caller holds the lock.
+        if self.fixed_base_ms is not None:
+            return self.fixed_base_ms
+        return min(self.transits) if self.transits else None
+
+    def _drop(self, seq):
+        _, _, duration_ms = self.packets.pop(seq)
+        self.buffered_ms -= duration_ms
+
+    def _retarget(self):
+        self._since_retarget = 0
+        if not self.transits:
+            return
+        base = min(self.transits)
+        delays = sorted(t - base for t in self.transits)
+        idx = min(len(delays) - 1, int(len(delays) * self.percentile))
+        target = delays[idx] + self.headroom_ms
+        self.target_delay_ms = max(self.min_delay_ms, min(self.max_delay_ms, target))
+
+    def set_schedule(self, base_ms, delay_ms):
+        """
+        Play each packet at timestamp + base_ms + delay_ms on our clock, no
+        matter the jitter measured here. base_ms None returns to adaptive
+        playout.
+        """
+        with self.lock:
+            self.fixed_base_ms = base_ms
+            if base_ms is None:
+                if len(self.transits) >= 10:
+                    self._retarget()
+            else:
+                self.target_delay_ms = delay_ms
+
+    def set_max_delay(self, max_delay_ms):
+        """New buffer ceiling, applied in place (overflow trims down to it)."""
+        with self.lock:
+            self.max_delay_ms = max_delay_ms
+            self.min_delay_ms = min(self.min_delay_ms, max_delay_ms)
+            if self.fixed_base_ms is None:
+                self.target_delay_ms = max(self.min_delay_ms, min(max_delay_ms, self.target_delay_ms))
+
+    def set_min_delay(self, min_delay_ms):
+        """Raise (or lower) the delay floor, e.g. to leave time for FEC recovery."""
+        with self.lock:
+            self.min_delay_ms = min(min_delay_ms, self.max_delay_ms)
+            if self.fixed_base_ms is None:
+                self.target_delay_ms = max(self.min_delay_ms, self.target_delay_ms)
+
+    def _reset(self):
+        self.packets.clear()
+        self.buffered_ms = 0.0
+        self.next_seq = None
+        self.transits.clear()
+        self.last_transit = None
+        self.playing = False
+        self.last_played_ts = None
+        self._concealed_run = 0
+
+    def clear(self):
+        with self.lock:
+            self.packets.clear()
+            self.buffered_ms = 0.0
+            self.next_seq = None
+            self.playing = False
+            self.last_played_ts = None
+            self._concealed_run = 0
+
+    def __len__(self):
+        return len(self.packets)
+
+    def get_stats(self):
+        return {
+            "jitter_ms": round(self.jitter_ms, 2),
+            "delay_ms": round(self.target_delay_ms, 1),
+            "buffered_ms": round(self.buffered_ms, 1),
+            "underruns": self.underruns,
+            "concealed": self.concealed,
+            "late": self.dropped_late,
+            "trimmed": self.trimmed,
+            "stretched": self.stretched,
+            "dropped_overflow": self.dropped_overflow,
+        }
@@ -0,0 +1,170 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket upper bounds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+DURATION_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 50, 100)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, cheap enough to observe on the audio threads
+    (one bisect and three additions). Each histogram has a single writer
+    thread; readers only take snapshots.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile. None if empty, or
+        if the quantile is past the last bound (JSON has no infinity).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        cumulative = []
+        seen = 0
+        for n in self.counts:
+            seen += n
+            cumulative.append(seen)
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "le": list(self.bounds) + ["+Inf"],
+            "buckets": cumulative,
+        }
+
+
+class ThreadCpu:
+    """
+    CPU time per named thread. Each thread calls mark() from its own loop
+    (time.thread_time only sees the calling thread); snapshot() turns the
+    totals into a utilisation since the same consumer's previous snapshot,
+    so the IPC stats loop and a Prometheus scrape don't shorten each
+    other's intervals.
+    """
+
+    def __init__(self):
+        self.cpu_s = {}
+        self._created = time.monotonic()
+        self._baselines = {}  # consumer -> (wall, {name: cpu_s})
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        self.cpu_s[name] = time.thread_time()
+
+    def snapshot(self, consumer="default"):
+        now = time.monotonic()
+        with self._lock:
+            last_wall, last = self._baselines.get(consumer, (self._created, {}))
+            current = dict(self.cpu_s)
+            self._baselines[consumer] = (now, current)
+        wall = max(now - last_wall, 1e-6)
+        out = {}
+        for name, cpu in current.items():
+            used = cpu - last.get(name, cpu)
+            out[name] = {"cpu_s": round(cpu, 3), "percent": round(100.0 * used / wall, 1)}
+        return out
+
+
+def _labels(**labels):
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}" if inner else ""
+
+
+def _histogram_lines(name, snap, **labels):
+    lines = []
+    for le, n in zip(snap["le"], snap["buckets"]):
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {n}")
+    lines.append(f"{name}_sum{_labels(**labels)} {snap['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {snap['count']}")
+    return lines
+
+
+def render_prometheus(metrics, prefix="audiosync"):
+    """Prometheus text exposition of a receiver metrics snapshot."""
+    lines = []
+    for name, value in metrics.get("gauges", {}).items():
+        if value is not None:
+            lines.append(f"{prefix}_{name} {value}")
+    for name, value in metrics.get("counters", {}).items():
+        lines.append(f"{prefix}_{name}_total {value}")
+    for reason, value in metrics.get("drops", {}).items():
+        lines.append(f"{prefix}_dropped_packets_total{_labels(reason=reason)} {value}")
+    for name, snap in metrics.get("histograms", {}).items():
+        lines.extend(_histogram_lines(f"{prefix}_{name}", snap))
+    for thread, cpu in metrics.get("cpu", {}).items():
+        lines.append(f"{prefix}_thread_cpu_seconds_total{_labels(thread=thread)} {cpu['cpu_s']}")
+    for stream in metrics.get("streams", []):
+        sid = stream["id"]
+        for name, value in stream.get("gauges", {}).items():
+            if value is not None:
+                lines.append(f"{prefix}_stream_{name}{_labels(stream=sid)} {value}")
+        for name, snap in stream.get("histograms", {}).items():
+            lines.extend(_histogram_lines(f"{prefix}_stream_{name}", snap, stream=sid))
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    """Serves render_prometheus(provider()) on http://127.0.0.1:<port>/metrics."""
+
+    def __init__(self, port, provider):
+        self.port = port
+        self.provider = provider
+        self.server = None
+
+    def start(self):
+        provider = self.provider
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render_prometheus(provider()).encode()
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Keep scrapes out of the log
+
+        # Localhost only: metrics are for tuning, not for the LAN
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,455 @@
+"""
+Where the mixed audio goes.
+
+Clocked sinks (a PortAudio device, or NullSink on machines without one)
+decide when audio is needed and pull it from the receiver through a
+render(out, nbytes) function. Passive sinks (files, pipes) just consume
+whatever the clocked sink played; TeeSink combines one clocked sink with
+any number of passive ones.
+
+render(out, nbytes) always fills `out` completely (padding with silence)
+and returns how many bytes were real audio.
+"""
+import abc
+import queue
+import shlex
+import subprocess
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    import pyaudio
+except ImportError:
+    # No PortAudio: only null/file/pipe sinks are available
+    pyaudio = None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+# One PortAudio engine for the whole process. Pa_Initialize/Pa_Terminate
+# are costly and terminating invalidates every open stream, so it is only
+# restarted (to pick up new devices) while nothing is playing.
+_engine = None
+_engine_lock = threading.Lock()
+_open_streams = 0
+
+
+def portaudio_engine():
+    global _engine
+    if pyaudio is None:
+        raise RuntimeError("PyAudio is not installed")
+    with _engine_lock:
+        if _engine is None:
+            _engine = pyaudio.PyAudio()
+        return _engine
+
+
+def _claim_engine():
+    # Engine + open-stream count in one step, so a concurrent
+    # refresh_engine() can't terminate it before the stream is open
+    global _engine, _open_streams
+    if pyaudio is None:
+        raise RuntimeError("PyAudio is not installed")
+    with _engine_lock:
+        if _engine is None:
+            _engine = pyaudio.PyAudio()
+        _open_streams += 1
+        return _engine
+
+
+def engine_busy():
+    """True while an output stream is open on the shared engine."""
+    return _open_streams > 0
+
+
+def refresh_engine():
+    """Re-initialise PortAudio so new/removed devices show up. Returns False
+    while a stream is open (the current device list is kept)."""
+    global _engine
+    with _engine_lock:
+        if _open_streams:
+            return False
+        if _engine is not None:
+            _engine.terminate()
+        _engine = pyaudio.PyAudio() if pyaudio else None
+        return True
+
+
+class OutputSink:
+    clocked = False
+
+    def start(self, render, rate, channels, frames_per_buffer):
+        pass
+
+    def consume(self, data):
+        pass
+
+    def stop(self):
+        pass
+
+    def latency(self):
+        """Seconds between render() returning and the audio being heard."""
+        return 0.0
+
+
+class PortAudioSink(OutputSink):
+    """
+    A PortAudio output device.
+
+    'callback' playback lets PortAudio pull blocks on its own thread;
+    'blocking' runs a thread that renders and does blocking stream.write.
+    """
+
+    clocked = True
+
+    def __init__(self, device_index=None, playback='callback', write_ms=None):
+        self.device_index = device_index
+        self.playback = playback
+        self.write_ms = write_ms  # Optional metrics.Histogram for stream.write
+        self.stream = None
+        self.thread = None
+        self.running = False
+
+    def start(self, render, rate, channels, frames_per_buffer):
+        global _open_streams
+        engine = _claim_engine()
+        self.render = render
+        self.frame_bytes = 2 * channels
+        self.frames_per_buffer = frames_per_buffer
+        self._buf = bytearray(frames_per_buffer * self.frame_bytes)
+
+        kwargs = {
+            'format': pyaudio.paInt16,
+            'channels': channels,
+            'rate': rate,
+            'output': True,
+            'frames_per_buffer': frames_per_buffer
+        }
+        if self.device_index is not None:
+            kwargs['output_device_index'] = self.device_index
+        if self.playback == 'callback':
+            kwargs['stream_callback'] = self._callback
+
+        try:
+            self.stream = engine.open(**kwargs)
+        except Exception:
+            with _engine_lock:
+                _open_streams -= 1
+            raise
+        self.running = True
+        if self.playback == 'callback':
+            self.stream.start_stream()
+        else:
+            self.thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.thread.start()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Runs on the PortAudio thread
+        nbytes = frame_count * self.frame_bytes
+        if nbytes > len(self._buf):
+            self._buf = bytearray(nbytes)
+        out = memoryview(self._buf)[:nbytes]
+        self.render(out, nbytes)
+        if not self.running:
+            return (bytes(out), pyaudio.paComplete)
+        return (bytes(out), pyaudio.paContinue)
+
+    def _write_loop(self):
+        nbytes = self.frames_per_buffer * self.frame_bytes
+        out = memoryview(self._buf)[:nbytes]
+        while self.running:
+            if self.render(out, nbytes) == 0:
+                # Nothing due yet (priming, or no senders)
+                time.sleep(0.002)
+                continue
+            t0 = time.perf_counter()
+            try:
+                # PyAudio wants a read-only buffer; this is still a view
+                self.stream.write(out.toreadonly())
+            except Exception as e:
+                print(f"Write Error: {e}")
+            if self.write_ms:
+                self.write_ms.observe((time.perf_counter() - t0) * 1000.0)
+
+    def stop(self):
+        global _open_streams
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception as e:
+                print(f"Error closing output: {e}")
+            self.stream = None
+            with _engine_lock:
+                _open_streams -= 1
+
+    def latency(self):
+        try:
+            return self.stream.get_output_latency() if self.stream else 0.0
+        except Exception:
+            return 0.0
+
+
+class NullSink(OutputSink):
+    """
+    Plays to nowhere, in real time: a thread pulls one block per buffer
+    period. Lets the receiver run (and record) on machines with no sound
+    hardware. observer(block, heard_at), if set, sees every block played
+    and the time.perf_counter() at which it would be heard.
+    """
+
+    clocked = True
+
+    def __init__(self, observer=None):
+        self.observer = observer
+        self.running = False
+        self.thread = None
+
+    def start(self, render, rate, channels, frames_per_buffer):
+        self.render = render
+        self.period = frames_per_buffer / float(rate)
+        self.nbytes = frames_per_buffer * 2 * channels
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        out = memoryview(bytearray(self.nbytes))
+        due = time.perf_counter()
+        while self.running:
+            self.render(out, self.nbytes)
+            observer = self.observer
+            if observer:
+                observer(bytes(out), due + self.period)
+            due += self.period
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                due = time.perf_counter()  # Fell behind; don't try to catch up
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def latency(self):
+        return getattr(self, 'period', 0.0)
+
+
+class _BufferedWriter(OutputSink, metaclass=abc.ABCMeta):
+    """
+    Passive sink that never does I/O on the audio thread: consume() only
+    queues a copy, and a writer thread batches whatever accumulated into
+    one write every flush_interval.
+    """
+
+    def __init__(self, flush_interval=0.25):
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.running = False
+        self.thread = None
+        self.bytes_written = 0
+
+    def start(self, render, rate, channels, frames_per_buffer):
+        self.rate = rate
+        self.channels = channels
+        self._open()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def consume(self, data):
+        self.queue.put(bytes(data))
+
+    def _drain(self):
+        chunks = []
+        while True:
+            try:
+                chunks.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if chunks:
+            batch = b"".join(chunks)
+            try:
+                self._write(batch)
+                self.bytes_written += len(batch)
+            except Exception as e:
+                print(f"{type(self).__name__} write error: {e}")
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            self._drain()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self._drain()
+        self._close()
+
+    @abc.abstractmethod
+    def _open(self):
+        """Open the destination (runs in start, rate and channels are set)."""
+
+    @abc.abstractmethod
+    def _write(self, data):
+        """Write one batch of PCM (runs on the writer thread)."""
+
+    def _close(self):
+        pass
+
+
+class FileSink(_BufferedWriter):
+    """Records to a .wav file, or .flac when the optional soundfile package is installed."""
+
+    def __init__(self, path, flush_interval=0.25):
+        super().__init__(flush_interval)
+        self.path = path
+        self.flac = path.lower().endswith(".flac")
+        if self.flac and soundfile is None:
+            raise RuntimeError("FLAC recording needs the soundfile package")
+        self.file = None
+
+    def _open(self):
+        if self.flac:
+            self.file = soundfile.SoundFile(self.path, 'w', samplerate=self.rate,
+                                            channels=self.channels, subtype='PCM_16',
+                                            format='FLAC')
+        else:
+            self.file = wave.open(self.path, 'wb')
+            self.file.setnchannels(self.channels)
+            self.file.setsampwidth(2)
+            self.file.setframerate(self.rate)
+
+    def _write(self, data):
+        if self.flac:
+            self.file.write(np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels))
+        else:
+            # Also rewrites the header sizes, so the file stays playable
+            # even if the process dies mid-session
+            self.file.writeframes(data)
+
+    def _close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class PipeSink(_BufferedWriter):
+    """
+    Raw Int16 interleaved PCM to a named pipe/file path, or to the stdin of
+    a command (e.g. "ffmpeg -f s16le -ar 48000 -ac 2 -i - out.mp3").
+    """
+
+    def __init__(self, target, flush_interval=0.05):
+        super().__init__(flush_interval)
+        self.target = target
+        self.proc = None
+        self.pipe = None
+
+    def _open(self):
+        if self.target.startswith("cmd:"):
+            self.proc = subprocess.Popen(shlex.split(self.target[4:]), stdin=subprocess.PIPE)
+            self.pipe = self.proc.stdin
+        else:
+            self.pipe = open(self.target, 'wb')
+
+    def _write(self, data):
+        self.pipe.write(data)
+        self.pipe.flush()
+
+    def _close(self):
+        if self.pipe:
+            try:
+                self.pipe.close()
+            except OSError:
+                pass
+            self.pipe = None
+        if self.proc:
+            try:
+                self.proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+
+
+class TeeSink(OutputSink):
+    """One clocked sink plus passive ones that get a copy of every block played."""
+
+    clocked = True
+
+    def __init__(self, primary, *passive):
+        self.primary = primary
+        self.passive = list(passive)
+
+    def start(self, render, rate, channels, frames_per_buffer):
+        for sink in self.passive:
+            sink.start(None, rate, channels, frames_per_buffer)
+
+        def tee_render(out, nbytes):
+            n = render(out, nbytes)
+            if n:
+                # Blocks with no audio at all (nobody streaming) are not recorded
+                for sink in self.passive:
+                    sink.consume(out[:nbytes])
+            return n
+
+        self.primary.start(tee_render, rate, channels, frames_per_buffer)
+
+    def stop(self):
+        self.primary.stop()
+        for sink in self.passive:
+            sink.stop()
+
+    def latency(self):
+        return self.primary.latency()
+
+
+def make_sink(specs, device_index=None, playback='callback', write_ms=None):
+    """
+    Build the output from a list of specs:
+      "device"        PortAudio output (device_index / playback apply)
+      "null"          no audio hardware, still real-time
+      "file:<path>"   record to .wav/.flac
+      "pipe:<path>"   raw PCM to a named pipe or file
+      "pipe:cmd:<command line>"  raw PCM to a command's stdin
+    With no clocked sink in the list, NullSink provides the clock.
+    """
+    clocked = None
+    passive = []
+    for spec in specs or ["device"]:
+        if spec == "device":
+            sink = PortAudioSink(device_index, playback, write_ms)
+        elif spec == "null":
+            sink = NullSink()
+        elif spec.startswith("file:"):
+            sink = FileSink(spec[5:])
+        elif spec.startswith("pipe:"):
+            sink = PipeSink(spec[5:])
+        else:
+            raise ValueError(f"Unknown output sink: {spec}")
+        if sink.clocked:
+            if clocked is not None:
+                raise ValueError("Only one device/null sink can drive playback")
+            clocked = sink
+        else:
+            passive.append(sink)
+    if clocked is None:
+        clocked = NullSink()
+    if passive:
+        return TeeSink(clocked, *passive)
+    return clocked
@@ -0,0 +1,380 @@
+"""
+Packet capture and replay, for reproducing field network conditions offline.
+
+A capture holds every packet exactly as it came off the socket (still
+encrypted, if the session was) with its arrival time in nanoseconds. The
+file is append-only:
+
+    magic b"ASCAP001", u32 length, JSON metadata (receiver settings)
+    records: u64 arrival ns, u16 stream index, u32 length, then the packet
+
+Stream index STREAM_DEF marks a record whose payload is the JSON
+description ({"index", "id", "addr", "protocol"}) of a stream before its
+first packet. Captures rotate at max_bytes like a RotatingFileHandler
+(capture.ascap, capture.ascap.1, ...). Every file restates its streams, so
+each one replays on its own.
+
+    python packet_capture.py info session.ascap
+    python packet_capture.py replay session.ascap --password x --json out.json
+    python packet_capture.py replay session.ascap --speed 1 --sink device
+"""
+import argparse
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"ASCAP001"
+META_LEN = struct.Struct('>I')
+RECORD = struct.Struct('>QHI')
+STREAM_DEF = 0xFFFF
+
+
+class PacketCapture:
+    """
+    Writes received packets to a rotating capture. write() runs on the
+    receive thread and only queues a copy; a writer thread does the I/O
+    every flush_interval, like the file output sinks.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=3, meta=None, flush_interval=0.25):
+        self.path = path
+        self.max_bytes = max(64 * 1024, int(max_bytes))
+        self.backups = backups
+        self.meta = dict(meta or {})
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.streams = {}  # stream id -> index in the capture
+        self.defined = []  # Definition records written so far, restated after rotation
+        self.file = None
+        self.file_bytes = 0
+        self.running = False
+        self.thread = None
+        self.t0 = None
+
+        self.packets = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+    def start(self):
+        self.t0 = time.perf_counter_ns()
+        self.meta.setdefault("started", time.time())
+        self._open()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, stream_id, addr, protocol, data):
+        t = time.perf_counter_ns() - self.t0
+        index = self.streams.get(stream_id)
+        if index is None:
+            index = len(self.streams)
+            if index >= STREAM_DEF:
+                return  # Out of indexes; a session never gets near this
+            self.streams[stream_id] = index
+            definition = json.dumps({"index": index, "id": stream_id, "addr": list(addr),
+                                     "protocol": protocol}).encode("utf-8")
+            self.queue.put((stream_id, RECORD.pack(t, STREAM_DEF, len(definition)) + definition))
+        self.queue.put((None, RECORD.pack(t, index, len(data)) + bytes(data)))
+        self.packets += 1
+
+    def _open(self):
+        header = json.dumps(self.meta).encode("utf-8")
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC + META_LEN.pack(len(header)) + header)
+        self.file_bytes = self.file.tell()
+
+    def _rotate(self):
+        self.file.close()
+        for n in range(self.backups, 0, -1):
+            older = f"{self.path}.{n - 1}" if n > 1 else self.path
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n}")
+        if not self.backups:
+            os.remove(self.path)
+        self._open()
+        self.rotations += 1
+        # Restate every stream seen so far so this file replays on its own
+        for definition in self.defined:
+            self.file.write(definition)
+            self.file_bytes += len(definition)
+
+    def _drain(self):
+        records = []
+        while True:
+            try:
+                records.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not records or self.file is None:
+            return
+        try:
+            for stream_id, record in records:
+                if self.file_bytes + len(record) > self.max_bytes and self.file_bytes > 0:
+                    self._rotate()
+                self.file.write(record)
+                self.file_bytes += len(record)
+                self.bytes_written += len(record)
+                if stream_id is not None:
+                    self.defined.append(record)
+            self.file.flush()
+        except Exception as e:
+            print(f"PacketCapture write error: {e}")
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            self._drain()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self._drain()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def get_stats(self):
+        return {"path": self.path, "packets": self.packets, "bytes": self.bytes_written,
+                "rotations": self.rotations}
+
+
+def capture_files(path):
+    """The files of a rotated capture, oldest first."""
+    files = []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        files.insert(0, f"{path}.{n}")
+        n += 1
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_meta(path):
+    with open(path, "rb") as f:
+        return _read_header(f, path)
+
+
+def _read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a packet capture")
+    (length,) = META_LEN.unpack(f.read(META_LEN.size))
+    return json.loads(f.read(length).decode("utf-8"))
+
+
+def read_packets(paths):
+    """
+    Yields (arrival_ns, stream_id, addr, protocol, packet) from capture
+    files in order. A record cut short (the process died mid-write) ends
+    its file.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with open(path, "rb") as f:
+            _read_header(f, path)
+            streams = {}
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    break
+                t, index, length = RECORD.unpack(head)
+                data = f.read(length)
+                if len(data) < length:
+                    break
+                if index == STREAM_DEF:
+                    d = json.loads(data.decode("utf-8"))
+                    streams[d["index"]] = (d["id"], tuple(d["addr"]), d["protocol"])
+                    continue
+                stream = streams.get(index)
+                if stream is None:
+                    continue
+                yield (t,) + stream + (data,)
+
+
+class Replayer:
+    """
+    Feeds a capture into an AudioReceiver through its packet handler.
+
+    speed > 0 replays at the original timing (scaled): the receiver must
+    already be running with listen=False, and plays through its own sinks.
+
+    speed == 0 replays as fast as possible and deterministically: the
+    receiver is not started; its clock is the capture's, and the output is
+    rendered block by block on this thread (on_block gets every block).
+    Two runs of the same capture give the same result, so jitter buffer
+    changes can be compared on identical input.
+    """
+
+    def __init__(self, receiver, speed=0.0, on_block=None):
+        self.receiver = receiver
+        self.speed = speed
+        self.on_block = on_block
+        self.packets = 0
+        self.now = 0.0  # Virtual time in seconds (speed 0)
+
+    def run(self, packets, password=None, tail_ms=None):
+        if self.speed and self.speed > 0:
+            self._run_realtime(packets)
+        else:
+            self._run_virtual(packets, password, tail_ms)
+        return self.receiver.get_stats()
+
+    def _run_realtime(self, packets):
+        receiver = self.receiver
+        start = None
+        next_expire = 0.0
+        for t_ns, stream_id, addr, protocol, data in packets:
+            if not receiver.running:
+                break
+            if start is None:
+                start = time.perf_counter() - t_ns / 1e9 / self.speed
+            delay = start + t_ns / 1e9 / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            receiver._handle_packet(data, addr, protocol, stream_id)
+            self.packets += 1
+            if time.perf_counter() >= next_expire:
+                receiver._expire_streams()
+                next_expire = time.perf_counter() + 0.5
+        if start is not None and receiver.running:
+            # Play out what is still buffered
+            time.sleep((receiver.buffer_ms + 100) / 1000.0)
+
+    def _run_virtual(self, packets, password, tail_ms):
+        receiver = self.receiver
+        receiver.clock = lambda: self.now
+        if password:
+            import crypto
+            receiver.cipher = crypto.make_cipher(password)
+        receiver.decrypt_worker = None  # Decrypt inline, in capture order
+
+        nbytes = receiver.CHUNK * receiver.frame_bytes
+        out = memoryview(bytearray(nbytes))
+        period = receiver.CHUNK / float(receiver.RATE)
+        next_render = None
+        next_expire = 0.0
+
+        def render_until(t):
+            nonlocal next_render
+            while next_render <= t:
+                self.now = next_render
+                receiver._render(out, nbytes)
+                if self.on_block:
+                    self.on_block(out)
+                next_render += period
+
+        for t_ns, stream_id, addr, protocol, data in packets:
+            t = t_ns / 1e9
+            if next_render is None:
+                next_render = t
+            render_until(t)
+            self.now = t
+            receiver._handle_packet(data, addr, protocol, stream_id)
+            self.packets += 1
+            if t >= next_expire:
+                receiver._expire_streams()
+                next_expire = t + 0.5
+
+        if next_render is not None:
+            # Play out what is still buffered
+            tail = (tail_ms if tail_ms is not None else receiver.buffer_ms + 100) / 1000.0
+            render_until(self.now + tail)
+
+
+def summarize(paths):
+    """Per-stream packet counts, duration and inter-arrival spread of a capture."""
+    streams = {}
+    for t, stream_id, addr, protocol, data in read_packets(paths):
+        s = streams.setdefault(stream_id, {"protocol": protocol, "packets": 0, "bytes": 0,
+                                           "first_s": t / 1e9, "gaps_ms": []})
+        if s["packets"]:
+            s["gaps_ms"].append((t - s["last"]) / 1e6)
+        s["last"] = t
+        s["packets"] += 1
+        s["bytes"] += len(data)
+    for s in streams.values():
+        gaps = sorted(s.pop("gaps_ms"))
+        s["duration_s"] = round(s.pop("last") / 1e9 - s["first_s"], 3)
+        s["first_s"] = round(s["first_s"], 3)
+        if gaps:
+            s["gap_p50_ms"] = round(gaps[len(gaps) // 2], 2)
+            s["gap_p99_ms"] = round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))], 2)
+            s["gap_max_ms"] = round(gaps[-1], 2)
+    return streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay an AudioSync packet capture")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="Summarize a capture")
+    info.add_argument("path")
+    replay = sub.add_parser("replay", help="Feed a capture through the receiver")
+    replay.add_argument("path")
+    replay.add_argument("--password", help="Session password, if the capture is encrypted")
+    replay.add_argument("--speed", type=float, default=0.0,
+                        help="1 = original timing, 0 = as fast as possible and deterministic (default)")
+    replay.add_argument("--buffer-ms", type=int, help="Jitter buffer ceiling (default: as captured)")
+    replay.add_argument("--no-drift", action="store_true", help="Disable drift compensation")
+    replay.add_argument("--sink", action="append",
+                        help="Output for --speed > 0, e.g. device, null, file:out.wav (default: device)")
+    replay.add_argument("--wav", help="Write the replayed output here (--speed 0)")
+    replay.add_argument("--json", help="Write the final receiver stats here")
+    args = parser.parse_args()
+
+    files = capture_files(args.path)
+    if not files:
+        sys.exit(f"No capture at {args.path}")
+
+    if args.command == "info":
+        print(json.dumps({"meta": read_meta(files[0]), "files": files,
+                          "streams": summarize(files)}, indent=2))
+        return
+
+    from audio_stream import AudioReceiver
+    meta = read_meta(files[0])
+    receiver = AudioReceiver(port=meta.get("port", 50005), callback_status=lambda m: print(m, file=sys.stderr))
+    receiver.buffer_ms = args.buffer_ms or meta.get("buffer_ms", receiver.buffer_ms)
+    receiver.drift_compensation = not args.no_drift
+
+    wav = None
+    on_block = None
+    if args.wav and not args.speed:
+        import wave
+        wav = wave.open(args.wav, "wb")
+        wav.setnchannels(receiver.CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(receiver.RATE)
+        on_block = wav.writeframes
+
+    replayer = Replayer(receiver, args.speed, on_block)
+    if args.speed:
+        receiver.start(protocol=meta.get("protocol", "udp"), password=args.password,
+                       sinks=args.sink, listen=False)
+        if not receiver.running:
+            sys.exit(1)
+    t0 = time.perf_counter()
+    try:
+        stats = replayer.run(read_packets(files), password=args.password)
+    finally:
+        if args.speed:
+            receiver.stop()
+        if wav:
+            wav.close()
+    print(f"Replayed {replayer.packets} packets in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+    else:
+        print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Multi-room relay: one receiver takes the phone's stream and re-sends it to
+other receivers on the LAN, so the phone sends one copy over its radio
+instead of one per room.
+
+The relay rewrites each forwarded packet's timestamp from the phone's
+clock to its own (the phone timestamp plus the smallest transit seen
+lately) and sets FLAG_RELAY. It also answers clock requests on
+CLOCK_PORT. A downstream receiver that sees FLAG_RELAY asks the relay
+for the time (NTP-style, keeping the lowest-delay of the recent samples)
+and so knows each packet's timestamp in its own clock. Every room, the
+relay's own included, then plays a packet at
+
+    relay timestamp + delay_ms   (relay clock)
+
+instead of at a delay adapted to its own jitter, and steers its output
+rate so that the sample leaving its speaker matches that schedule. Rooms
+then agree to within the clock sync error and the device latency
+estimate, typically a few ms on a LAN.
+
+Clock messages are single UDP datagrams of the same size both ways:
+
+    b"ASCK", u8 type (1 request, 2 reply), u64 t1, u64 t2, u64 t3 (ns),
+    u16 playout delay in ms (replies)
+"""
+import collections
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+import codec
+import crypto
+
+CLOCK_PORT = 50007
+CLOCK = struct.Struct('>4sBQQQH')
+CLOCK_MAGIC = b"ASCK"
+REQUEST, REPLY = 1, 2
+
+
+def parse_target(spec, default_port=50005):
+    """'host' or 'host:port' -> (host, port)."""
+    host, _, port = spec.rpartition(':') if ':' in spec else (spec, '', '')
+    return host, int(port) if port else default_port
+
+
+class ClockServer:
+    """Answers clock requests with our receive and send times."""
+
+    def __init__(self, clock, delay_ms, port=CLOCK_PORT):
+        self.clock = clock
+        self.delay_ms = delay_ms
+        self.port = port
+        self.sock = None
+        self.running = False
+        self.thread = None
+        self.requests = 0
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('', self.port))
+        sock.setblocking(False)
+        self.sock = sock
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                readable, _, _ = select.select([self.sock], [], [], 0.5)
+            except (OSError, ValueError):
+                break
+            if not readable:
+                continue
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except (BlockingIOError, OSError):
+                continue
+            t2 = int(self.clock() * 1e9)
+            if len(data) != CLOCK.size:
+                continue
+            magic, kind, t1, _, _, _ = CLOCK.unpack(data)
+            if magic != CLOCK_MAGIC or kind != REQUEST:
+                continue
+            reply = CLOCK.pack(CLOCK_MAGIC, REPLY, t1, t2, int(self.clock() * 1e9),
+                               min(0xFFFF, int(self.delay_ms)))
+            try:
+                self.sock.sendto(reply, addr)
+                self.requests += 1
+            except OSError:
+                pass
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class ClockClient:
+    """
+    Keeps the offset between a relay's clock and ours: a burst of requests
+    at first, then one a second. Of the last SAMPLES answers the one with
+    the lowest round trip wins (its offset has the least queuing error).
+    """
+
+    SAMPLES = 8
+
+    def __init__(self, host, clock, port=CLOCK_PORT):
+        self.host = host
+        self.port = port
+        self.clock = clock
+        self.offset_ms = None  # Relay clock minus ours
+        self.rtt_ms = None
+        self.delay_ms = None  # Playout delay the relay asks for
+        self.samples = collections.deque(maxlen=self.SAMPLES)
+        self.sock = None
+        self.running = False
+        self.thread = None
+
+    @property
+    def ready(self):
+        return self.offset_ms is not None
+
+    def schedule(self):
+        """(base_ms, delay_ms) for JitterBuffer.set_schedule, once synced."""
+        if self.offset_ms is None:
+            return None
+        return -self.offset_ms, self.delay_ms
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        sent = 0
+        while self.running:
+            try:
+                t1 = int(self.clock() * 1e9)
+                self.sock.sendto(CLOCK.pack(CLOCK_MAGIC, REQUEST, t1, 0, 0, 0), (self.host, self.port))
+                sent += 1
+            except OSError:
+                pass
+            # Answers to earlier requests that came in late are fine too
+            deadline = time.monotonic() + (0.1 if sent < self.SAMPLES else 1.0)
+            while self.running:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    readable, _, _ = select.select([self.sock], [], [], left)
+                except (OSError, ValueError):
+                    return
+                if readable:
+                    self._receive()
+
+    def _receive(self):
+        try:
+            data, _ = self.sock.recvfrom(64)
+        except (BlockingIOError, OSError):
+            return
+        t4 = int(self.clock() * 1e9)
+        if len(data) != CLOCK.size:
+            return
+        magic, kind, t1, t2, t3, delay_ms = CLOCK.unpack(data)
+        if magic != CLOCK_MAGIC or kind != REPLY:
+            return
+        rtt = (t4 - t1) - (t3 - t2)
+        if rtt < 0:
+            return
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        self.samples.append((rtt, offset))
+        rtt, offset = min(self.samples)
+        self.rtt_ms = rtt / 1e6
+        self.offset_ms = offset / 1e6
+        self.delay_ms = delay_ms
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class Relay:
+    """
+    Forwards one sender's packets from an AudioReceiver to downstream
+    receivers, by unicast to each target or once to a multicast group.
+
+    targets: [(host, port), ...]; a multicast group address is sent to once
+    and every receiver that joined the group gets it. Packets are
+    re-encrypted with `cipher` (None sends them in the clear).
+    """
+
+    WINDOW = 500  # Packets of transit history behind the timestamp mapping
+
+    def __init__(self, receiver, targets, delay_ms=150, cipher=None, ttl=1, clock_port=CLOCK_PORT):
+        self.receiver = receiver
+        self.targets = list(targets)
+        self.delay_ms = delay_ms
+        self.cipher = cipher
+        self.clock = receiver.clock
+        self.clock_server = ClockServer(self.clock, delay_ms, clock_port)
+        self.source = None  # The SenderStream being relayed
+        self.transits = collections.deque(maxlen=self.WINDOW)
+        self.last_transit = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+
+        self.forwarded = 0
+        self.bytes_sent = 0
+        self.send_errors = 0
+
+    def start(self):
+        self.clock_server.start()
+
+    def stop(self):
+        self.clock_server.stop()
+        self.sock.close()
+        if self.source:
+            self.source.set_schedule(None)
+            self.source = None
+
+    def local_schedule(self):
+        # Our own room plays on the relay timeline with no offset
+        return 0.0, self.delay_ms
+
+    def forward(self, stream, seq, flags, timestamp, payload):
+        """
+        Map a packet of `stream` onto our clock and send it downstream.
+        Returns the new timestamp, for our own playout.
+        """
+        if stream is not self.source:
+            # The relayed sender changed: the old one goes back to adaptive playout
+            if self.source:
+                self.source.set_schedule(None)
+            self.source = stream
+            self.transits.clear()
+            self.last_transit = None
+            stream.set_schedule(self.local_schedule)
+
+        now_ms = self.clock() * 1000.0
+        if not flags & codec.FLAG_FEC:
+            # Parity carries its group's first timestamp; it says nothing
+            # about the network
+            transit = now_ms - timestamp
+            if self.last_transit is not None and abs(transit - self.last_transit) > 1000:
+                self.transits.clear()  # Sender restarted or its clock stepped
+            self.last_transit = transit
+            self.transits.append(transit)
+        if not self.transits:
+            return None
+        mapped = int(round(timestamp + min(self.transits)))
+
+        data = codec.pack_header(seq, mapped, flags | codec.FLAG_RELAY) + bytes(payload)
+        if self.cipher:
+            nonce = os.urandom(crypto.NONCE_SIZE)
+            data = nonce + self.cipher.encrypt(nonce, data, None)
+        for target in self.targets:
+            try:
+                self.sock.sendto(data, target)
+                self.bytes_sent += len(data)
+            except OSError:
+                self.send_errors += 1
+        self.forwarded += 1
+        return mapped
+
+    def get_stats(self):
+        return {
+            "targets": [f"{h}:{p}" for h, p in self.targets],
+            "delay_ms": self.delay_ms,
+            "forwarded": self.forwarded,
+            "bytes": self.bytes_sent,
+            "send_errors": self.send_errors,
+            "clock_requests": self.clock_server.requests,
+        }
@@ -0,0 +1,147 @@
+class FrameRing:
+    """
+    Single-producer/single-consumer byte ring over a preallocated bytearray.
+
+    The writer only advances write_pos and the reader only advances read_pos,
+    so the two sides never need a lock. Positions count total bytes and are
+    wrapped with modulo on access.
+    """
+
+    def __init__(self, capacity, frame_bytes=4):
+        # Keep the capacity a whole number of audio frames
+        self.frame_bytes = frame_bytes
+        self.capacity = capacity - (capacity % frame_bytes)
+        self.buf = bytearray(self.capacity)
+        self.view = memoryview(self.buf)
+        self.write_pos = 0
+        self.read_pos = 0
+
+    def available(self):
+        """Bytes ready to be read."""
+        return self.write_pos - self.read_pos
+
+    def free(self):
+        return self.capacity - (self.write_pos - self.read_pos)
+
+    def write(self, data):
+        """Append data. Returns the number of bytes written (0 if it does not fit)."""
+        n = len(data)
+        if n == 0 or n > self.free():
+            return 0
+        src = memoryview(data).cast('B')
+        idx = self.write_pos % self.capacity
+        first = min(n, self.capacity - idx)
+        self.view[idx:idx + first] = src[:first]
+        if first < n:
+            self.view[:n - first] = src[first:]
+        self.write_pos += n
+        return n
+
+    def read_into(self, out, nbytes):
+        """Copy up to nbytes into the writable buffer `out`. Returns bytes copied."""
+        n = min(nbytes, self.available())
+        n -= n % self.frame_bytes
+        if n <= 0:
+            return 0
+        idx = self.read_pos % self.capacity
+        first = min(n, self.capacity - idx)
+        out[:first] = self.view[idx:idx + first]
+        if first < n:
+            out[first:n] = self.view[:n - first]
+        self.read_pos += n
+        return n
+
+    def clear(self):
+        # Consumer side only: drop everything that is buffered
+        self.read_pos = self.write_pos
+
+
+class PacketRing:
+    """
+    Preallocated receive arena.
+
+    Each packet is received straight into the next free region with
+    recv_into/recvfrom_into and handed on as a memoryview, so the receive
+    path never allocates. A view stays valid until the ring wraps back over
+    it, so the capacity has to cover more audio than the jitter buffer will
+    ever hold.
+    """
+
+    def __init__(self, capacity, max_packet=65536):
+        self.capacity = max(capacity, max_packet)
+        self.max_packet = max_packet
+        self.buf = bytearray(self.capacity)
+        self.view = memoryview(self.buf)
+        self.pos = 0
+
+    def reserve(self, size=None):
+        """Writable view of the next contiguous region of at least `size` bytes."""
+        size = size or self.max_packet
+        if self.pos + size > self.capacity:
+            self.pos = 0
+        return self.view[self.pos:self.pos + size]
+
+    def commit(self, n):
+        """Claim the first n bytes of the last reserved region and return them."""
+        packet = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return packet
+
+
+class FramedReader:
+    """
+    Length-prefixed frames ([Length 4 bytes, big-endian] [Payload]) from a
+    non-blocking stream socket.
+
+    Reads large chunks straight into a PacketRing and parses every complete
+    frame in them in place, so a burst of frames costs one recv instead of
+    two per frame, and each payload is a view into the ring (no copies).
+    An incomplete frame at the end of a chunk is copied out to this
+    reader's own tail buffer: the ring is shared with other connections
+    (and UDP), so nothing may stay uncommitted in it between calls. The
+    next read puts the tail back in front of the new data.
+    """
+
+    def __init__(self, sock, chunk=65536):
+        self.sock = sock
+        self.chunk = chunk
+        self.tail = bytearray()  # Incomplete frame from the last chunk
+
+    def read(self, ring):
+        """
+        Receive what the socket has and return the complete payloads, oldest
+        first. Raises EOFError when the peer closed, ValueError on a corrupt
+        length and OSError on socket errors.
+        """
+        limit = min(self.chunk, ring.max_packet)
+        # Returned views must all still be valid, so one call never takes
+        # in more than a fraction of the ring
+        budget = ring.capacity // 4
+        frames = []
+        while True:
+            pending = len(self.tail)
+            region = ring.reserve(limit)
+            region[:pending] = self.tail
+            want = len(region) - pending
+            try:
+                n = self.sock.recv_into(region[pending:])
+            except (BlockingIOError, InterruptedError):
+                return frames
+            if not n:
+                raise EOFError
+            avail = pending + n
+            off = 0
+            while avail - off >= 4:
+                length = int.from_bytes(region[off:off + 4], 'big')
+                if length == 0 or length > limit - 4:
+                    # Framing is out of sync; nothing after this can be trusted
+                    raise ValueError(f"bad frame length {length}")
+                if avail - off - 4 < length:
+                    break
+                frames.append(region[off + 4:off + 4 + length])
+                off += 4 + length
+            ring.commit(off)
+            self.tail[:] = region[off:avail]
+            budget -= n
+            if n < want or budget <= 0:
+                return frames  # Drained (short read), or enough for this wake-up
@@ -0,0 +1,271 @@
+"""
+Synthetic AudioSync sender for benchmarks and soak tests.
+
+Speaks the same wire format as NetworkSender.kt: a 12-byte header
+(seq u32 + timestamp u64 ms, big-endian), Int16 stereo PCM, optional
+AES-GCM (nonce + ciphertext + tag) and, over TCP, a 4-byte length prefix.
+Over UDP it can also send an XOR parity packet after every fec_group
+packets (see fec.py).
+Network impairments (loss, reordering, jitter, bursts) are applied on the
+sending side so the receiver sees them exactly as it would over Wi-Fi.
+
+    python synthetic_sender.py --host 127.0.0.1 --protocol udp --profile wifi --duration 30
+"""
+import argparse
+import heapq
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+import codec
+import crypto
+import fec
+
+# Impairment profiles
+#   loss:        independent loss probability
+#   burst_loss:  probability of entering a loss burst (Gilbert-Elliott)
+#   burst_len:   mean packets lost per burst
+#   reorder:     probability a packet is held back behind the next one
+#   jitter_ms:   mean of the exponential extra delay per packet
+#   stall_every: seconds between delivery stalls (Wi-Fi power save, scans)
+#   stall_ms:    how long packets are held before being released in a burst
+PROFILES = {
+    "clean":     {},
+    "lan":       {"jitter_ms": 1.0},
+    "wifi":      {"loss": 0.005, "reorder": 0.01, "jitter_ms": 4.0,
+                  "stall_every": 5.0, "stall_ms": 60.0},
+    "lossy":     {"loss": 0.03, "burst_loss": 0.01, "burst_len": 4,
+                  "reorder": 0.02, "jitter_ms": 6.0},
+    "congested": {"loss": 0.02, "reorder": 0.05, "jitter_ms": 15.0,
+                  "stall_every": 2.0, "stall_ms": 150.0},
+    # No pacing at all: measures how fast the receiver can go
+    "flood":     {"flood": True},
+}
+
+
+class SyntheticSender:
+    """
+    Generates packets in real time (or as fast as possible for 'flood') and
+    sends them with the chosen impairments.
+
+    With markers=True every packet is filled with one constant sample value
+    derived from its sequence number, so whoever observes the device output
+    can tell which packet is playing and when (see benchmark.py).
+    """
+
+    MARKER_MODULO = 30000
+
+    def __init__(self, host="127.0.0.1", port=50005, protocol="udp", password=None,
+                 profile="clean", packet_ms=20, rate=48000, channels=2,
+                 markers=True, seed=1, fec_group=0):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.cipher = crypto.make_cipher(password) if password else None
+        self.profile = dict(PROFILES[profile]) if isinstance(profile, str) else dict(profile)
+        self.frames = int(rate * packet_ms / 1000)
+        self.packet_ms = packet_ms
+        self.channels = channels
+        self.markers = markers
+        self.random = random.Random(seed)
+        # Parity only makes sense where packets can actually be lost
+        self.fec_group = fec_group if protocol == "udp" and fec_group >= 2 else 0
+        self._group = []  # Plaintext (seq, flags, timestamp, payload) since the last parity
+
+        self.sent_at = {}  # seq -> perf_counter when the packet was generated
+        self.generated = 0
+        self.sent = 0
+        self.lost = 0
+        self.parity_sent = 0
+        self.bytes_sent = 0
+        self.running = False
+        self.thread = None
+        self.sock = None
+        self._in_burst = False
+
+        # Non-marker payload: a quiet tone, generated once
+        t = np.arange(self.frames) / float(rate)
+        tone = (3000 * np.sin(2 * np.pi * 440.0 * t)).astype(np.int16)
+        self._tone = np.repeat(tone[:, None], channels, axis=1).tobytes()
+
+    def payload(self, seq):
+        if not self.markers:
+            return self._tone
+        value = seq % self.MARKER_MODULO + 1
+        return np.full(self.frames * self.channels, value, dtype=np.int16).tobytes()
+
+    def packet(self, seq):
+        timestamp = int(time.time() * 1000)
+        payload = self.payload(seq)
+        if self.fec_group:
+            self._group.append((seq, 0, timestamp, payload))
+        return self._wrap(codec.pack_header(seq, timestamp) + payload)
+
+    def parity(self):
+        """The parity packet for the group just completed, else None."""
+        if not self.fec_group or len(self._group) < self.fec_group:
+            return None
+        group, self._group = self._group, []
+        return self._wrap(fec.build_parity(group))
+
+    def _wrap(self, data):
+        if self.cipher:
+            nonce = os.urandom(crypto.NONCE_SIZE)
+            data = nonce + self.cipher.encrypt(nonce, data, None)
+        if self.protocol == "tcp":
+            data = struct.pack('>I', len(data)) + data
+        return data
+
+    def _dropped(self):
+        p = self.profile
+        if self._in_burst:
+            if self.random.random() < 1.0 / max(1.0, p.get("burst_len", 1)):
+                self._in_burst = False
+            return True
+        if self.random.random() < p.get("burst_loss", 0.0):
+            self._in_burst = True
+            return True
+        if self.protocol == "tcp":
+            return False  # TCP retransmits; loss shows up as delay instead
+        return self.random.random() < p.get("loss", 0.0)
+
+    def start(self, duration=None):
+        if self.protocol == "tcp":
+            self.sock = socket.create_connection((self.host, self.port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(duration,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        if self.sock:
+            self.sock.close()
+
+    def _send(self, data):
+        try:
+            if self.protocol == "tcp":
+                self.sock.sendall(data)
+            else:
+                self.sock.sendto(data, (self.host, self.port))
+            self.sent += 1
+            self.bytes_sent += len(data)
+        except OSError:
+            pass
+
+    def _run(self, duration):
+        p = self.profile
+        flood = p.get("flood", False)
+        period = self.packet_ms / 1000.0
+        start = time.perf_counter()
+        next_stall = start + p["stall_every"] if p.get("stall_every") else None
+        stall_until = 0.0
+        queue = []  # (send_at, order, seq, data)
+        seq = 0
+        order = 0
+        last_send_at = 0.0
+
+        while self.running:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration and not queue:
+                break
+
+            # Generate every packet whose capture time has come
+            due = start + seq * period
+            # (a flood runs for `duration` of wall time, not of audio)
+            while (flood or due <= now) and (duration is None or (now if flood else due) - start < duration):
+                data = self.packet(seq)
+                self.sent_at[seq] = time.perf_counter() if flood else due
+                self.generated += 1
+                parity = self.parity()
+                # The parity packet goes out right behind the group's last one
+                for data in ([data, parity] if parity else [data]):
+                    if data is parity:
+                        self.parity_sent += 1
+                    if self._dropped():
+                        if data is not parity:
+                            self.lost += 1
+                        continue
+                    send_at = due
+                    if p.get("jitter_ms"):
+                        send_at += self.random.expovariate(1000.0 / p["jitter_ms"])
+                    if self.protocol == "udp" and self.random.random() < p.get("reorder", 0.0):
+                        send_at += period * 1.5  # Lands after its successor
+                    if next_stall and due >= next_stall:
+                        stall_until = due + p["stall_ms"] / 1000.0
+                        next_stall += p["stall_every"]
+                    send_at = max(send_at, stall_until)
+                    if self.protocol == "tcp":
+                        # One byte stream: a delayed packet holds up the ones behind it
+                        send_at = max(send_at, last_send_at)
+                        last_send_at = send_at
+                    if flood:
+                        self._send(data)
+                    else:
+                        heapq.heappush(queue, (send_at, order, seq, data))
+                        order += 1
+                seq += 1
+                due = start + seq * period
+                if flood:
+                    break
+
+            while queue and queue[0][0] <= time.perf_counter():
+                self._send(heapq.heappop(queue)[3])
+
+            if not flood:
+                wake = due
+                if queue:
+                    wake = min(wake, queue[0][0])
+                delay = wake - time.perf_counter()
+                if delay > 0:
+                    time.sleep(min(delay, 0.005))
+        self.running = False
+
+    def get_stats(self):
+        return {
+            "generated": self.generated,
+            "sent": self.sent,
+            "lost": self.lost,
+            "parity": self.parity_sent,
+            "bytes": self.bytes_sent,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic AudioSync sender")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50005)
+    parser.add_argument("--protocol", choices=["udp", "tcp"], default="udp")
+    parser.add_argument("--password")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="clean")
+    parser.add_argument("--packet-ms", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--tone", action="store_true", help="Send a 440 Hz tone instead of markers")
+    parser.add_argument("--fec", type=int, default=0, metavar="N",
+                        help="UDP: send a parity packet after every N packets")
+    args = parser.parse_args()
+
+    sender = SyntheticSender(args.host, args.port, args.protocol, args.password,
+                             args.profile, args.packet_ms, markers=not args.tone,
+                             fec_group=args.fec)
+    sender.start(args.duration)
+    try:
+        while sender.running:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    sender.stop()
+    print(sender.get_stats())
+
+
+if __name__ == "__main__":
+    main()
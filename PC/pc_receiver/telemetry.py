@@ -0,0 +1,223 @@
+"""
+Binary telemetry channel for high-rate stats and level meters.
+
+JSON over stdout is fine for control messages and the 2 Hz 'stats' event,
+but VU meters and latency graphs want 30-60 updates a second. This serves
+them as small struct-packed frames on a localhost TCP socket, announced to
+the parent process with a 'telemetry' JSON event ({"port", "rate_hz",
+"version"}).
+
+Every frame is: u32 body length, u8 frame type, body (all little-endian).
+
+  FRAME_STATS (1):  f64 time, u32 received, u32 lost, u32 output_underruns,
+                    f32 buffered_ms, f32 jitter_ms, f32 delay_ms, u16 count,
+                    then per stream: u16 key, u32 received, u32 lost,
+                    f32 buffered_ms, f32 jitter_ms, f32 delay_ms, f32 drift_ppm,
+                    f32 gain
+  FRAME_LEVELS (2): f64 time, u16 count, then per entry: u16 key,
+                    f32 peak_l, f32 peak_r, f32 rms_l, f32 rms_r
+                    (key 0xFFFF is the master mix; others are stream keys
+                    from the 'stream_joined' event)
+
+Values are coalesced, never queued: each tick sends the latest state, and
+ticks are skipped while the reader hasn't drained the previous frames.
+"""
+import math
+import select
+import socket
+import struct
+import threading
+import time
+
+VERSION = 1
+FRAME_STATS = 1
+FRAME_LEVELS = 2
+MASTER_KEY = 0xFFFF
+
+FRAME_HEADER = struct.Struct('<IB')
+STATS_HEADER = struct.Struct('<dIIIfffH')
+STATS_STREAM = struct.Struct('<HIIfffff')
+LEVELS_HEADER = struct.Struct('<dH')
+LEVELS_ENTRY = struct.Struct('<Hffff')
+
+
+def _frame(frame_type, body):
+    return FRAME_HEADER.pack(len(body), frame_type) + body
+
+
+def _u32(value):
+    return value & 0xFFFFFFFF
+
+
+def pack_stats(receiver, now=None):
+    streams = receiver._mix_streams
+    active = receiver.active_stream
+    jb = active.jitter_buffer if active else None
+    parts = [STATS_HEADER.pack(
+        now or time.time(),
+        _u32(receiver.total_packets_received),
+        _u32(max(0, receiver.packets_lost)),
+        _u32(receiver.output_underruns),
+        jb.buffered_ms if jb else 0.0,
+        jb.jitter_ms if jb else 0.0,
+        jb.target_delay_ms if jb else 0.0,
+        len(streams))]
+    for s in streams:
+        sjb = s.jitter_buffer
+        parts.append(STATS_STREAM.pack(
+            s.key, _u32(s.total_packets_received), _u32(max(0, s.packets_lost)),
+            sjb.buffered_ms, sjb.jitter_ms, sjb.target_delay_ms,
+            s.drift.drift_ppm if s.resampler else math.nan, s.gain))
+    return _frame(FRAME_STATS, b"".join(parts))
+
+
+def _levels_entry(key, meter):
+    peak, rms = meter.read()
+    if len(peak) == 1:
+        peak, rms = peak * 2, rms * 2  # Mono shows on both meters
+    return LEVELS_ENTRY.pack(key, peak[0], peak[1], rms[0], rms[1])
+
+
+def pack_levels(receiver, now=None):
+    streams = receiver._mix_streams
+    parts = [LEVELS_HEADER.pack(now or time.time(), len(streams) + 1),
+             _levels_entry(MASTER_KEY, receiver.mixer.master_meter)]
+    for s in streams:
+        parts.append(_levels_entry(s.key, s.meter))
+    return _frame(FRAME_LEVELS, b"".join(parts))
+
+
+class TelemetryServer:
+    """
+    Streams frames for whatever receiver provider() returns (None while
+    stopped) to one local client at rate_hz. Level metering in the mixer is
+    switched on only while a client is connected.
+    """
+
+    def __init__(self, provider, rate_hz=30, port=0):
+        self.provider = provider
+        self.rate_hz = max(1, min(120, int(rate_hz)))
+        self.requested_port = port
+        self.port = None
+        self.listener = None
+        self.client = None
+        self.pending = b""
+        self.running = False
+        self.thread = None
+        self.frames_sent = 0
+        self.frames_skipped = 0  # Ticks coalesced away because the reader was behind
+        self._metered = None
+
+    def start(self):
+        # Localhost only, like the Prometheus endpoint
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", self.requested_port))
+        self.listener.listen(1)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        self._drop_client()
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+
+    def _drop_client(self):
+        if self.client:
+            try:
+                self.client.close()
+            except OSError:
+                pass
+            self.client = None
+        self.pending = b""
+        self._set_metering(None)
+
+    def _set_metering(self, receiver):
+        if self._metered is not None and self._metered is not receiver:
+            self._metered.mixer.metering = False
+        if receiver is not None:
+            receiver.mixer.metering = True
+        self._metered = receiver
+
+    def _accept(self):
+        try:
+            client, _ = self.listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        # Newest reader wins (e.g. after a renderer reload)
+        self._drop_client()
+        client.setblocking(False)
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.client = client
+
+    def _flush(self):
+        if not self.pending:
+            return True
+        try:
+            sent = self.client.send(self.pending)
+        except BlockingIOError:
+            return False
+        except OSError:
+            self._drop_client()
+            return False
+        self.pending = self.pending[sent:]
+        return not self.pending
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        due = time.perf_counter()
+        while self.running:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                # Wake early for a new client; the listener is the only fd we wait on
+                select.select([self.listener], [], [], delay)
+                if time.perf_counter() < due:
+                    self._accept()
+                    continue
+            due += period
+            if due < time.perf_counter():
+                due = time.perf_counter() + period  # Fell behind; don't try to catch up
+
+            self._accept()
+            if not self.client:
+                continue
+            if self._client_closed():
+                self._drop_client()
+                continue
+            if not self._flush():
+                self.frames_skipped += 1
+                continue
+
+            receiver = self.provider()
+            if receiver is None or not receiver.running:
+                self._set_metering(None)
+                continue
+            self._set_metering(receiver)
+            try:
+                now = time.time()
+                self.pending = pack_stats(receiver, now) + pack_levels(receiver, now)
+            except Exception as e:
+                # Streams joining/leaving mid-pack; try again next tick
+                print(f"Telemetry error: {e}")
+                continue
+            self.frames_sent += 2
+            self._flush()
+
+    def _client_closed(self):
+        # The reader has nothing to say; readable with no data means EOF
+        try:
+            readable, _, _ = select.select([self.client], [], [], 0)
+            if readable and not self.client.recv(4096):
+                return True
+        except BlockingIOError:
+            pass
+        except OSError:
+            return True
+        return False
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The receiver modules are flat (imported as `ring_buffer`, `codec`, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
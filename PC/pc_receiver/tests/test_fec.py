@@ -0,0 +1,75 @@
+import codec
+import fec
+
+
+def _group(first, n=4):
+    return [(first + k, 0, (first + k) * 20, bytes([first + k & 0xFF]) * (100 + k)) for k in range(n)]
+
+
+def _parity(packets):
+    return fec.build_parity(packets)[codec.HEADER_SIZE:]
+
+
+def _activate(decoder, first=0):
+    # Data is only remembered once the sender has been seen using FEC
+    group = _group(first)
+    decoder.on_parity(first, group[0][2], _parity(group))
+
+
+def test_single_loss_is_rebuilt_with_its_header():
+    decoder = fec.FecDecoder()
+    _activate(decoder)
+    group = _group(4)
+    lost = group[2]
+    for packet in group:
+        if packet is not lost:
+            assert decoder.on_data(*packet) == []
+    assert decoder.on_parity(4, group[0][2], _parity(group)) == [lost]
+    assert decoder.recovered == 1
+
+
+def test_parity_before_data_waits_for_the_group():
+    decoder = fec.FecDecoder()
+    _activate(decoder)
+    group = _group(4)
+    assert decoder.on_parity(4, group[0][2], _parity(group)) == []
+    decoder.on_data(*group[0])
+    decoder.on_data(*group[1])
+    assert decoder.on_data(*group[3]) == [group[2]]
+
+
+def test_two_losses_are_not_rebuilt():
+    decoder = fec.FecDecoder()
+    _activate(decoder)
+    group = _group(4)
+    decoder.on_data(*group[0])
+    decoder.on_data(*group[3])
+    assert decoder.on_parity(4, group[0][2], _parity(group)) == []
+    assert decoder.recovered == 0
+
+
+def test_late_original_after_rebuild_is_a_duplicate():
+    decoder = fec.FecDecoder()
+    _activate(decoder)
+    group = _group(4)
+    for packet in group[:3]:
+        decoder.on_data(*packet)
+    decoder.on_parity(4, group[0][2], _parity(group))
+    assert decoder.on_data(*group[3]) is None
+    assert decoder.duplicates == 1
+
+
+def test_recovery_continues_after_sequence_restart():
+    decoder = fec.FecDecoder()
+    _activate(decoder, 50000)
+    for first in range(50004, 50400, 4):
+        group = _group(first)
+        for packet in group:
+            decoder.on_data(*packet)
+        decoder.on_parity(first, group[0][2], _parity(group))
+    # Long enough after the restart for the history to be pruned
+    for first in range(0, 400, 4):
+        group = _group(first)
+        for packet in group[1:]:
+            decoder.on_data(*packet)
+        assert decoder.on_parity(first, group[0][2], _parity(group)) == [group[0]]
@@ -0,0 +1,97 @@
+import numpy as np
+
+from concealment import Concealer
+from jitter_buffer import JitterBuffer
+
+PACKET_MS = 20
+
+
+def _payload(seq):
+    # 20 ms of 48 kHz stereo Int16, every sample holding seq
+    return np.full(PACKET_MS * 48 * 2, seq, dtype=np.int16).tobytes()
+
+
+def _push(jb, seq, transit=5, **kwargs):
+    ts = seq * PACKET_MS
+    return jb.push(seq, ts, _payload(seq), arrival_ms=ts + transit, **kwargs)
+
+
+def _seq_of(payload):
+    # The last sample: a packet after a concealed one is crossfaded in
+    return int(np.frombuffer(payload, dtype=np.int16)[-1])
+
+
+def test_reordered_packets_play_in_sequence():
+    jb = JitterBuffer()
+    for seq in (0, 2, 1):
+        assert _push(jb, seq)
+    assert [_seq_of(jb.pop(now_ms=100)) for _ in range(3)] == [0, 1, 2]
+    assert jb.pop(now_ms=100) is None
+
+
+def test_holds_until_target_delay():
+    jb = JitterBuffer()  # Target starts at max_delay_ms / 2 = 50
+    _push(jb, 0)
+    assert jb.pop(now_ms=5 + 49) is None
+    assert _seq_of(jb.pop(now_ms=5 + 50)) == 0
+
+
+def test_packet_behind_playout_point_is_dropped_late():
+    jb = JitterBuffer()
+    for seq in range(3):
+        _push(jb, seq)
+    for _ in range(3):
+        jb.pop(now_ms=100)
+    assert not _push(jb, 1, transit=80)
+    assert jb.dropped_late == 1
+
+
+def test_skips_ahead_when_far_behind_schedule():
+    jb = JitterBuffer(max_delay_ms=300)
+    for seq in range(12):
+        _push(jb, seq)
+    # Ten steady transits pull the target down to min_delay_ms
+    assert jb.target_delay_ms == jb.min_delay_ms
+    assert _seq_of(jb.pop(now_ms=12 * PACKET_MS + 5)) == 1
+    assert jb.trimmed == 1
+
+
+def test_missing_packet_is_concealed_and_late_copy_dropped():
+    jb = JitterBuffer(concealer=Concealer())
+    for seq in (0, 1, 3):
+        _push(jb, seq)
+    assert _seq_of(jb.pop(now_ms=1000)) == 0
+    assert _seq_of(jb.pop(now_ms=1000)) == 1
+    concealed = jb.pop(now_ms=1000)
+    assert len(concealed) == len(_payload(2))
+    assert jb.concealed == 1
+    assert _seq_of(jb.pop(now_ms=1000)) == 3
+    assert not _push(jb, 2, transit=200)
+    assert jb.dropped_late == 1
+
+
+def test_lossless_skips_gaps_instead_of_concealing():
+    jb = JitterBuffer(concealer=Concealer(), lossless=True)
+    for seq in (0, 1, 3):
+        _push(jb, seq)
+    assert [_seq_of(jb.pop(now_ms=1000)) for _ in range(3)] == [0, 1, 3]
+    assert jb.concealed == 0
+
+
+def test_no_delay_sample_holds_instead_of_raising():
+    jb = JitterBuffer()
+    _push(jb, 0, measure=False)  # E.g. rebuilt from FEC
+    assert jb.pop(now_ms=1000) is None
+    assert jb.time_until_due(now_ms=1000) is None
+    _push(jb, 1)
+    assert _seq_of(jb.pop(now_ms=1000)) == 0
+
+
+def test_sequence_restart_starts_over():
+    jb = JitterBuffer()
+    for seq in range(5000, 5003):
+        _push(jb, seq)
+    for _ in range(3):
+        jb.pop(now_ms=5003 * PACKET_MS + 100)
+    assert _push(jb, 0, transit=5)
+    assert _seq_of(jb.pop(now_ms=100)) == 0
@@ -0,0 +1,55 @@
+import socket
+
+from ring_buffer import PacketRing, FramedReader
+
+
+def _frame(tag, i, size=100):
+    payload = bytes([tag]) * size + i.to_bytes(4, 'big')
+    return len(payload).to_bytes(4, 'big') + payload
+
+
+def _pair():
+    a, b = socket.socketpair()
+    b.setblocking(False)
+    return a, b
+
+
+def test_interleaved_partial_frames_share_the_ring():
+    # Two TCP senders and UDP traffic in one arena, every frame split so
+    # each reader is left holding a partial frame while the others read
+    ring = PacketRing(64 * 1024, max_packet=4096)
+    conns = [_pair(), _pair()]
+    readers = [FramedReader(b, chunk=4096) for _, b in conns]
+    udp_a, udp_b = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    udp_b.setblocking(False)
+    got = [[], []]
+
+    for i in range(300):
+        size = 50 + (i * 37) % 900
+        for split in (lambda f: f[:len(f) // 3], lambda f: f[len(f) // 3:]):
+            for k, (a, _) in enumerate(conns):
+                a.sendall(split(_frame(k + 1, i, size)))
+                got[k].extend(bytes(p) for p in readers[k].read(ring))
+            # A datagram lands in the region a partial frame used to occupy
+            udp_a.send(b"\xff" * 200)
+            region = ring.reserve()
+            n = udp_b.recv_into(region)
+            ring.commit(n)
+
+    for k in range(2):
+        assert got[k] == [_frame(k + 1, i, 50 + (i * 37) % 900)[4:] for i in range(300)]
+    for s in [udp_a, udp_b] + [s for pair in conns for s in pair]:
+        s.close()
+
+
+def test_payloads_stay_valid_across_reads():
+    ring = PacketRing(64 * 1024, max_packet=4096)
+    a, b = _pair()
+    reader = FramedReader(b, chunk=4096)
+    frames = []
+    for i in range(20):
+        a.sendall(_frame(7, i))
+        frames.extend(reader.read(ring))
+    assert [bytes(f) for f in frames] == [_frame(7, i)[4:] for i in range(20)]
+    a.close()
+    b.close()
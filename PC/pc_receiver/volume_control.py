@@ -1,5 +1,8 @@
 import logging
 import math
+import os
+import threading
+import time
 try:
     from comtypes import CLSCTX_ALL
     from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
@@ -8,67 +11,250 @@ except ImportError:
     # but here it's dependencies. User should ensure they are installed.
     pass
 
+try:
+    from pycaw.callbacks import AudioSessionEvents, AudioSessionNotification
+except ImportError:
+    # Older pycaw: no notifications, the cache is only dropped when a call fails
+    AudioSessionEvents = AudioSessionNotification = None
+
+
+if AudioSessionEvents:
+    class _SessionEvents(AudioSessionEvents):
+        """Forwards the cached session's notifications to the controller."""
+
+        def __init__(self, owner):
+            super().__init__()
+            self.owner = owner
+
+        def on_simple_volume_changed(self, new_volume, new_mute, event_context):
+            self.owner._reported(new_volume, bool(new_mute))
+
+        def on_state_changed(self, new_state, new_state_id):
+            if new_state == "Expired":
+                self.owner._invalidate()
+
+        def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
+            self.owner._invalidate()
+
+    class _NewSessions(AudioSessionNotification):
+        """Lets the controller find our session as soon as it is created."""
+
+        def __init__(self, owner):
+            super().__init__()
+            self.owner = owner
+
+        def on_session_created(self, new_session):
+            if self.owner._volume is None:
+                self.owner._wake.set()
+
+
 class AudioSyncVolumeControl:
     """
     Controls the application volume for AudioSync using Windows Core Audio API (pycaw).
     Target process: AudioSync.exe
+
+    The target session's ISimpleAudioVolume is looked up once and cached;
+    session notifications drop the cache when the session expires and
+    report volume/mute changes (ours or the Windows mixer's) to on_change.
+    Calls only queue the change: a worker thread applies everything queued
+    since its last pass in one Set call, so a held volume key costs one COM
+    round trip per pass instead of a session scan per key repeat.
     """
-    def __init__(self, target_process="AudioSync.exe"):
+    RESCAN_INTERVAL = 1.0  # Seconds between session lookups while none is found
+
+    def __init__(self, target_process="AudioSync.exe", on_change=None):
         self.target_process = target_process.lower()
+        self.on_change = on_change  # on_change(volume, muted), from a COM or worker thread
+        self.volume = None  # Last known state
+        self.muted = None
+
+        self._session = None
+        self._volume = None
+        self._events = None
+        self._manager = None
+        self._new_sessions = None
+        self._last_scan = 0.0
+
+        self._lock = threading.Lock()
+        self._pending_delta = 0.0
+        self._pending_toggle = False
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
 
     def change_volume(self, delta):
         """
         Adjusts the volume by delta (float, e.g. +0.05 or -0.05).
-        Clamps between 0.0 and 1.0.
+        Clamps between 0.0 and 1.0. Returns the volume it will be set to
+        (None until the session has been found); on_change confirms it.
         """
-        try:
-            sessions = AudioUtilities.GetAllSessions()
-            for session in sessions:
-                # Check if session matches process name
-                if session.Process and session.Process.name() and session.Process.name().lower() == self.target_process:
-                    volume = session._ctl.QueryInterface(ISimpleAudioVolume)
-                    current_vol = volume.GetMasterVolume()
-                    
-                    # Calculate new volume
-                    new_vol = current_vol + delta
-                    
-                    # Safe clamping
-                    if new_vol > 1.0:
-                        new_vol = 1.0
-                    elif new_vol < 0.0:
-                        new_vol = 0.0
-                    
-                    # Apply volume
-                    volume.SetMasterVolume(new_vol, None)
-                    return new_vol
-        except Exception as e:
-            # "Fail silently" regarding crashes/UI freezes
-            pass
-        return None
+        with self._lock:
+            self._pending_delta += delta
+            expected = None
+            if self.volume is not None:
+                expected = min(1.0, max(0.0, self.volume + self._pending_delta))
+        self._kick()
+        return expected
 
     def get_volume(self):
         """Returns current volume (0.0 - 1.0)"""
+        if self.volume is None:
+            self._kick()
+            return 0.0
+        return self.volume
+
+    def toggle_mute(self):
+        """Toggles mute state. Returns the expected new mute state (True/False) or None if unknown yet."""
+        with self._lock:
+            self._pending_toggle = not self._pending_toggle
+            expected = None
+            if self.muted is not None:
+                expected = self.muted != self._pending_toggle
+        self._kick()
+        return expected
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _kick(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
         try:
-            sessions = AudioUtilities.GetAllSessions()
-            for session in sessions:
-                if session.Process and session.Process.name() and session.Process.name().lower() == self.target_process:
-                    volume = session._ctl.QueryInterface(ISimpleAudioVolume)
-                    return volume.GetMasterVolume()
-        except:
+            import comtypes
+            # Multithreaded apartment: session notifications arrive on COM's own threads
+            comtypes.CoInitializeEx(comtypes.COINIT_MULTITHREADED)
+        except Exception:
             pass
-        return 0.0
+        self._watch_new_sessions()
+        retry = None  # Seconds until queued input is tried again
+        while self._running:
+            self._wake.wait(retry)
+            self._wake.clear()
+            retry = None
+            if not self._running:
+                break
+            with self._lock:
+                delta, toggle = self._pending_delta, self._pending_toggle
+                self._pending_delta, self._pending_toggle = 0.0, False
+            if not (delta or toggle) and self._volume is not None:
+                continue
+            # One retry: a cached interface may belong to a session that just went away
+            applied = False
+            for attempt in range(2):
+                if self._resolve() is None:
+                    break
+                try:
+                    self._apply(delta, toggle)
+                    applied = True
+                    break
+                except Exception:
+                    self._invalidate()
+            if not applied and (delta or toggle):
+                # No session (yet, or not rescanned this second): keep the
+                # keypresses for the next pass instead of dropping them
+                with self._lock:
+                    self._pending_delta += delta
+                    self._pending_toggle ^= toggle
+                retry = self.RESCAN_INTERVAL
+        self._invalidate()
+        if self._manager is not None:
+            try:
+                self._manager.UnregisterSessionNotification(self._new_sessions)
+            except Exception:
+                pass
+            self._manager = self._new_sessions = None
 
-    def toggle_mute(self):
-        """Toggles mute state. Returns new mute state (True/False) or None on failure."""
+    def _apply(self, delta, toggle):
+        volume = self._volume
+        current_vol = volume.GetMasterVolume()
+        current_mute = bool(volume.GetMute())
+        if delta:
+            # Safe clamping
+            new_vol = min(1.0, max(0.0, current_vol + delta))
+            volume.SetMasterVolume(new_vol, None)
+            current_vol = new_vol
+        if toggle:
+            current_mute = not current_mute
+            volume.SetMute(current_mute, None)
+        # The session event for our own change then finds nothing new
+        self._reported(current_vol, current_mute)
+
+    def _resolve(self):
+        """The cached ISimpleAudioVolume, looking the session up if needed."""
+        if self._volume is not None:
+            return self._volume
+        # Our session only exists once audio has been played; don't rescan
+        # on every key repeat until then
+        if time.monotonic() - self._last_scan < self.RESCAN_INTERVAL:
+            return None
+        self._last_scan = time.monotonic()
         try:
+            pid = os.getpid()
             sessions = AudioUtilities.GetAllSessions()
+            match = None
             for session in sessions:
-                if session.Process and session.Process.name() and session.Process.name().lower() == self.target_process:
-                    volume = session._ctl.QueryInterface(ISimpleAudioVolume)
-                    current_mute = volume.GetMute()
-                    new_mute = not current_mute
-                    volume.SetMute(new_mute, None)
-                    return new_mute
-        except:
-            pass
-        return None
+                # Prefer our own process; the name alone also matches other python.exe's
+                if session.ProcessId == pid:
+                    match = session
+                    break
+                if match is None and session.Process and session.Process.name() and session.Process.name().lower() == self.target_process:
+                    match = session
+            if match is None:
+                return None
+            volume = match._ctl.QueryInterface(ISimpleAudioVolume)
+            self._session = match
+            if AudioSessionEvents:
+                try:
+                    self._events = _SessionEvents(self)
+                    match.register_notification(self._events)
+                except Exception:
+                    self._events = None
+            self._volume = volume
+            # Through _reported, so on_change learns the starting state and
+            # the first toggle after it is seen as a change
+            self._reported(volume.GetMasterVolume(), bool(volume.GetMute()))
+            return volume
+        except Exception as e:
+            # "Fail silently" regarding crashes/UI freezes
+            logging.debug(f"Volume session lookup failed: {e}")
+            return None
+
+    def _invalidate(self):
+        session, self._session = self._session, None
+        self._volume = None
+        if session is not None and self._events is not None:
+            try:
+                session.unregister_notification()
+            except Exception:
+                pass
+        self._events = None
+        self._last_scan = 0.0
+
+    def _watch_new_sessions(self):
+        if not AudioSessionNotification:
+            return
+        try:
+            self._manager = AudioUtilities.GetAudioSessionManager()
+            self._new_sessions = _NewSessions(self)
+            self._manager.RegisterSessionNotification(self._new_sessions)
+            self._manager.GetSessionEnumerator()  # Required before notifications arrive
+        except Exception:
+            self._manager = self._new_sessions = None
+
+    def _reported(self, volume, muted):
+        changed = (volume, muted) != (self.volume, self.muted)
+        self.volume, self.muted = volume, muted
+        if changed and self.on_change:
+            try:
+                self.on_change(volume, muted)
+            except Exception:
+                pass
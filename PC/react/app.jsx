@@ -251,6 +251,7 @@ const App = () => {
             phoneName: "Phone Name",
             bluetoothName: "Bluetooth Name",
             connectedTo: "Connected to",
+            anyPairedPhone: "Any paired phone",
             estLatency: "Est. Latency",
             stats: "Stats",
             // Footer
@@ -368,6 +369,7 @@ const App = () => {
             phoneName: "اسم الهاتف",
             bluetoothName: "اسم البلوتوث",
             connectedTo: "متصل بـ",
+            anyPairedPhone: "أي هاتف مقترن",
             estLatency: "التأخير المقدر",
             stats: "الإحصائيات",
             // Footer
@@ -594,7 +596,7 @@ const App = () => {
     // Devices
     const [devices, setDevices] = useState([]);
 
-    const [selectedDevice, setSelectedDevice] = useState(-1); // -1 for default
+    const [selectedDevice, setSelectedDevice] = useState('-1'); // device id, '-1' for default
 
     // USB State
     const [usbDevices, setUsbDevices] = useState([]);
@@ -940,17 +942,26 @@ const App = () => {
                 setSystemInfo(msg.data);
                 break;
             case 'devices':
-                setDevices(msg.data || []);
+            case 'devices_changed': {
+                // [{ id, index, name, ... }]; ids stay the same across hot-plug
+                const list = msg.data || [];
+                setDevices(list);
+                setSelectedDevice(cur => (cur === '-1' || list.some(d => d.id === cur)) ? cur : '-1');
                 break;
+            }
             case 'state':
                 setServerState(msg.data); // 'running' or 'stopped'
                 setIsConnected(msg.data === 'running');
                 break;
             case 'stats':
                 setStats(msg.data);
-                // Approximate latency: queue size * ~10ms (chunk duration at 48k/1024 is ~21ms actually? 1024/48000 = 0.021s = 21ms)
-                // Adjust calculation based on chunk size. Assuming 1024 samples @ 48kHz ~ 21.3ms
-                setLatencyMs(Math.round(msg.data.queue * 21.3));
+                // Prefer the jitter buffer's own measurement when the backend reports it.
+                // Otherwise approximate: queue size * ~21.3ms (1024 samples @ 48kHz)
+                if (msg.data.buffered_ms !== undefined) {
+                    setLatencyMs(Math.round(msg.data.buffered_ms));
+                } else {
+                    setLatencyMs(Math.round(msg.data.queue * 21.3));
+                }
                 break;
             case 'bluetooth_device_name':
                 // Store phone name ONCE (static, no polling)
@@ -965,12 +976,15 @@ const App = () => {
                 }
                 break;
             case 'bluetooth_list':
-                // logic removed
-                setBluetoothDevices([]);
+                // Paired phones reported by the Bluetooth service
+                setBluetoothDevices(Array.isArray(msg.data) ? msg.data : []);
                 break;
             case 'bluetooth_status':
-                // Logic removed
-                console.log("[Bluetooth Status] Ignored (Feature Removed)", msg.data);
+                if (msg.data?.status === 'disconnected') {
+                    setBluetoothDeviceName('');
+                } else if (msg.data?.status === 'error') {
+                    console.error("[Bluetooth]", msg.data.message);
+                }
                 break;
             case 'error':
                 console.error("Python Error:", msg.data);
@@ -1095,7 +1109,7 @@ const App = () => {
             if (activeMethod === 'bluetooth') {
                 // Call Electron IPC to start Bluetooth service
                 if (window.electronAPI?.bluetoothStart) {
-                    window.electronAPI.bluetoothStart(); // Do NOT await - immediate
+                    window.electronAPI.bluetoothStart(selectedBluetoothDevice || undefined); // Do NOT await - immediate
                 }
                 // Immediately update UI
                 setConnectionState('connected');
@@ -1117,7 +1131,7 @@ const App = () => {
                     command: 'start',
                     payload: {
                         port: parseInt(port),
-                        device_index: parseInt(selectedDevice),
+                        device_id: selectedDevice === '-1' ? null : selectedDevice,
                         buffer_ms: bufferValue,
                         protocol: activeMethod === 'usb' ? 'tcp' : 'udp'
                     }
@@ -1160,7 +1174,7 @@ const App = () => {
     const handleDeviceRefresh = () => {
         setIsRefreshing(true);
         if (window.electronAPI) {
-            window.electronAPI.send('to-python', { command: 'get_devices' });
+            window.electronAPI.send('to-python', { command: 'get_devices', payload: { refresh: true } });
         }
         setTimeout(() => setIsRefreshing(false), 1000); // 1s animation
     };
@@ -1174,6 +1188,16 @@ const App = () => {
         setTimeout(() => setIsRefreshing(false), 500);
     };
 
+    // Picking a phone while the service runs connects to it; '' listens for any paired phone
+    const selectBluetoothDevice = (deviceId) => {
+        setSelectedBluetoothDevice(deviceId);
+        if (!isConnected || !window.electronAPI?.bluetoothCommand) return;
+        window.electronAPI.bluetoothCommand('select', deviceId || null);
+        if (deviceId) {
+            window.electronAPI.bluetoothCommand('connect', deviceId);
+        }
+    };
+
     const startBluetoothSvc = () => {
         if (!selectedBluetoothDevice) return;
         if (window.electronAPI) {
@@ -1276,6 +1300,31 @@ const App = () => {
         }
     }, [activeMethod]);
 
+    // While streaming (LAN/USB), buffer and output device changes are applied
+    // in place with 'reconfigure' instead of restarting the receiver
+    const appliedSettingsRef = useRef(null);
+    useEffect(() => {
+        if (!isConnected || activeMethod === 'bluetooth' || !window.electronAPI) {
+            appliedSettingsRef.current = null;
+            return;
+        }
+        const applied = appliedSettingsRef.current;
+        if (!applied) {
+            // What the receiver was started with
+            appliedSettingsRef.current = { buffer: bufferValue, device: selectedDevice };
+            return;
+        }
+        const timer = setTimeout(() => { // Coalesce slider drags
+            const payload = {};
+            if (bufferValue !== applied.buffer) payload.buffer_ms = bufferValue;
+            if (selectedDevice !== applied.device) payload.device_id = selectedDevice === '-1' ? null : selectedDevice;
+            if (Object.keys(payload).length === 0) return;
+            window.electronAPI.send('to-python', { command: 'reconfigure', payload });
+            appliedSettingsRef.current = { buffer: bufferValue, device: selectedDevice };
+        }, 300);
+        return () => clearTimeout(timer);
+    }, [isConnected, activeMethod, bufferValue, selectedDevice]);
+
     /**
      * Returns a Tailwind color class based on the buffer latency.
      */
@@ -1509,14 +1558,13 @@ const App = () => {
                                         <select
                                             value={selectedDevice}
                                             onChange={(e) => setSelectedDevice(e.target.value)}
-                                            disabled={isConnected}
+                                            disabled={isConnected && activeMethod === 'bluetooth'}
                                             className={`w-full p-3 rounded-xl border appearance-none focus:outline-none focus:ring-2 focus:ring-blue-500/50 transition-all text-sm ${language === 'ar' ? 'pl-10' : 'pr-10'} ${isDarkMode ? 'bg-zinc-800 border-zinc-700 disabled:opacity-50' : 'bg-zinc-100 border-zinc-200 disabled:opacity-50'}`}
                                         >
                                             <option value="-1">{t('defaultOutput')}</option>
-                                            {devices.map((dev) => {
-                                                const [id, ...nameParts] = dev.split(':');
-                                                return <option key={id} value={id}>{nameParts.join(':').trim()}</option>;
-                                            })}
+                                            {devices.map((dev) => (
+                                                <option key={dev.id} value={dev.id}>{dev.name}</option>
+                                            ))}
                                         </select>
                                         <ChevronRight size={14} className={`absolute top-3.5 pointer-events-none opacity-50 rotate-90 ${language === 'ar' ? 'left-3' : 'right-3'}`} />
                                     </div>
@@ -1828,6 +1876,21 @@ const App = () => {
                                             <li>{t('bluetoothStep4_Alt')}</li>
                                         </ol>
                                     </div>
+                                    {bluetoothDevices.length > 1 && (
+                                        <div className="relative">
+                                            <select
+                                                value={selectedBluetoothDevice}
+                                                onChange={(e) => selectBluetoothDevice(e.target.value)}
+                                                className={`w-full p-3 rounded-xl border appearance-none focus:outline-none focus:ring-2 focus:ring-blue-500/50 transition-all text-sm ${language === 'ar' ? 'pl-10' : 'pr-10'} ${isDarkMode ? 'bg-zinc-800 border-zinc-700' : 'bg-zinc-50 border-zinc-200'}`}
+                                            >
+                                                <option value="">{t('anyPairedPhone')}</option>
+                                                {bluetoothDevices.map(d => (
+                                                    <option key={d.id} value={d.id}>{d.name}{d.connected ? ' ●' : ''}</option>
+                                                ))}
+                                            </select>
+                                            <ChevronRight size={14} className={`absolute top-3.5 pointer-events-none opacity-50 rotate-90 ${language === 'ar' ? 'left-3' : 'right-3'}`} />
+                                        </div>
+                                    )}
                                 </div>
                             )}
 
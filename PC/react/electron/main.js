@@ -3,12 +3,85 @@ const { autoUpdater } = require('electron-updater');
 const path = require('path');
 const os = require('os');
 const { spawn, exec } = require('child_process');
+const net = require('net');
 
 let mainWindow;
 let pythonProcess;
 let bluetoothProcess = null;
 let tray = null;
 let isQuitting = false;
+let telemetrySocket = null;
+
+// Binary telemetry from the receiver (see pc_receiver/telemetry.py):
+// frames of [u32 body length][u8 type][body], little-endian.
+function decodeTelemetryFrame(type, body) {
+    if (type === 1) {
+        const stats = {
+            time: body.readDoubleLE(0),
+            received: body.readUInt32LE(8),
+            lost: body.readUInt32LE(12),
+            output_underruns: body.readUInt32LE(16),
+            buffered_ms: body.readFloatLE(20),
+            jitter_ms: body.readFloatLE(24),
+            delay_ms: body.readFloatLE(28),
+            streams: [],
+        };
+        const count = body.readUInt16LE(32);
+        for (let i = 0, o = 34; i < count; i++, o += 30) {
+            stats.streams.push({
+                key: body.readUInt16LE(o),
+                received: body.readUInt32LE(o + 2),
+                lost: body.readUInt32LE(o + 6),
+                buffered_ms: body.readFloatLE(o + 10),
+                jitter_ms: body.readFloatLE(o + 14),
+                delay_ms: body.readFloatLE(o + 18),
+                drift_ppm: body.readFloatLE(o + 22),
+                gain: body.readFloatLE(o + 26),
+            });
+        }
+        return { type: 'telemetry_stats', data: stats };
+    }
+    if (type === 2) {
+        const levels = { time: body.readDoubleLE(0), meters: [] };
+        const count = body.readUInt16LE(8);
+        for (let i = 0, o = 10; i < count; i++, o += 18) {
+            levels.meters.push({
+                key: body.readUInt16LE(o), // 0xFFFF = master
+                peak: [body.readFloatLE(o + 2), body.readFloatLE(o + 6)],
+                rms: [body.readFloatLE(o + 10), body.readFloatLE(o + 14)],
+            });
+        }
+        return { type: 'telemetry_levels', data: levels };
+    }
+    return null;
+}
+
+function connectTelemetry(port) {
+    if (telemetrySocket) {
+        telemetrySocket.destroy();
+        telemetrySocket = null;
+    }
+    if (!port) return;
+    let pending = Buffer.alloc(0);
+    const socket = net.connect(port, '127.0.0.1');
+    socket.on('data', (chunk) => {
+        pending = pending.length ? Buffer.concat([pending, chunk]) : chunk;
+        while (pending.length >= 5) {
+            const length = pending.readUInt32LE(0);
+            if (pending.length < 5 + length) break;
+            const msg = decodeTelemetryFrame(pending[4], pending.subarray(5, 5 + length));
+            pending = pending.subarray(5 + length);
+            if (msg && mainWindow && !mainWindow.isDestroyed()) {
+                mainWindow.webContents.send('from-python', msg);
+            }
+        }
+    });
+    socket.on('error', (err) => console.error('Telemetry socket error:', err.message));
+    socket.on('close', () => {
+        if (telemetrySocket === socket) telemetrySocket = null;
+    });
+    telemetrySocket = socket;
+}
 
 // Configure auto-updater
 autoUpdater.autoDownload = false; // Don't auto-download, let user decide
@@ -109,6 +182,9 @@ function createWindow() {
             if (!line.trim()) return;
             try {
                 const msg = JSON.parse(line);
+                if (msg.type === 'telemetry') {
+                    connectTelemetry(msg.data && msg.data.port);
+                }
                 if (mainWindow && !mainWindow.isDestroyed()) {
                     mainWindow.webContents.send('from-python', msg);
                 }
@@ -450,7 +526,7 @@ if (app.isPackaged) {
     bluetoothUseExe = false;
 }
 
-ipcMain.handle('bluetooth-start', async () => {
+ipcMain.handle('bluetooth-start', async (event, deviceId) => {
     // If already running, do nothing
     if (bluetoothProcess && !bluetoothProcess.killed) {
         console.log('[Bluetooth] Service already running.');
@@ -459,13 +535,16 @@ ipcMain.handle('bluetooth-start', async () => {
 
     console.log(`[Bluetooth] Launching: ${bluetoothExePath}`);
 
+    // Without --device every paired phone may connect
+    const btArgs = deviceId ? ['--device', deviceId] : [];
+
     try {
         if (bluetoothUseExe) {
-            bluetoothProcess = spawn(bluetoothExePath, [], {
+            bluetoothProcess = spawn(bluetoothExePath, btArgs, {
                 windowsHide: true
             });
         } else {
-            bluetoothProcess = spawn('python', ['-u', bluetoothExePath], {
+            bluetoothProcess = spawn('python', ['-u', bluetoothExePath, ...btArgs], {
                 windowsHide: true
             });
         }
@@ -483,37 +562,43 @@ ipcMain.handle('bluetooth-start', async () => {
             console.error('[Bluetooth] Failed to start:', err);
         });
 
-        let pendingDeviceName = null; // Store name until connection confirmed
+        let stdoutBuffer = '';
 
         bluetoothProcess.stdout.on('data', (data) => {
             const str = data.toString();
             console.log('[Bluetooth] stdout:', str);
 
-            // Parse JSON messages from Python
-            const lines = str.split('\n');
+            // Parse JSON messages from Python (a chunk may end mid-line)
+            stdoutBuffer += str;
+            const lines = stdoutBuffer.split('\n');
+            stdoutBuffer = lines.pop();
             lines.forEach(line => {
                 if (!line.trim()) return;
                 try {
                     const msg = JSON.parse(line);
-
-                    // Capture device name from "waiting" status (store but DON'T send yet)
-                    if (msg.status === 'waiting' && msg.message) {
-                        const match = msg.message.match(/Waiting for device: (.+)/);
-                        if (match && match[1]) {
-                            pendingDeviceName = match[1];
-                            console.log('[Bluetooth] Detected device:', pendingDeviceName);
-                        }
+                    if (!mainWindow || mainWindow.isDestroyed()) return;
+
+                    if (msg.status === 'devices') {
+                        // Paired phones: [{ id, name, connected, enabled }]
+                        mainWindow.webContents.send('from-python', {
+                            type: 'bluetooth_list',
+                            data: msg.devices || []
+                        });
+                        return;
                     }
 
                     // When receiver_mode is reached, phone is ACTUALLY connected - send name now
-                    if (msg.status === 'receiver_mode' && mainWindow && !mainWindow.isDestroyed()) {
-                        if (pendingDeviceName) {
-                            mainWindow.webContents.send('from-python', {
-                                type: 'bluetooth_device_name',
-                                data: pendingDeviceName
-                            });
-                        }
+                    if (msg.status === 'receiver_mode' && msg.device) {
+                        mainWindow.webContents.send('from-python', {
+                            type: 'bluetooth_device_name',
+                            data: msg.device
+                        });
                     }
+
+                    mainWindow.webContents.send('from-python', {
+                        type: 'bluetooth_status',
+                        data: msg
+                    });
                 } catch (e) {
                     // Non-JSON output, ignore
                 }
@@ -536,6 +621,15 @@ ipcMain.handle('bluetooth-start', async () => {
     }
 });
 
+// Commands for a running Bluetooth service: list, select, connect, disconnect
+ipcMain.handle('bluetooth-command', async (event, command, deviceId) => {
+    if (!bluetoothProcess || !bluetoothProcess.stdin) {
+        return { success: false, error: 'Bluetooth service not running' };
+    }
+    bluetoothProcess.stdin.write(JSON.stringify({ command, device: deviceId ?? null }) + '\n');
+    return { success: true };
+});
+
 ipcMain.handle('bluetooth-stop', async () => {
     console.log('[Bluetooth] Stop requested.');
 
@@ -18,7 +18,8 @@ contextBridge.exposeInMainWorld('electronAPI', {
     windowControl: (action) => ipcRenderer.send('window-control', action),
     adbCommand: (args) => ipcRenderer.invoke('adb-command', args),
     // Bluetooth Service
-    bluetoothStart: () => ipcRenderer.invoke('bluetooth-start'),
+    bluetoothStart: (deviceId) => ipcRenderer.invoke('bluetooth-start', deviceId),
+    bluetoothCommand: (command, deviceId) => ipcRenderer.invoke('bluetooth-command', command, deviceId),
     bluetoothStop: () => ipcRenderer.invoke('bluetooth-stop'),
     // Auto-Updater
     checkForUpdates: () => ipcRenderer.invoke('check-for-updates'),
@@ -40,6 +40,7 @@ class AudioCaptureService : Service() {
         const val EXTRA_IP = "EXTRA_IP"
         const val EXTRA_PORT = "EXTRA_PORT"
         const val EXTRA_MUTE_AUDIO = "EXTRA_MUTE_AUDIO"
+        const val EXTRA_FEC_GROUP = "EXTRA_FEC_GROUP"
         private const val CHANNEL_ID = "AudioStreamChannel"
         private const val NOTIFICATION_ID = 1
     }
@@ -49,6 +50,8 @@ class AudioCaptureService : Service() {
     private var audioRecord: AudioRecord? = null
     private var networkSender: NetworkSender? = null
     private var serviceJob: Job? = null
+    private var discoveryJob: Job? = null
+    private var receiverId: String? = null // Discovery id of the receiver we stream to, once seen
     private val serviceScope = CoroutineScope(Dispatchers.IO)
 
     // Audio Settings
@@ -62,6 +65,7 @@ class AudioCaptureService : Service() {
     private var streamingStartTime: Long = 0
     private var targetIp: String = ""
     private var targetPort: Int = 0
+    private var fecGroupSize: Int = 0
     private var audioManager: android.media.AudioManager? = null
     private var initialVolume: Int = -1
     
@@ -101,6 +105,7 @@ class AudioCaptureService : Service() {
                 
                 targetIp = ip
                 targetPort = port
+                fecGroupSize = intent.getIntExtra(EXTRA_FEC_GROUP, 0)
                 streamingStartTime = System.currentTimeMillis()
 
                 // Volume Logic
@@ -179,7 +184,7 @@ class AudioCaptureService : Service() {
 
             audioRecord?.startRecording()
             
-            networkSender = NetworkSender()
+            networkSender = NetworkSender(fecGroupSize)
             networkSender?.connect(ip, port)
 
             serviceJob = serviceScope.launch {
@@ -195,14 +200,39 @@ class AudioCaptureService : Service() {
                 }
                 Log.d("AudioCaptureService", "Capture loop ended. isActive=$isActive, state=${audioRecord?.recordingState}")
             }
+
+            if (ip != "127.0.0.1" && ip != "localhost") {
+                // Wi-Fi: follow the receiver's beacons, so roaming to a new
+                // IP doesn't end the stream
+                receiverId = null
+                discoveryJob = serviceScope.launch {
+                    ReceiverDiscovery.watch(this@AudioCaptureService) { info -> onReceiverAnnounced(info) }
+                }
+            }
         } catch (e: Exception) {
             Log.e("AudioCaptureService", "Error starting capture", e)
             stopCapture()
         }
     }
 
+    private fun onReceiverAnnounced(info: ReceiverInfo) {
+        if (receiverId == null) {
+            // Learn which receiver is ours from the address we were given
+            if (info.ip == targetIp && info.port == targetPort) receiverId = info.id
+            return
+        }
+        if (info.id == receiverId && (info.ip != targetIp || info.port != targetPort)) {
+            Log.d("AudioCaptureService", "Receiver moved to ${info.ip}:${info.port}")
+            targetIp = info.ip
+            targetPort = info.port
+            networkSender?.retarget(info.ip, info.port)
+        }
+    }
+
     private fun stopCapture() {
         serviceJob?.cancel()
+        discoveryJob?.cancel()
+        discoveryJob = null
         try {
             audioRecord?.stop()
             audioRecord?.release()
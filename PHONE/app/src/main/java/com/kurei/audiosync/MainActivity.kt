@@ -30,6 +30,9 @@ import android.media.AudioManager
 import android.content.BroadcastReceiver
 import android.content.IntentFilter
 import android.text.method.DigitsKeyListener
+import kotlinx.coroutines.CoroutineScope
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.launch
 
 class MainActivity : AppCompatActivity() {
 
@@ -77,6 +80,7 @@ class MainActivity : AppCompatActivity() {
     private val KEY_USB_MUTE = "usb_mute"
     private val KEY_SELECTED_TAB = "selected_tab"
     private val KEY_LANGUAGE = "app_language"
+    private val KEY_FEC_GROUP = "fec_group" // Wi-Fi: parity packet every N packets, 0 = off
     
     private val USB_TETHERING_IP = "127.0.0.1"
 
@@ -415,6 +419,9 @@ class MainActivity : AppCompatActivity() {
         wifiStartBtn.setOnClickListener {
             if (isStreaming) {
                 stopStreaming()
+            } else if (wifiIpInput.text.toString().isEmpty()) {
+                // No IP typed: look for a receiver on the LAN instead
+                discoverAndStart()
             } else {
                 if (validateWifiInput()) {
                     pendingStreamMode = "wifi"
@@ -425,6 +432,27 @@ class MainActivity : AppCompatActivity() {
         }
     }
     
+    private fun discoverAndStart() {
+        wifiStartBtn.isEnabled = false
+        CoroutineScope(Dispatchers.Main).launch {
+            val found = ReceiverDiscovery.probe(this@MainActivity)
+            wifiStartBtn.isEnabled = true
+            val receiver = found.firstOrNull { "udp" in it.protocols }
+            if (receiver == null) {
+                wifiIpInput.error = "No receiver found, enter IP Address"
+                return@launch
+            }
+            wifiIpInput.setText(receiver.ip)
+            wifiPortInput.setText(receiver.port.toString())
+            Toast.makeText(this@MainActivity, "Found ${receiver.name} (${receiver.ip})", Toast.LENGTH_SHORT).show()
+            if (validateWifiInput()) {
+                pendingStreamMode = "wifi"
+                saveWifiPreferences()
+                checkPermissionsAndStart()
+            }
+        }
+    }
+
     private fun validateUsbInput(): Boolean {
         val port = usbPortInput.text.toString()
         if (port.isEmpty()) {
@@ -573,6 +601,7 @@ class MainActivity : AppCompatActivity() {
             putExtra(AudioCaptureService.EXTRA_IP, ip)
             putExtra(AudioCaptureService.EXTRA_PORT, port)
             putExtra(AudioCaptureService.EXTRA_MUTE_AUDIO, shouldMute)
+            putExtra(AudioCaptureService.EXTRA_FEC_GROUP, sharedPrefs.getInt(KEY_FEC_GROUP, 0))
         }
 
         if (Build.VERSION.SDK_INT >= Build.VERSION_CODES.O) {
@@ -8,16 +8,29 @@ import java.net.DatagramSocket
 import java.net.InetAddress
 import java.nio.ByteBuffer
 
-class NetworkSender {
+/**
+ * fecGroupSize: over UDP, send an XOR parity packet after every
+ * fecGroupSize audio packets (0 = off). The receiver can then rebuild any
+ * single packet lost from a group, at the cost of 1/fecGroupSize more
+ * bandwidth and about (fecGroupSize - 1) packets of extra buffering.
+ */
+class NetworkSender(private val fecGroupSize: Int = 0) {
     private var udpSocket: DatagramSocket? = null
     private var tcpSocket: java.net.Socket? = null
     private var tcpOutputStream: java.io.OutputStream? = null
     
-    private var address: InetAddress? = null
-    private var port: Int = 0
+    @Volatile private var address: InetAddress? = null
+    @Volatile private var port: Int = 0
     private var sequenceNumber = 0
     private var isTcp = false
 
+    // Current FEC group: (seq, timestamp, payload) of each packet sent since the last parity
+    private val fecGroup = ArrayList<Triple<Int, Long, ByteArray>>()
+
+    companion object {
+        private const val FLAG_FEC = 0x02L // Top byte of the timestamp field
+    }
+
     fun connect(ip: String, port: Int) {
         try {
             this.address = InetAddress.getByName(ip)
@@ -37,6 +50,17 @@ class NetworkSender {
         }
     }
 
+    /** Point a UDP stream at the receiver's new address (after it roamed). */
+    fun retarget(ip: String, port: Int) {
+        if (isTcp) return
+        try {
+            this.address = InetAddress.getByName(ip)
+            this.port = port
+        } catch (e: Exception) {
+            Log.e("NetworkSender", "Error retargeting", e)
+        }
+    }
+
     suspend fun sendAudio(pcmData: ByteArray, length: Int) = withContext(Dispatchers.IO) {
         try {
             // Lazy Connect for TCP to avoid MainThread Network ops
@@ -61,8 +85,10 @@ class NetworkSender {
             val packetSize = headerSize + length
             val buffer = ByteBuffer.allocate(packetSize)
 
-            buffer.putInt(sequenceNumber++)
-            buffer.putLong(System.currentTimeMillis())
+            val seq = sequenceNumber++
+            val timestamp = System.currentTimeMillis()
+            buffer.putInt(seq)
+            buffer.putLong(timestamp)
             buffer.put(pcmData, 0, length)
             val data = buffer.array()
 
@@ -80,6 +106,15 @@ class NetworkSender {
                 if (udpSocket != null && address != null) {
                     val packet = DatagramPacket(data, data.size, address, port)
                     udpSocket?.send(packet)
+
+                    if (fecGroupSize >= 2) {
+                        fecGroup.add(Triple(seq, timestamp, pcmData.copyOf(length)))
+                        if (fecGroup.size >= fecGroupSize) {
+                            val parity = buildParity()
+                            fecGroup.clear()
+                            udpSocket?.send(DatagramPacket(parity, parity.size, address, port))
+                        }
+                    }
                 }
             }
 
@@ -96,6 +131,31 @@ class NetworkSender {
         }
     }
 
+    // Parity packet for fecGroup, see PC/pc_receiver/fec.py for the layout:
+    // header (first seq, first timestamp | FLAG_FEC), u8 count,
+    // count x (u16 length, u8 flags, i16 timestamp offset), XOR of the payloads
+    private fun buildParity(): ByteArray {
+        val (firstSeq, firstTs, _) = fecGroup[0]
+        val xorSize = fecGroup.maxOf { it.third.size }
+        val buffer = ByteBuffer.allocate(12 + 1 + fecGroup.size * 5 + xorSize)
+        buffer.putInt(firstSeq)
+        buffer.putLong(firstTs or (FLAG_FEC shl 56))
+        buffer.put(fecGroup.size.toByte())
+        for ((_, ts, payload) in fecGroup) {
+            buffer.putShort(payload.size.toShort())
+            buffer.put(0)
+            buffer.putShort((ts - firstTs).toInt().toShort())
+        }
+        val xor = ByteArray(xorSize)
+        for ((_, _, payload) in fecGroup) {
+            for (i in payload.indices) {
+                xor[i] = (xor[i].toInt() xor payload[i].toInt()).toByte()
+            }
+        }
+        buffer.put(xor)
+        return buffer.array()
+    }
+
     fun close() {
         try {
             udpSocket?.close()
@@ -106,6 +166,7 @@ class NetworkSender {
             tcpOutputStream = null
             
             sequenceNumber = 0
+            fecGroup.clear()
         } catch (e: Exception) {
             Log.e("NetworkSender", "Error closing", e)
         }
@@ -0,0 +1,122 @@
+package com.kurei.audiosync
+
+import android.content.Context
+import android.net.wifi.WifiManager
+import android.util.Log
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.isActive
+import kotlinx.coroutines.withContext
+import org.json.JSONObject
+import java.net.DatagramPacket
+import java.net.DatagramSocket
+import java.net.InetAddress
+import java.net.InetSocketAddress
+import java.net.SocketTimeoutException
+
+data class ReceiverInfo(
+    val id: String,
+    val name: String,
+    val ip: String,
+    val port: Int,
+    val protocols: List<String>,
+    val encrypted: Boolean
+)
+
+/**
+ * Finds PC receivers on the LAN (see PC/pc_receiver/discovery.py):
+ * probe() broadcasts a probe and collects the answers, watch() follows
+ * the receivers' beacons so a stream can move to a receiver's new IP.
+ */
+object ReceiverDiscovery {
+    const val DISCOVERY_PORT = 50006
+    private const val SERVICE = "audiosync"
+
+    suspend fun probe(context: Context, timeoutMs: Int = 700): List<ReceiverInfo> = withContext(Dispatchers.IO) {
+        val found = LinkedHashMap<String, ReceiverInfo>()
+        val lock = multicastLock(context)
+        try {
+            DatagramSocket().use { socket ->
+                socket.broadcast = true
+                val probe = JSONObject().put("type", "probe").put("service", SERVICE).toString().toByteArray()
+                socket.send(DatagramPacket(probe, probe.size, InetAddress.getByName("255.255.255.255"), DISCOVERY_PORT))
+                val deadline = System.currentTimeMillis() + timeoutMs
+                val buffer = ByteArray(1024)
+                while (true) {
+                    val left = deadline - System.currentTimeMillis()
+                    if (left <= 0) break
+                    socket.soTimeout = left.toInt()
+                    val packet = DatagramPacket(buffer, buffer.size)
+                    try {
+                        socket.receive(packet)
+                    } catch (e: SocketTimeoutException) {
+                        break
+                    }
+                    parse(packet)?.let { found[it.id] = it }
+                }
+            }
+        } catch (e: Exception) {
+            Log.e("ReceiverDiscovery", "Probe failed: ${e.message}")
+        } finally {
+            lock?.release()
+        }
+        found.values.toList()
+    }
+
+    /** Calls onAnnounce for every beacon until the calling coroutine is cancelled. */
+    suspend fun watch(context: Context, onAnnounce: (ReceiverInfo) -> Unit) = withContext(Dispatchers.IO) {
+        val lock = multicastLock(context)
+        try {
+            DatagramSocket(null).use { socket ->
+                socket.reuseAddress = true
+                socket.bind(InetSocketAddress(DISCOVERY_PORT))
+                socket.soTimeout = 1000 // Wake up now and then to notice cancellation
+                val buffer = ByteArray(1024)
+                while (isActive) {
+                    val packet = DatagramPacket(buffer, buffer.size)
+                    try {
+                        socket.receive(packet)
+                    } catch (e: SocketTimeoutException) {
+                        continue
+                    }
+                    parse(packet)?.let(onAnnounce)
+                }
+            }
+        } catch (e: Exception) {
+            Log.e("ReceiverDiscovery", "Beacon watch stopped: ${e.message}")
+        } finally {
+            lock?.release()
+        }
+    }
+
+    private fun parse(packet: DatagramPacket): ReceiverInfo? {
+        return try {
+            val json = JSONObject(String(packet.data, 0, packet.length, Charsets.UTF_8))
+            if (json.optString("type") != "announce" || json.optString("service") != SERVICE) return null
+            val protocols = json.optJSONArray("protocols")
+            ReceiverInfo(
+                id = json.getString("id"),
+                name = json.optString("name"),
+                // The sender's address is right even if the announced one isn't routable from here
+                ip = packet.address?.hostAddress ?: json.getString("ip"),
+                port = json.getInt("port"),
+                protocols = (0 until (protocols?.length() ?: 0)).map { protocols!!.getString(it) },
+                encrypted = json.optBoolean("encrypted")
+            )
+        } catch (e: Exception) {
+            null
+        }
+    }
+
+    // Many Wi-Fi drivers filter broadcasts unless an app holds this
+    private fun multicastLock(context: Context): WifiManager.MulticastLock? {
+        return try {
+            val wifi = context.applicationContext.getSystemService(Context.WIFI_SERVICE) as WifiManager
+            wifi.createMulticastLock("AudioSyncDiscovery").apply {
+                setReferenceCounted(false)
+                acquire()
+            }
+        } catch (e: Exception) {
+            null
+        }
+    }
+}